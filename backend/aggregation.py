@@ -0,0 +1,147 @@
+"""
+分组聚合
+一次分组计算所有店铺的收入、成本、利润、毛利率、行数和订单数，代替逐店铺筛选；
+订单级归约（实付合计、行数、是否含退款）在订单号的整数编码上用 bincount 计算
+"""
+from typing import Optional, Tuple, Dict
+
+import pandas as pd
+import numpy as np
+
+
+def _numeric(df: pd.DataFrame, col: Optional[str]) -> pd.Series:
+    """取数值列，列不存在时为全0"""
+    if col is None or col not in df.columns:
+        return pd.Series(0.0, index=df.index)
+    return pd.to_numeric(df[col], errors='coerce')
+
+
+def order_codes(series: pd.Series) -> Tuple[np.ndarray, int]:
+    """
+    订单号的整数编码
+
+    加载时订单号列已转为分类类型（见 encode_low_cardinality），直接取分类编码，随行筛选一起传递；
+    其他来源（分块读取、数据集）现场因子化一次
+
+    Args:
+        series: 订单号列
+
+    Returns:
+        Tuple[np.ndarray, int]: 每行的编码（缺失为-1）与编码个数
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy(), len(series.cat.categories)
+    codes, uniques = pd.factorize(series)
+    return codes, len(uniques)
+
+
+def order_reductions(codes: np.ndarray, n_orders: int, mask: Optional[np.ndarray] = None,
+                     amounts: Optional[np.ndarray] = None,
+                     refund: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """
+    订单级归约：只统计 mask 为True且订单号不缺失的行
+
+    Args:
+        codes: 每行的订单编码（order_codes 的结果）
+        n_orders: 编码个数
+        mask: 参与统计的行，默认全部
+        amounts: 每行实付金额；给出时计算 total_paid
+        refund: 每行是否退款；给出时计算 has_refund
+
+    Returns:
+        Dict[str, np.ndarray]: 以订单编码为下标的数组：lines（行数），以及 total_paid / has_refund
+    """
+    valid = codes >= 0
+    if mask is not None:
+        valid &= mask
+    selected = codes[valid]
+    result = {'lines': np.bincount(selected, minlength=n_orders)}
+    if amounts is not None:
+        result['total_paid'] = np.bincount(selected, weights=amounts[valid], minlength=n_orders)
+    if refund is not None:
+        result['has_refund'] = np.bincount(selected, weights=refund[valid], minlength=n_orders) > 0
+    return result
+
+
+def count_orders(codes: np.ndarray, n_orders: int, mask: Optional[np.ndarray] = None) -> int:
+    """mask 行中不同订单号的个数（缺失不计，与 nunique 一致）"""
+    return int(np.count_nonzero(order_reductions(codes, n_orders, mask)['lines']))
+
+
+def count_orders_by(group_codes: np.ndarray, n_groups: int, codes: np.ndarray, n_orders: int) -> np.ndarray:
+    """
+    每个分组内不同订单号的个数
+
+    Args:
+        group_codes: 每行的分组编码（缺失为-1）
+        n_groups: 分组个数
+        codes: 每行的订单编码
+        n_orders: 订单编码个数
+
+    Returns:
+        np.ndarray: 以分组编码为下标的订单数
+    """
+    valid = (group_codes >= 0) & (codes >= 0)
+    pairs = pd.unique(group_codes[valid].astype(np.int64) * max(n_orders, 1) + codes[valid])
+    return np.bincount(pairs // max(n_orders, 1), minlength=n_groups)
+
+
+def aggregate_by_shop(df: pd.DataFrame, shop_col: str, revenue_col: str, cost_col: str,
+                      margin_col: str, profit_col: Optional[str] = None,
+                      order_id_col: Optional[str] = None,
+                      margin_on_revenue_only: bool = True) -> pd.DataFrame:
+    """
+    按店铺一次性聚合
+
+    Args:
+        df: 处理后的数据
+        shop_col: 店铺列
+        revenue_col: 收入列
+        cost_col: 成本列
+        margin_col: 毛利率列
+        profit_col: 利润列；不传时利润 = round(收入 - 成本, 2)
+        order_id_col: 订单号列；不传时订单数为0
+        margin_on_revenue_only: True 时平均毛利率只统计收入>0的行，店铺总收入<=0时记为0
+
+    Returns:
+        pd.DataFrame: 以店铺为索引（按首次出现顺序），列为
+            revenue / cost / profit / avg_margin / lines / orders
+    """
+    columns = ['revenue', 'cost', 'profit', 'avg_margin', 'lines', 'orders']
+    if df.empty or shop_col not in df.columns:
+        return pd.DataFrame(columns=columns)
+
+    revenue = _numeric(df, revenue_col).fillna(0)
+    margin = _numeric(df, margin_col)
+    if margin_on_revenue_only:
+        margin = margin.fillna(0).where(revenue > 0)
+
+    work = pd.DataFrame({
+        'revenue': revenue,
+        'cost': _numeric(df, cost_col).fillna(0),
+        'margin': margin,
+    })
+    if profit_col is not None:
+        work['profit'] = _numeric(df, profit_col).fillna(0)
+    grouped = work.groupby(df[shop_col], sort=False, observed=True)
+    result = pd.DataFrame({
+        'revenue': grouped['revenue'].sum(),
+        'cost': grouped['cost'].sum(),
+        'avg_margin': grouped['margin'].mean(),
+        'lines': grouped.size(),
+    })
+
+    if profit_col is not None:
+        result['profit'] = grouped['profit'].sum()
+    else:
+        result['profit'] = (result['revenue'] - result['cost']).round(2)
+
+    if margin_on_revenue_only:
+        result['avg_margin'] = np.where(result['revenue'] > 0, result['avg_margin'], 0.0)
+
+    if order_id_col is not None and order_id_col in df.columns:
+        codes, n_orders = order_codes(df[order_id_col])
+        result['orders'] = count_orders_by(grouped.ngroup().to_numpy(), len(result), codes, n_orders)
+    else:
+        result['orders'] = 0
+    return result[columns]
@@ -0,0 +1,283 @@
+"""
+process_data 分阶段基准
+用合成数据（benchmarks/synthetic_data.py）逐阶段计时并记录内存峰值：
+编码 -> 清理 -> 匹配 -> 成本计算 -> 最终去重 -> 汇总统计 -> 店铺分析 -> 聚合立方体，
+另记录整个处理过程（编码之后）新分配内存的峰值及其相对订单表内存的倍数；
+结果与保存的基线（benchmarks/baselines.json）比较，任一阶段明显变慢或内存峰值明显增大时以非0状态退出
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_pipeline.py                         # 10k,100k,1M 与基线比较
+    python benchmarks/bench_pipeline.py --sizes 10k,100k --save # 重新保存这些规模的基线
+    python benchmarks/bench_pipeline.py --sizes 10M --no-memory # 大规模只计时
+"""
+import os
+import sys
+import io
+import gc
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+import contextlib
+from datetime import datetime
+from typing import Dict, List, Any, Tuple
+
+import pandas as pd
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from upload_processor import UploadProcessor  # noqa: E402
+from synthetic_data import generate  # noqa: E402
+
+BASELINE_PATH = os.path.join(BENCH_DIR, "baselines.json")
+DEFAULT_SIZES = "10k,100k,1M"
+REQUEST_TIMEOUT_SECONDS = 60   # nginx proxy_read_timeout
+MIN_REGRESSION_SECONDS = 0.1   # 短于此的阶段差异视为噪声
+MIN_REGRESSION_MB = 1.0        # 小于此的内存峰值差异视为噪声
+
+
+def parse_size(text: str) -> int:
+    text = text.strip().lower()
+    for suffix, factor in (('k', 1000), ('m', 1000000)):
+        if text.endswith(suffix):
+            return int(float(text[:-1]) * factor)
+    return int(text)
+
+
+def size_label(n: int) -> str:
+    if n % 1000000 == 0:
+        return f"{n // 1000000}M"
+    if n % 1000 == 0:
+        return f"{n // 1000}k"
+    return str(n)
+
+
+def make_processor(products: pd.DataFrame, orders: pd.DataFrame) -> UploadProcessor:
+    """与 load_from_files 相同的加载结果，只是数据来自内存（分类编码单独计时）"""
+    processor = UploadProcessor()
+    processor.product_df = products
+    processor.order_df = orders.copy()
+    processor.resolve_column_mapping()
+    processor.get_catalog()
+    return processor
+
+
+def stages(processor: UploadProcessor) -> List[tuple]:
+    """
+    按 process_data 的顺序列出各阶段；每个阶段接收上一阶段的输出
+
+    Returns:
+        List[tuple]: (阶段名, 函数)
+    """
+    mapping = processor.get_column_mapping()
+    return [
+        ('encode', lambda _: processor.encode_low_cardinality(processor.order_df, mapping)),
+        ('clean', lambda _: processor.clean_order_data(None)),
+        ('match', lambda cleaned: processor.match_products_with_orders(cleaned)),
+        ('costs', lambda matched: processor.calculate_costs_and_profits(matched)),
+        ('dedup', lambda processed: processor.final_dedup(processed)),
+        ('summary', lambda processed: (processor.get_summary_statistics(processed), processed)),
+        ('shops', lambda prev: (processor.analyze_by_shop(prev[1]), prev[1])),
+        ('cube', lambda prev: processor.build_cube(prev[1])),
+    ]
+
+
+def run_stages(products: pd.DataFrame, orders: pd.DataFrame,
+               measure_memory: bool) -> Tuple[Dict[str, Dict[str, float]], Dict[str, float]]:
+    """
+    依次执行各阶段
+
+    Args:
+        products: 产品信息表
+        orders: 订单表
+        measure_memory: True 时用 tracemalloc 记录每阶段的内存峰值（会拖慢计时，计时与内存分两遍跑）
+
+    Returns:
+        Tuple[Dict[str, Dict[str, float]], Dict[str, float]]:
+            阶段 -> {seconds, rows（输出行数）} 或 {peak_mb}；
+            以及整个处理的内存概况 {input_mb（编码后订单表，含字符串）, pipeline_peak_mb, peak_ratio}（仅 measure_memory）
+    """
+    processor = make_processor(products, orders)
+    results = {}
+    memory = {}
+    value = None
+    pipeline_peak = 0
+    gc.collect()
+    if measure_memory:
+        tracemalloc.start()
+    try:
+        for name, fn in stages(processor):
+            if measure_memory:
+                tracemalloc.reset_peak()
+                base = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                value = fn(value)
+            elapsed = time.perf_counter() - start
+            if measure_memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                results[name] = {'peak_mb': round((peak - base) / 1024 / 1024, 2)}
+                if name == 'encode':
+                    # 编码发生在加载时；之后的新分配都算作处理过程的内存
+                    input_bytes = processor.order_df.memory_usage(deep=True).sum()
+                    pipeline_base = tracemalloc.get_traced_memory()[0]
+                else:
+                    pipeline_peak = max(pipeline_peak, peak - pipeline_base)
+            else:
+                results[name] = {'seconds': round(elapsed, 4)}
+                output = value[1] if isinstance(value, tuple) else value
+                if isinstance(output, pd.DataFrame):
+                    results[name]['rows'] = len(output)
+    finally:
+        if measure_memory:
+            tracemalloc.stop()
+    if measure_memory:
+        memory = {
+            'input_mb': round(input_bytes / 1024 / 1024, 2),
+            'pipeline_peak_mb': round(pipeline_peak / 1024 / 1024, 2),
+            # 处理期间的总内存约为 输入 + 新分配峰值，以输入的倍数表示
+            'peak_ratio': round(1 + pipeline_peak / input_bytes, 2)
+        }
+    return results, memory
+
+
+def bench_size(lines: int, repeat: int, measure_memory: bool, seed: int = 0) -> Dict[str, Any]:
+    """单个规模：生成数据，计时取 repeat 次中的最小值，另跑一遍记录内存峰值"""
+    start = time.perf_counter()
+    products, orders = generate(lines, seed)
+    gen_seconds = time.perf_counter() - start
+
+    timings: Dict[str, List[float]] = {}
+    rows: Dict[str, int] = {}
+    for _ in range(repeat):
+        for name, r in run_stages(products, orders, measure_memory=False)[0].items():
+            timings.setdefault(name, []).append(r['seconds'])
+            if 'rows' in r:
+                rows[name] = r['rows']
+    result = {name: {'seconds': min(values)} for name, values in timings.items()}
+    for name, n in rows.items():
+        result[name]['rows'] = n
+
+    memory = {}
+    if measure_memory:
+        stage_memory, memory = run_stages(products, orders, measure_memory=True)
+        for name, r in stage_memory.items():
+            result[name]['peak_mb'] = r['peak_mb']
+
+    total = round(sum(r['seconds'] for r in result.values()), 4)
+    return {
+        'lines': lines,
+        'products': len(products),
+        'generate_seconds': round(gen_seconds, 2),
+        'stages': result,
+        'total_seconds': total,
+        'memory': memory
+    }
+
+
+def machine_info() -> Dict[str, Any]:
+    return {
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'recorded': datetime.now().isoformat(timespec='seconds')
+    }
+
+
+def load_baselines(path: str) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {'machine': {}, 'results': {}}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    与基线比较
+
+    Returns:
+        List[str]: 变慢超过 threshold 倍（且差值超过 MIN_REGRESSION_SECONDS）的阶段说明
+    """
+    regressions = []
+    for name, current in result['stages'].items():
+        base = baseline.get('stages', {}).get(name)
+        if not base:
+            continue
+        ratio = current['seconds'] / base['seconds'] if base['seconds'] else float('inf')
+        current['vs_baseline'] = round(ratio, 2)
+        if ratio > threshold and current['seconds'] - base['seconds'] > MIN_REGRESSION_SECONDS:
+            regressions.append(f"{size_label(result['lines'])} {name}: {base['seconds']:.3f}s -> {current['seconds']:.3f}s ({ratio:.2f}x)")
+        if 'peak_mb' in current and base.get('peak_mb'):
+            current['peak_vs_baseline'] = round(current['peak_mb'] / base['peak_mb'], 2)
+
+    current_peak = result.get('memory', {}).get('pipeline_peak_mb')
+    base_peak = baseline.get('memory', {}).get('pipeline_peak_mb')
+    if current_peak is not None and base_peak:
+        ratio = current_peak / base_peak
+        result['memory']['vs_baseline'] = round(ratio, 2)
+        if ratio > threshold and current_peak - base_peak > MIN_REGRESSION_MB:
+            regressions.append(f"{size_label(result['lines'])} 内存峰值: {base_peak:.1f}MB -> {current_peak:.1f}MB ({ratio:.2f}x)")
+    return regressions
+
+
+def print_result(result: Dict[str, Any]):
+    label = size_label(result['lines'])
+    print(f"\n== {label} 行（产品表 {result['products']} 行，生成数据 {result['generate_seconds']}s）")
+    print(f"{'阶段':<10}{'耗时(s)':>10}{'峰值(MB)':>10}{'输出行数':>12}{'对比基线':>10}")
+    for name, r in result['stages'].items():
+        peak = f"{r['peak_mb']:.1f}" if 'peak_mb' in r else '-'
+        ratio = f"{r['vs_baseline']:.2f}x" if 'vs_baseline' in r else '-'
+        print(f"{name:<10}{r['seconds']:>10.3f}{peak:>10}{r.get('rows', '-'):>12}{ratio:>10}")
+    flag = "  ⚠️ 超过请求超时" if result['total_seconds'] > REQUEST_TIMEOUT_SECONDS else ""
+    print(f"{'合计':<10}{result['total_seconds']:>10.3f}{flag}")
+    memory = result.get('memory')
+    if memory:
+        ratio = f"，对比基线 {memory['vs_baseline']:.2f}x" if 'vs_baseline' in memory else ""
+        print(f"内存: 订单表 {memory['input_mb']:.1f}MB，处理期间新分配峰值 {memory['pipeline_peak_mb']:.1f}MB，"
+              f"合计约为输入的 {memory['peak_ratio']:.2f} 倍{ratio}")
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="process_data 分阶段基准")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help="行数列表，如 10k,100k,1M,10M")
+    parser.add_argument('--repeat', type=int, default=3, help="计时重复次数（取最小值）")
+    parser.add_argument('--no-memory', action='store_true', help="不记录内存峰值")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="基线文件")
+    parser.add_argument('--save', action='store_true', help="把本次结果写入基线")
+    parser.add_argument('--threshold', type=float, default=1.5, help="变慢多少倍视为回退（共享机器上计时波动可达30%%）")
+    args = parser.parse_args(argv)
+
+    baselines = load_baselines(args.baseline)
+    regressions = []
+    for lines in [parse_size(s) for s in args.sizes.split(',') if s.strip()]:
+        result = bench_size(lines, max(1, args.repeat), measure_memory=not args.no_memory)
+        baseline = baselines['results'].get(size_label(lines))
+        if baseline and not args.save:
+            regressions += compare(result, baseline, args.threshold)
+        print_result(result)
+        if args.save:
+            baselines['results'][size_label(lines)] = result
+
+    if args.save:
+        baselines['machine'] = machine_info()
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baselines, f, ensure_ascii=False, indent=2)
+        print(f"\n基线已保存: {args.baseline}")
+        return 0
+
+    if regressions:
+        print("\n性能回退:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+序列化基准：10万行处理结果转为JSON响应
+对比 旧路径（astype(object).fillna + 逐单元格 pd.isna + 标准库json）与 按列清理 + orjson
+
+用法（在 backend 目录下）: python benchmarks/bench_serialization.py [行数]
+"""
+import os
+import sys
+import json
+import time
+import warnings
+
+import pandas as pd
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serialization import frame_records, dumps  # noqa: E402
+
+
+def synthetic_result(rows: int, seed: int = 0) -> pd.DataFrame:
+    """构造与处理结果结构相近的数据：分类店铺列、字符串编码、含缺失值和inf的数值列"""
+    rng = np.random.default_rng(seed)
+    shops = [f"[淘宝]店铺{i}" for i in range(40)]
+    revenue = rng.gamma(2.0, 80.0, rows).round(2)
+    cost = (revenue * rng.uniform(0.3, 0.9, rows)).round(2)
+    cost[rng.random(rows) < 0.05] = np.nan
+    margin = (revenue - cost) / revenue
+    margin[rng.random(rows) < 0.01] = np.inf
+    return pd.DataFrame({
+        '店铺名称': pd.Categorical(rng.choice(shops, rows)),
+        '订单号': rng.integers(10 ** 17, 10 ** 18, rows).astype(str),
+        '商品编码': np.char.add('b', rng.integers(100, 9999, rows).astype(str)),
+        '规格名称': np.where(rng.random(rows) < 0.2, None, '标准款'),
+        '数量': rng.integers(1, 5, rows),
+        '销售收入': revenue,
+        '总成本': cost,
+        '毛利率': margin,
+    })
+
+
+def old_path(df: pd.DataFrame) -> bytes:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", FutureWarning)
+        records = df.astype(object).fillna(0).to_dict('records')
+    for record in records:
+        for key, value in record.items():
+            if pd.isna(value):
+                record[key] = None
+            elif isinstance(value, float) and not np.isfinite(value):
+                record[key] = None  # 旧路径遇到inf会直接序列化失败，这里按同样语义置空以便对比耗时
+    return json.dumps(records, ensure_ascii=False).encode('utf-8')
+
+
+def new_path(df: pd.DataFrame) -> bytes:
+    return dumps(frame_records(df, na_value=0))
+
+
+def best_of(fn, df, repeat: int = 3) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(df)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    df = synthetic_result(rows)
+    old = best_of(old_path, df)
+    new = best_of(new_path, df)
+    print(f"行数: {rows}")
+    print(f"旧路径: {old * 1000:.1f} ms")
+    print(f"新路径: {new * 1000:.1f} ms")
+    print(f"节省: {(old - new) * 1000:.1f} ms ({old / new:.1f}x)")
@@ -0,0 +1,158 @@
+"""
+基准测试用的合成数据
+按真实订单表/产品信息表的列结构生成数据：一个订单多行明细、0元赠品行、退款/关闭/线下订单状态、
+空单标记、完全重复行、产品表里找不到的编码、产品表同一编码多条记录
+
+用法（在 backend 目录下）: python benchmarks/synthetic_data.py 行数 [输出目录]
+"""
+import os
+import sys
+from typing import Tuple
+
+import pandas as pd
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exporters import write_xlsx  # noqa: E402
+
+EXCEL_MAX_ROWS = 1048575  # 不含表头
+
+SHOPS = [f"[{platform}]{name}" for platform in ('淘宝', '天猫', '京东', '拼多多')
+         for name in ('中国飞鸽童车企业店', '恒通童车4S店', '永久紫榕专卖店', 'seajoy旗舰店', '小土豆母婴',
+                      '卡皮巴拉童车', '飞鸽官方店', '紫榕童车工厂店', '小童车集合店', '儿童自行车批发')]
+ORDER_STATUSES = ['已发货', '待发货', '关闭', '[线下订单]', '退款成功']
+ORDER_STATUS_P = [0.42, 0.30, 0.14, 0.10, 0.04]
+LINE_STATUSES = ['已发货', '待发货', '关闭', '退款中']
+SIZES = ['12寸', '14寸', '16寸', '18寸', '20寸']
+SPECS = ['标准款', '粉色+车筐', '绿色+后座+礼包', '蓝色+闪光轮', '黑胎+护具']
+
+
+def generate_products(n_skus: int, seed: int = 0) -> pd.DataFrame:
+    """
+    产品信息表：尺寸、商家编码、商品成本（与真实文件一样为文本）；约10%的编码有多条记录
+
+    Args:
+        n_skus: 不同商家编码的个数
+        seed: 随机种子
+
+    Returns:
+        pd.DataFrame: 产品信息表
+    """
+    rng = np.random.default_rng(seed)
+    codes = np.char.add('b', np.char.zfill(np.arange(n_skus).astype(str), 5))
+    extra = rng.choice(n_skus, n_skus // 10)
+    all_codes = np.concatenate([codes, codes[extra]])
+    cost = rng.gamma(3.0, 40.0, len(all_codes)).round(2)
+    return pd.DataFrame({
+        '尺寸': rng.choice(SIZES, len(all_codes)),
+        '商家编码': all_codes,
+        '商品成本': cost.astype(str).astype(object),
+    })
+
+
+def generate_orders(lines: int, n_skus: int, seed: int = 0,
+                    duplicate_rate: float = 0.01, gift_rate: float = 0.13,
+                    unmatched_rate: float = 0.03) -> pd.DataFrame:
+    """
+    订单表（明细行）
+
+    Args:
+        lines: 行数（含重复行）
+        n_skus: 产品表中的编码个数，编码从中抽取
+        seed: 随机种子
+        duplicate_rate: 完全重复行的比例
+        gift_rate: 0元赠品/返现行的比例
+        unmatched_rate: 产品表中不存在的编码比例
+
+    Returns:
+        pd.DataFrame: 订单表
+    """
+    rng = np.random.default_rng(seed)
+    unique_lines = lines - int(lines * duplicate_rate)
+
+    # 每个订单1~4行明细，平均约1.4行
+    per_order = rng.choice([1, 2, 3, 4], size=unique_lines, p=[0.65, 0.27, 0.06, 0.02])
+    order_of_line = np.repeat(np.arange(len(per_order)), per_order)[:unique_lines]
+    n_orders = int(order_of_line[-1]) + 1
+
+    order_ids = (2940000000000000000 + rng.choice(10 ** 12, n_orders, replace=False)).astype(str)
+    order_shop = rng.integers(0, len(SHOPS), n_orders)
+    order_status = rng.choice(len(ORDER_STATUSES), n_orders, p=ORDER_STATUS_P)
+    order_mark = np.where(rng.random(n_orders) < 0.025, '空单',
+                          np.where(rng.random(n_orders) < 0.005, '不发货', None))
+
+    sku_codes = rng.integers(0, n_skus, unique_lines)
+    skus = np.char.add('b', np.char.zfill(sku_codes.astype(str), 5)).astype(object)
+    unmatched = rng.random(unique_lines) < unmatched_rate
+    skus[unmatched] = np.char.add('x', rng.integers(0, 10 ** 6, int(unmatched.sum())).astype(str))
+
+    amount = rng.gamma(2.0, 90.0, unique_lines).round(2)
+    amount[rng.random(unique_lines) < gift_rate] = 0.0
+
+    status = np.asarray(ORDER_STATUSES, dtype=object)[order_status[order_of_line]]
+    line_status = status.copy()
+    refund = rng.random(unique_lines) < 0.03
+    line_status[refund] = '退款中'
+    line_status[line_status == '[线下订单]'] = '已发货'
+
+    df = pd.DataFrame({
+        '店铺名称': np.asarray(SHOPS, dtype=object)[order_shop[order_of_line]],
+        '订单号': order_ids[order_of_line].astype(object),
+        '订单标记': order_mark[order_of_line],
+        '买家实付': amount,
+        '仓库名称': np.where(rng.random(unique_lines) < 0.14, '配件专用仓', '默认仓库').astype(object),
+        '线上备注': np.where(rng.random(unique_lines) < 0.05, '极速退款已拦截', None),
+        '线上订单状态': status,
+        '明细状态': line_status,
+        '商品编码': skus,
+        '商品名称': np.char.add('儿童自行车', (sku_codes % 200).astype(str)).astype(object),
+        '规格名称': np.asarray(SPECS, dtype=object)[rng.integers(0, len(SPECS), unique_lines)],
+        '【线上】商品编码': skus.copy(),
+        '运费': np.where(rng.random(unique_lines) < 0.1, 10.0, 0.0),
+        '买家ID(客户昵称)': np.char.add('t**;', rng.integers(0, 10 ** 9, n_orders).astype(str))[order_of_line].astype(object),
+    })
+
+    # 完全重复行（导出重复、同一批次上传两次）随机插入
+    duplicates = df.iloc[rng.integers(0, unique_lines, lines - unique_lines)]
+    df = pd.concat([df, duplicates], ignore_index=True)
+    return df.iloc[rng.permutation(len(df))].reset_index(drop=True)
+
+
+def generate(lines: int, seed: int = 0) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    生成一组 (产品信息表, 订单表)；编码个数随行数增长（约每50行一个，2000~50000）
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame]: 产品信息表, 订单表
+    """
+    n_skus = int(min(max(lines // 50, 2000), 50000))
+    return generate_products(n_skus, seed), generate_orders(lines, n_skus, seed)
+
+
+def write_workbooks(lines: int, out_dir: str, seed: int = 0) -> Tuple[str, str]:
+    """
+    生成并写出Excel工作簿（可用于上传接口的端到端测试）
+
+    Returns:
+        Tuple[str, str]: 产品信息表路径, 订单表路径
+
+    Raises:
+        ValueError: 行数超过Excel单表上限
+    """
+    if lines > EXCEL_MAX_ROWS:
+        raise ValueError(f"Excel单表最多 {EXCEL_MAX_ROWS} 行，{lines} 行只能在内存中生成")
+    products, orders = generate(lines, seed)
+    os.makedirs(out_dir, exist_ok=True)
+    product_path = os.path.join(out_dir, f"产品信息表_{lines}.xlsx")
+    order_path = os.path.join(out_dir, f"订单_{lines}.xlsx")
+    write_xlsx(product_path, {'Sheet1': products})
+    write_xlsx(order_path, {'Sheet1': orders})
+    return product_path, order_path
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    out = sys.argv[2] if len(sys.argv) > 2 else "bench_data"
+    paths = write_workbooks(n, out)
+    print("\n".join(paths))
@@ -0,0 +1,253 @@
+"""
+产品目录索引
+把产品信息表持久化为带版本的 编码 -> 产品行 索引，订单匹配时按编码向量化查表，无需合并
+"""
+import os
+import json
+import pickle
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+
+import pandas as pd
+import numpy as np
+
+from column_mapping import find_columns, PRODUCT_SKU_KEYWORDS
+
+CATALOG_DIR = "catalog"
+MAX_CATALOG_VERSIONS = 5
+
+
+def normalize_keys(series: pd.Series) -> pd.Series:
+    """
+    编码归一化：转字符串 + 去空格，结果与 series.astype(str).str.strip() 相同
+
+    分类列只对每个类别归一化一次，再按编码取值，各行共享同一批字符串对象，不为每行新建字符串
+
+    Args:
+        series: 编码列
+
+    Returns:
+        pd.Series: object 类型的归一化编码
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = series.cat.categories.astype(str).str.strip()
+        # 末尾追加缺失值的字符串形式，编码 -1 正好取到它
+        lookup = np.append(np.asarray(categories, dtype=object), 'nan')
+        return pd.Series(lookup[series.cat.codes.to_numpy()], index=series.index, name=series.name)
+    return series.astype(str).str.strip()
+
+
+class CatalogIndex:
+    """
+    产品目录索引
+
+    每个候选编码列保存一份字典编码：categories 为归一化（转字符串 + 去空格）后的唯一编码，
+    codes 为每行对应的编码序号；同一编码多行时取第一行，与 drop_duplicates(keep='first') 一致。
+
+    Attributes:
+        frame: 产品信息表（已去除重复标题行）
+        version: 目录版本号
+        content_hash: 来源文件内容哈希
+        source: 来源文件名
+    """
+
+    def __init__(self, frame: pd.DataFrame, version: int = 0, content_hash: str = "", source: str = ""):
+        self.frame = frame.reset_index(drop=True)
+        self.version = version
+        self.content_hash = content_hash
+        self.source = source
+        self._keys: Dict[str, pd.Categorical] = {}
+        self._first_rows: Dict[str, np.ndarray] = {}
+        for col in find_columns(self.frame.columns, PRODUCT_SKU_KEYWORDS):
+            self.key_index(col)
+
+    def key_index(self, col: str) -> pd.Categorical:
+        """获取某列的字典编码，首次访问时构建"""
+        keys = self._keys.get(col)
+        if keys is None:
+            keys = pd.Categorical(normalize_keys(self.frame[col]))
+            _, first = np.unique(keys.codes, return_index=True)
+            self._keys[col] = keys
+            self._first_rows[col] = first
+        return keys
+
+    def unique_keys(self, col: str) -> pd.Index:
+        """某列归一化后的唯一编码"""
+        return self.key_index(col).categories
+
+    def lookup(self, order_df: pd.DataFrame, order_col: str, product_col: str,
+               suffixes: Tuple[str, str] = ('_order', '_product')) -> pd.DataFrame:
+        """
+        按编码查表，结果与
+        order_df.merge(product_df.drop_duplicates(subset=[product_col]), left_on=order_col,
+        right_on=product_col, how='left', suffixes=suffixes) 相同（编码均已归一化）
+
+        Args:
+            order_df: 订单数据
+            order_col: 订单表编码列
+            product_col: 产品表编码列
+            suffixes: 同名列后缀
+
+        Returns:
+            pd.DataFrame: 匹配后的数据
+        """
+        keys = self.key_index(product_col)
+        first_rows = self._first_rows[product_col]
+
+        # 浅拷贝后只在拷贝上换索引、换列名、整列替换，不改动传入的订单数据（reset_index/rename 会拷贝整表）
+        left = order_df.copy(deep=False)
+        left.index = pd.RangeIndex(len(left))
+        order_keys = normalize_keys(left[order_col])
+        codes = keys.categories.get_indexer(order_keys)
+        hit = codes >= 0
+        safe_codes = np.where(hit, codes, 0)
+
+        right = self.frame.take(first_rows[safe_codes])
+        right.index = left.index
+        right[product_col] = np.asarray(keys.categories, dtype=object)[safe_codes]
+        if not hit.all():
+            right = right.where(np.broadcast_to(hit[:, None], right.shape))
+
+        left[order_col] = order_keys
+        if order_col == product_col:
+            right = right.drop(columns=[product_col])
+
+        overlap = set(left.columns) & set(right.columns)
+        if overlap:
+            left.columns = [f"{c}{suffixes[0]}" if c in overlap else c for c in left.columns]
+            right.columns = [f"{c}{suffixes[1]}" if c in overlap else c for c in right.columns]
+        return pd.concat([left, right], axis=1)
+
+    def info(self) -> Dict[str, Any]:
+        """目录概要"""
+        return {
+            "version": self.version,
+            "content_hash": self.content_hash,
+            "source": self.source,
+            "rows": int(len(self.frame)),
+            "key_columns": {col: int(len(keys.categories)) for col, keys in self._keys.items()}
+        }
+
+
+class CatalogStore:
+    """
+    产品目录的持久化存储
+
+    每次上传内容不同的产品表生成一个新版本，manifest.json 记录版本列表；
+    内容相同（哈希一致）时直接复用最新版本，只保留最近 MAX_CATALOG_VERSIONS 个版本。
+    """
+
+    def __init__(self, root: str = CATALOG_DIR):
+        self.root = root
+        self._latest: Optional[CatalogIndex] = None
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.root, "manifest.json")
+
+    def _read_manifest(self) -> List[Dict[str, Any]]:
+        if not os.path.exists(self.manifest_path):
+            return []
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f).get("versions", [])
+
+    def _write_manifest(self, versions: List[Dict[str, Any]]):
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"versions": versions}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.manifest_path)
+
+    def versions(self) -> List[Dict[str, Any]]:
+        """所有已保存的版本信息"""
+        return self._read_manifest()
+
+    def find(self, content_hash: str) -> Optional[CatalogIndex]:
+        """按内容哈希查找最新版本，不一致时返回None"""
+        versions = self._read_manifest()
+        if versions and versions[-1]["content_hash"] == content_hash:
+            return self.latest()
+        return None
+
+    def get(self, content_hash: str) -> Optional[CatalogIndex]:
+        """按内容哈希加载任一已保存的版本（不限最新），不存在时返回None"""
+        for entry in reversed(self._read_manifest()):
+            if entry["content_hash"] != content_hash:
+                continue
+            if self._latest is not None and self._latest.version == entry["version"]:
+                return self._latest
+            try:
+                with open(os.path.join(self.root, entry["file"]), "rb") as f:
+                    return pickle.load(f)
+            except Exception as e:
+                print(f"产品目录加载失败: {e}")
+                return None
+        return None
+
+    def latest(self) -> Optional[CatalogIndex]:
+        """加载最新版本的目录"""
+        versions = self._read_manifest()
+        if not versions:
+            return None
+        entry = versions[-1]
+        if self._latest is not None and self._latest.version == entry["version"]:
+            return self._latest
+        try:
+            with open(os.path.join(self.root, entry["file"]), "rb") as f:
+                catalog = pickle.load(f)
+        except Exception as e:
+            print(f"产品目录加载失败: {e}")
+            return None
+        self._latest = catalog
+        return catalog
+
+    def publish(self, frame: pd.DataFrame, content_hash: str, source: str = "") -> CatalogIndex:
+        """
+        保存新版本目录；内容与最新版本一致时直接复用
+
+        Args:
+            frame: 产品信息表
+            content_hash: 来源文件内容哈希
+            source: 来源文件名
+
+        Returns:
+            CatalogIndex: 目录索引
+        """
+        existing = self.find(content_hash)
+        if existing is not None:
+            return existing
+
+        os.makedirs(self.root, exist_ok=True)
+        versions = self._read_manifest()
+        version = versions[-1]["version"] + 1 if versions else 1
+        catalog = CatalogIndex(frame, version=version, content_hash=content_hash, source=source)
+
+        filename = f"catalog_v{version}_{content_hash[:12]}.pkl"
+        tmp = os.path.join(self.root, filename + ".tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump(catalog, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, os.path.join(self.root, filename))
+
+        versions.append({
+            "version": version,
+            "content_hash": content_hash,
+            "source": source,
+            "file": filename,
+            "rows": int(len(catalog.frame)),
+            "created_at": datetime.now().isoformat()
+        })
+        # 只保留最近几个版本
+        for old in versions[:-MAX_CATALOG_VERSIONS]:
+            try:
+                os.remove(os.path.join(self.root, old["file"]))
+            except OSError:
+                pass
+        versions = versions[-MAX_CATALOG_VERSIONS:]
+        self._write_manifest(versions)
+
+        self._latest = catalog
+        print(f"产品目录已更新: v{version} ({len(catalog.frame)} 条记录)")
+        return catalog
+
+
+# 全局目录存储
+catalog_store = CatalogStore()
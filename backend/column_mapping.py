@@ -0,0 +1,164 @@
+"""
+订单表/产品表的列映射
+上传后按关键词解析一次，后续清理、匹配、成本计算、统计各环节共用同一份结果
+"""
+from dataclasses import dataclass, field, asdict, fields
+from typing import Dict, List, Any, Optional, Iterable
+
+# 订单表单列字段 -> 关键词（按顺序取第一个命中的列）
+ORDER_FIELD_KEYWORDS = {
+    'order_id': ['订单号', '订单编号', 'order'],
+    'shop': ['店铺', 'shop'],
+    'amount': ['买家实付', '实付', '金额', '付款'],
+    'mark': ['订单标记', '标记', 'mark'],
+    'sku': ['商品编码', '商家编码', 'sku', '货号'],
+    'spec': ['规格', 'spec', '型号'],
+    'date': ['付款时间', '支付时间', '下单时间', '创建时间', '成交时间', '日期', 'date'],
+}
+STATUS_KEYWORDS = ['状态', 'status']
+
+# 匹配用的候选编码列
+ORDER_SKU_KEYWORDS = ['商品编码', 'sku', '编号', '商家编码', '货号', 'code']
+PRODUCT_SKU_KEYWORDS = ['商家编码', 'sku', '编号', '商品编码', '货号', 'code']
+
+# 成本计算用：在合并后的列（订单列在前、产品列在后）中查找
+QUANTITY_KEYWORDS = ['数量', '件数', 'qty', 'num', '购买数量', '下单数量', '宝贝总数量']
+REVENUE_KEYWORDS = ['买家实付', '实付', '付款', '应付', '支付', '金额', '收款', '成交价', '支付金额']
+COST_KEYWORDS = ['成本', '进货', '采购', 'cost']
+
+ORDER_SIDE_FIELDS = ['order_id', 'shop', 'amount', 'mark', 'sku', 'spec', 'date', 'status', 'order_sku_candidates']
+PRODUCT_SIDE_FIELDS = ['product_sku_candidates', 'product_cost']
+MERGED_FIELDS = ['quantity', 'revenue']
+
+
+def find_columns(columns: Iterable, keywords: List[str]) -> List[str]:
+    """返回列名（小写）包含任一关键词的所有列，保持原顺序"""
+    return [c for c in columns if any(k in str(c).lower() for k in keywords)]
+
+
+def find_column(columns: Iterable, keywords: List[str]) -> Optional[str]:
+    """返回第一个命中关键词的列，没有则为None"""
+    found = find_columns(columns, keywords)
+    return found[0] if found else None
+
+
+@dataclass
+class ColumnMapping:
+    """
+    已解析的列映射
+
+    订单侧字段对应订单表原始列名，产品侧字段对应产品表原始列名；
+    quantity / revenue 在“订单列 + 产品列”中查找，和合并后的表保持一致。
+    合并时同名列会带上 _order / _product 后缀，用 merged_name() 换算。
+
+    Attributes:
+        overrides: 用户手动指定过的字段名
+    """
+    order_id: Optional[str] = None
+    shop: Optional[str] = None
+    amount: Optional[str] = None
+    mark: Optional[str] = None
+    sku: Optional[str] = None
+    spec: Optional[str] = None
+    date: Optional[str] = None
+    status: List[str] = field(default_factory=list)
+    order_sku_candidates: List[str] = field(default_factory=list)
+    product_sku_candidates: List[str] = field(default_factory=list)
+    product_cost: Optional[str] = None
+    quantity: Optional[str] = None
+    revenue: Optional[str] = None
+    order_columns: List[str] = field(default_factory=list)
+    product_columns: List[str] = field(default_factory=list)
+    overrides: List[str] = field(default_factory=list)
+
+    @classmethod
+    def resolve(cls, order_columns: Iterable = (), product_columns: Iterable = ()) -> "ColumnMapping":
+        """
+        按关键词解析列映射
+
+        Args:
+            order_columns: 订单表列名
+            product_columns: 产品表列名
+
+        Returns:
+            ColumnMapping: 解析结果
+        """
+        order_columns = list(order_columns)
+        product_columns = list(product_columns)
+        mapping = cls(order_columns=order_columns, product_columns=product_columns)
+
+        for name, keywords in ORDER_FIELD_KEYWORDS.items():
+            setattr(mapping, name, find_column(order_columns, keywords))
+        mapping.status = find_columns(order_columns, STATUS_KEYWORDS)
+        mapping.order_sku_candidates = find_columns(order_columns, ORDER_SKU_KEYWORDS)
+        mapping.product_sku_candidates = find_columns(product_columns, PRODUCT_SKU_KEYWORDS)
+
+        # 成本只从产品表取；与订单表同名（合并后带 _product 后缀）的优先
+        cost_cols = find_columns(product_columns, COST_KEYWORDS)
+        clashing = [c for c in cost_cols if c in order_columns]
+        mapping.product_cost = (clashing or cost_cols or [None])[0]
+
+        merged_columns = order_columns + [c for c in product_columns if c not in order_columns]
+        mapping.quantity = find_column(merged_columns, QUANTITY_KEYWORDS)
+        mapping.revenue = find_column(merged_columns, REVENUE_KEYWORDS)
+        return mapping
+
+    def with_overrides(self, overrides: Dict[str, Any]) -> "ColumnMapping":
+        """
+        应用用户指定的列，返回新的映射
+
+        Args:
+            overrides: 字段名 -> 列名（status 等列表字段传列表）
+
+        Returns:
+            ColumnMapping: 新映射
+
+        Raises:
+            ValueError: 字段名未知或列不存在
+        """
+        data = asdict(self)
+        applied = list(self.overrides)
+        for name, value in overrides.items():
+            if value is None:
+                continue
+            if name in ORDER_SIDE_FIELDS:
+                valid = self.order_columns
+            elif name in PRODUCT_SIDE_FIELDS:
+                valid = self.product_columns
+            elif name in MERGED_FIELDS:
+                valid = self.order_columns + self.product_columns
+            else:
+                raise ValueError(f"未知字段: {name}")
+
+            is_list = isinstance(data[name], list)
+            values = list(value) if is_list else [value]
+            missing = [v for v in values if v not in valid]
+            if missing:
+                raise ValueError(f"字段 {name} 指定的列不存在: {missing}")
+            data[name] = values if is_list else value
+            if name not in applied:
+                applied.append(name)
+        data['overrides'] = applied
+        return ColumnMapping(**data)
+
+    def merged_name(self, column: Optional[str], side: str = 'order') -> Optional[str]:
+        """订单表与产品表同名的列在合并后带后缀，换算为合并后的列名"""
+        if column is None:
+            return None
+        if column in self.order_columns and column in self.product_columns:
+            return f"{column}_{side}"
+        return column
+
+    def final_dedup_keys(self) -> List[str]:
+        """最终业务去重的关键字段：订单号 + 商品编码 + 规格名称（存在时）"""
+        return [self.merged_name(c) for c in (self.order_id, self.sku, self.spec) if c]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """API返回用，不含原始列清单"""
+        return {f.name: getattr(self, f.name) for f in fields(self)
+                if f.name not in ('order_columns', 'product_columns')}
+
+
+def present(df_columns: Iterable, column: Optional[str]) -> Optional[str]:
+    """列存在于给定的表中时返回列名，否则None"""
+    return column if column is not None and column in df_columns else None
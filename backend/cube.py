@@ -0,0 +1,286 @@
+"""
+店铺 × 商品 × 日期 聚合立方体
+处理完成后按最细粒度（店铺, 商品, 日）预聚合，并物化所有维度组合的汇总；
+查询只读取预聚合结果，不再访问明细行
+"""
+import time
+from itertools import combinations
+from typing import Dict, List, Any, Optional, Tuple, Iterable
+
+import pandas as pd
+import numpy as np
+
+from aggregation import order_codes
+
+CUBE_DIMENSIONS = ('shop', 'product', 'day')
+SUM_MEASURES = ('revenue', 'cost', 'profit', 'quantity')
+CUBE_MEASURES = SUM_MEASURES + ('lines', 'orders')
+# 同一订单只属于一个店铺、一个付款日；沿这两个维度汇总时订单数可直接相加
+ORDER_LEVEL_DIMENSIONS = frozenset(('shop', 'day'))
+
+
+def _grain(dims: Iterable[str]) -> Tuple[str, ...]:
+    """维度组合按 CUBE_DIMENSIONS 的顺序排列"""
+    dims = set(dims)
+    return tuple(d for d in CUBE_DIMENSIONS if d in dims)
+
+
+def _numeric(df: pd.DataFrame, col: Optional[str], default: float = 0.0) -> np.ndarray:
+    if col is None or col not in df.columns:
+        return np.full(len(df), default, dtype=np.float64)
+    return pd.to_numeric(df[col], errors='coerce').fillna(default).to_numpy(dtype=np.float64)
+
+
+def _labels(series: Optional[pd.Series], n: int, fmt=str) -> Tuple[np.ndarray, np.ndarray]:
+    """维度列编码为整数；缺失值也是一个取值（标签为None），其余取值用 fmt 转为字符串"""
+    if series is None:
+        return np.zeros(n, dtype=np.int64), np.array([None], dtype=object)
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype(object)
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    labels = np.array([None if pd.isna(v) else fmt(v) for v in uniques], dtype=object)
+    return codes.astype(np.int64), labels
+
+
+def _combine(codes: List[np.ndarray], sizes: List[int], n: int) -> np.ndarray:
+    """多列编码合成一个整数键；没有列时所有行同属一组"""
+    key = np.zeros(n, dtype=np.int64)
+    for c, size in zip(codes, sizes):
+        key = key * size + c
+    return key
+
+
+class AggregateCube:
+    """
+    物化的聚合立方体
+
+    每个维度组合（共 2^3 个，含总计）保存一张汇总表：各维度编码 + 收入、成本、利润、数量、行数、订单数。
+    订单数在各自的粒度上精确去重；查询时若筛选了不在分组中的维度，从更细的表汇总，
+    只有被汇总掉的维度都是订单级维度（店铺、日期）时订单数仍精确。
+
+    Attributes:
+        labels: 维度 -> 编码对应的取值
+        tables: 维度组合 -> {维度: 编码数组, 指标: 数组}
+        source_rows: 构建时的明细行数
+    """
+
+    def __init__(self, labels: Dict[str, np.ndarray], tables: Dict[Tuple[str, ...], Dict[str, np.ndarray]],
+                 source_rows: int, build_seconds: float = 0.0):
+        self.labels = labels
+        self.tables = tables
+        self.source_rows = source_rows
+        self.build_seconds = build_seconds
+        self._index = {dim: {v: i for i, v in enumerate(values)} for dim, values in labels.items()}
+
+    @classmethod
+    def build(cls, df: pd.DataFrame, shop_col: Optional[str], product_col: Optional[str],
+              revenue_col: Optional[str], cost_col: Optional[str], profit_col: Optional[str] = None,
+              quantity_col: Optional[str] = None, order_id_col: Optional[str] = None,
+              date_col: Optional[str] = None) -> "AggregateCube":
+        """
+        从处理后的明细构建立方体
+
+        Args:
+            df: 处理后的数据
+            shop_col: 店铺列
+            product_col: 商品列
+            revenue_col: 收入列
+            cost_col: 成本列
+            profit_col: 利润列；不传时为 收入 - 成本
+            quantity_col: 数量列；不传时每行记1件
+            order_id_col: 订单号列；不传时订单数为0
+            date_col: 日期列；不传时日期维度只有一个取值（None）
+
+        Returns:
+            AggregateCube: 立方体
+        """
+        start = time.perf_counter()
+        n = len(df)
+
+        def column(col):
+            return df[col] if col is not None and col in df.columns else None
+
+        codes, labels = {}, {}
+        for dim, series in (('shop', column(shop_col)), ('product', column(product_col))):
+            codes[dim], labels[dim] = _labels(series, n)
+        day_series = column(date_col)
+        if day_series is not None:
+            # 先按日截断再编码，只格式化去重后的日期
+            day_series = pd.to_datetime(day_series, errors='coerce').dt.normalize()
+        codes['day'], labels['day'] = _labels(day_series, n, fmt=lambda v: v.strftime('%Y-%m-%d'))
+        sizes = {dim: len(labels[dim]) for dim in CUBE_DIMENSIONS}
+
+        revenue = _numeric(df, revenue_col)
+        cost = _numeric(df, cost_col)
+        measures = {
+            'revenue': revenue,
+            'cost': cost,
+            'profit': _numeric(df, profit_col) if profit_col is not None and profit_col in df.columns else revenue - cost,
+            'quantity': _numeric(df, quantity_col, 1.0),
+        }
+
+        # 最细粒度：每行所属单元格
+        fine_key = _combine([codes[d] for d in CUBE_DIMENSIONS], [sizes[d] for d in CUBE_DIMENSIONS], n)
+        cell_keys, cell_of_row = np.unique(fine_key, return_inverse=True)
+        n_cells = len(cell_keys)
+        cell_codes = {}
+        rest = cell_keys.copy()
+        for dim in reversed(CUBE_DIMENSIONS):
+            cell_codes[dim] = rest % sizes[dim]
+            rest //= sizes[dim]
+        cell_sums = {m: np.bincount(cell_of_row, weights=v, minlength=n_cells) for m, v in measures.items()}
+        cell_sums['lines'] = np.bincount(cell_of_row, minlength=n_cells).astype(np.int64)
+
+        # (单元格, 订单) 去重一次，各粒度的订单数都从这里计算
+        order_series = column(order_id_col)
+        if order_series is not None:
+            # 订单号在加载时已编码为分类，直接复用其编码
+            orders, n_orders = order_codes(order_series)
+            valid = orders >= 0
+            n_orders = max(n_orders, 1)
+            pairs = np.unique(cell_of_row[valid].astype(np.int64) * n_orders + orders[valid])
+            pair_cells, pair_orders = pairs // n_orders, pairs % n_orders
+            del orders, valid, pairs
+        else:
+            pair_cells = pair_orders = None
+        # 行级中间数组到此用完，先释放再逐粒度汇总（各粒度只用到单元格级数据）
+        del codes, measures, fine_key, cell_of_row
+
+        tables = {}
+        for k in range(len(CUBE_DIMENSIONS), -1, -1):
+            for grain in combinations(CUBE_DIMENSIONS, k):
+                tables[grain] = cls._materialize(grain, cell_codes, cell_sums, sizes, pair_cells, pair_orders)
+
+        cube = cls(labels, tables, n, round(time.perf_counter() - start, 4))
+        print(f"聚合立方体: {n} 行 -> {n_cells} 个单元格，{len(tables)} 个维度组合，{cube.build_seconds}秒")
+        return cube
+
+    @staticmethod
+    def _materialize(grain: Tuple[str, ...], cell_codes: Dict[str, np.ndarray], cell_sums: Dict[str, np.ndarray],
+                     sizes: Dict[str, int], pair_cells: Optional[np.ndarray],
+                     pair_orders: Optional[np.ndarray]) -> Dict[str, np.ndarray]:
+        """把最细粒度的单元格汇总到 grain"""
+        cell_key = _combine([cell_codes[d] for d in grain], [sizes[d] for d in grain], len(cell_sums['lines']))
+        keys, group = np.unique(cell_key, return_inverse=True)
+        table = {dim: cell_codes[dim][np.unique(group, return_index=True)[1]] for dim in grain}
+        for m, values in cell_sums.items():
+            summed = np.bincount(group, weights=values, minlength=len(keys))
+            table[m] = summed.astype(np.int64) if m == 'lines' else summed
+        if pair_cells is not None:
+            # 订单在该粒度下去重：(分组, 订单) 唯一对按分组计数
+            n_orders = int(pair_orders.max()) + 1 if len(pair_orders) else 1
+            unique_pairs = np.unique(group[pair_cells] * n_orders + pair_orders)
+            table['orders'] = np.bincount(unique_pairs // n_orders, minlength=len(keys)).astype(np.int64)
+        else:
+            table['orders'] = np.zeros(len(keys), dtype=np.int64)
+        return table
+
+    def _codes_for(self, dim: str, values: Optional[List[Any]]) -> Optional[np.ndarray]:
+        if values is None:
+            return None
+        index = self._index[dim]
+        return np.array([index[v] for v in values if v in index], dtype=np.int64)
+
+    def query(self, by: Iterable[str] = (), shops: Optional[List[str]] = None,
+              products: Optional[List[str]] = None, day_from: Optional[str] = None,
+              day_to: Optional[str] = None, sort_by: Optional[str] = None,
+              descending: bool = True, limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        按任意粗粒度汇总
+
+        Args:
+            by: 分组维度（shop / product / day 的任意组合，空为总计）
+            shops: 店铺筛选
+            products: 商品筛选
+            day_from: 起始日期（含），YYYY-MM-DD
+            day_to: 结束日期（含），YYYY-MM-DD
+            sort_by: 排序指标
+            descending: 是否降序
+            limit: 最多返回的行数
+
+        Returns:
+            Dict[str, Any]: grain、rows（维度取值 + 指标）、total_rows、orders_exact、source_grain、elapsed_ms
+
+        Raises:
+            ValueError: 维度或排序指标未知
+        """
+        start = time.perf_counter()
+        by = list(by)
+        unknown = [d for d in by if d not in CUBE_DIMENSIONS]
+        if unknown:
+            raise ValueError(f"未知维度: {unknown}，可选 {list(CUBE_DIMENSIONS)}")
+        if sort_by is not None and sort_by not in CUBE_MEASURES and sort_by not in CUBE_DIMENSIONS:
+            raise ValueError(f"未知排序字段: {sort_by}")
+
+        filters = {}
+        for dim, values in (('shop', shops), ('product', products)):
+            codes = self._codes_for(dim, values)
+            if codes is not None:
+                filters[dim] = codes
+        if day_from is not None or day_to is not None:
+            days = self.labels['day']
+            keep = np.array([d is not None and (day_from is None or d >= day_from) and (day_to is None or d <= day_to)
+                             for d in days], dtype=bool)
+            filters['day'] = np.flatnonzero(keep)
+
+        grain = _grain(by)
+        source_grain = _grain(list(by) + list(filters))
+        table = self.tables[source_grain]
+        size = len(table['lines'])
+
+        mask = np.ones(size, dtype=bool)
+        for dim, codes in filters.items():
+            mask &= np.isin(table[dim], codes)
+        rows = {k: v[mask] for k, v in table.items()}
+
+        if source_grain != grain:
+            # 从更细的表上卷：筛选维度汇总掉
+            sizes = [len(self.labels[d]) for d in grain]
+            keys, group = np.unique(_combine([rows[d] for d in grain], sizes, len(rows['lines'])), return_inverse=True)
+            first = np.unique(group, return_index=True)[1]
+            rolled = {d: rows[d][first] for d in grain}
+            for m in CUBE_MEASURES:
+                summed = np.bincount(group, weights=rows[m], minlength=len(keys))
+                rolled[m] = summed.astype(np.int64) if m in ('lines', 'orders') else summed
+            rows = rolled
+
+        order = None
+        if sort_by is not None:
+            values = rows[sort_by] if sort_by in CUBE_MEASURES else self.labels[sort_by][rows[sort_by]].astype(str)
+            order = np.argsort(values, kind='stable')
+            if descending:
+                order = order[::-1]
+        total = len(rows['lines'])
+        if order is None:
+            order = np.arange(total)
+        if limit is not None:
+            order = order[:limit]
+
+        # 按列取值后再拼成记录
+        names = list(grain) + list(CUBE_MEASURES)
+        values = [self.labels[d][rows[d][order]].tolist() for d in grain]
+        values += [rows[m][order].tolist() if m in ('lines', 'orders') else np.round(rows[m][order], 2).tolist()
+                   for m in CUBE_MEASURES]
+        records = [dict(zip(names, row)) for row in zip(*values)] if names else []
+
+        removed = set(source_grain) - set(grain)
+        return {
+            'grain': list(grain),
+            'rows': records,
+            'total_rows': total,
+            'orders_exact': removed <= ORDER_LEVEL_DIMENSIONS,
+            'source_grain': list(source_grain),
+            'elapsed_ms': round((time.perf_counter() - start) * 1000, 3)
+        }
+
+    def info(self) -> Dict[str, Any]:
+        """立方体规模"""
+        return {
+            'source_rows': self.source_rows,
+            'cells': len(self.tables[CUBE_DIMENSIONS]['lines']),
+            'dimensions': {dim: len(values) for dim, values in self.labels.items()},
+            'grains': [list(g) for g in self.tables],
+            'measures': list(CUBE_MEASURES),
+            'build_seconds': self.build_seconds,
+            'memory_bytes': int(sum(v.nbytes for t in self.tables.values() for v in t.values()))
+        }
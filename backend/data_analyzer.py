@@ -4,9 +4,19 @@
 """
 import pandas as pd
 import os
-from typing import Dict, List, Any, Optional
+import threading
+from typing import Dict, List, Any, Optional, Tuple
+
+from frame_cache import read_excel_cached
+from profiling import profile_excel
 
 class DataAnalyzer:
+    # 所有分析器实例共享的已解析表：路径 -> ((文件大小, mtime), DataFrame)
+    # 返回的DataFrame只读，调用方不得修改
+    _frames: Dict[str, Tuple[Tuple[int, int], pd.DataFrame]] = {}
+    _frames_lock = threading.Lock()
+    _path_locks: Dict[str, threading.Lock] = {}
+
     def __init__(self, dataset_path: str = "../dataset"):
         self.dataset_path = dataset_path
         self.product_file = None
@@ -28,6 +38,81 @@ class DataAnalyzer:
                 elif '账单' in file:
                     self.bill_file = os.path.join(self.dataset_path, file)
 
+    @classmethod
+    def _read_frame(cls, file_path: str, nrows: Optional[int] = None) -> pd.DataFrame:
+        """
+        读取Excel，整表解析结果在内存中共享，文件大小或修改时间变化时失效
+
+        同一文件的并发请求只解析一次，其余请求等待解析结果；
+        已有整表时 nrows 读取直接切片，否则只解析前几行（不进入共享缓存）
+
+        Args:
+            file_path: 文件路径
+            nrows: 只需要前几行时传入
+
+        Returns:
+            pd.DataFrame: 解析结果
+        """
+        key = os.path.abspath(file_path)
+        st = os.stat(file_path)
+        version = (st.st_size, st.st_mtime_ns)
+
+        with cls._frames_lock:
+            cached = cls._frames.get(key)
+            if cached is not None and cached[0] == version:
+                return cached[1].head(nrows) if nrows is not None else cached[1]
+            path_lock = cls._path_locks.setdefault(key, threading.Lock())
+
+        if nrows is not None:
+            return read_excel_cached(file_path, nrows=nrows)
+
+        with path_lock:
+            # 等待期间可能已有其他请求完成解析
+            with cls._frames_lock:
+                cached = cls._frames.get(key)
+                if cached is not None and cached[0] == version:
+                    return cached[1]
+            df = read_excel_cached(file_path)
+            with cls._frames_lock:
+                cls._frames[key] = (version, df)
+            return df
+
+    @classmethod
+    def profile_file(cls, file_path: str) -> Dict[str, Any]:
+        """
+        整表列概况：已有共享的整表时直接按块扫描，否则流式读取，不把整表留在内存
+
+        Args:
+            file_path: 文件路径
+
+        Returns:
+            Dict[str, Any]: profiling.profile_excel 的结果
+        """
+        key = os.path.abspath(file_path)
+        st = os.stat(file_path)
+        with cls._frames_lock:
+            cached = cls._frames.get(key)
+        frame = cached[1] if cached is not None and cached[0] == (st.st_size, st.st_mtime_ns) else None
+        return profile_excel(file_path, frame=frame)
+
+    @staticmethod
+    def _column_analysis(profile: Dict[str, Any]) -> Dict[str, Any]:
+        """概况结果转为 column_analysis 格式，附带误差说明"""
+        return {
+            col: {
+                "dtype": info["dtype"],
+                "null_count": info["null_count"],
+                "unique_count": info["unique_count"],
+                "unique_exact": info["distinct"]["exact"],
+                "sample_values": info["sample_values"]
+            }
+            for col, info in profile["columns"].items()
+        }
+
+    @staticmethod
+    def _profile_info(profile: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: profile[key] for key in ("rows_scanned", "truncated", "seconds", "source", "error_bounds")}
+
     def get_file_info(self) -> Dict[str, Any]:
         """获取所有文件的基本信息"""
         info = {
@@ -44,7 +129,7 @@ class DataAnalyzer:
         ]:
             if file_path and os.path.exists(file_path):
                 try:
-                    df = pd.read_excel(file_path, nrows=0)  # 只读取列名
+                    df = self._read_frame(file_path, nrows=0)  # 只读取列名
                     info["files_analysis"][file_type] = {
                         "file_name": os.path.basename(file_path),
                         "columns": df.columns.tolist(),
@@ -70,7 +155,7 @@ class DataAnalyzer:
             return {"error": f"文件 {file_type} 不存在"}
 
         try:
-            df = pd.read_excel(file_path, nrows=nrows)
+            df = self._read_frame(file_path, nrows=nrows)
             return {
                 "columns": df.columns.tolist(),
                 "data": df.to_dict('records'),
@@ -86,31 +171,25 @@ class DataAnalyzer:
             return {"error": "产品信息表文件不存在"}
 
         try:
-            df = pd.read_excel(self.product_file, nrows=100)  # 读取前100行进行分析
+            profile = self.profile_file(self.product_file)
+            columns = list(profile["columns"])
 
             # 查找可能的商品编号列
             potential_sku_columns = []
-            for col in df.columns:
+            for col in columns:
                 col_str = str(col).lower()
                 if any(keyword in col_str for keyword in ['商品编号', 'sku', '编号', '货号', '商品id']):
                     potential_sku_columns.append(col)
 
             # 分析数据类型和唯一值
             analysis = {
-                "total_columns": len(df.columns),
-                "all_columns": df.columns.tolist(),
+                "total_columns": len(columns),
+                "all_columns": columns,
                 "potential_sku_columns": potential_sku_columns,
-                "column_analysis": {}
+                "column_analysis": self._column_analysis(profile),
+                "profile": self._profile_info(profile)
             }
 
-            for col in df.columns:
-                analysis["column_analysis"][col] = {
-                    "dtype": str(df[col].dtype),
-                    "null_count": int(df[col].isnull().sum()),
-                    "unique_count": int(df[col].nunique()),
-                    "sample_values": df[col].dropna().head(3).tolist()
-                }
-
             return analysis
         except Exception as e:
             return {"error": str(e)}
@@ -121,7 +200,8 @@ class DataAnalyzer:
             return {"error": "订单文件不存在"}
 
         try:
-            df = pd.read_excel(self.order_file, nrows=100)
+            profile = self.profile_file(self.order_file)
+            columns = list(profile["columns"])
 
             # 查找关键列
             key_columns = {
@@ -131,7 +211,7 @@ class DataAnalyzer:
                 "shop_columns": []
             }
 
-            for col in df.columns:
+            for col in columns:
                 col_str = str(col).lower()
                 if any(keyword in col_str for keyword in ['商品编号', 'sku', '编号', '货号']):
                     key_columns["sku_columns"].append(col)
@@ -143,20 +223,13 @@ class DataAnalyzer:
                     key_columns["shop_columns"].append(col)
 
             analysis = {
-                "total_columns": len(df.columns),
-                "all_columns": df.columns.tolist(),
+                "total_columns": len(columns),
+                "all_columns": columns,
                 "key_columns": key_columns,
-                "column_analysis": {}
+                "column_analysis": self._column_analysis(profile),
+                "profile": self._profile_info(profile)
             }
 
-            for col in df.columns:
-                analysis["column_analysis"][col] = {
-                    "dtype": str(df[col].dtype),
-                    "null_count": int(df[col].isnull().sum()),
-                    "unique_count": int(df[col].nunique()),
-                    "sample_values": df[col].dropna().head(3).tolist()
-                }
-
             return analysis
         except Exception as e:
             return {"error": str(e)}
@@ -167,7 +240,7 @@ class DataAnalyzer:
             return {"error": "订单文件不存在"}
 
         try:
-            df = pd.read_excel(self.order_file)
+            df = self._read_frame(self.order_file)
 
             # 查找状态列
             status_columns = []
@@ -199,7 +272,7 @@ class DataAnalyzer:
             return {"error": "订单文件不存在"}
 
         try:
-            df = pd.read_excel(self.order_file)
+            df = self._read_frame(self.order_file)
 
             # 查找店铺列
             shop_columns = []
@@ -7,12 +7,26 @@ import numpy as np
 from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime
 
+from frame_cache import read_excel_cached
+from aggregation import aggregate_by_shop
+from exporters import export_frames
+from jobs import report_progress
+from cube import AggregateCube
+from catalog_index import normalize_keys
+from column_mapping import ORDER_FIELD_KEYWORDS, QUANTITY_KEYWORDS, find_column
+from metrics import StageRecorder
+
+
 class DataProcessor:
     def __init__(self, dataset_path: str = "../dataset"):
         self.dataset_path = dataset_path
         self.product_df = None
         self.order_df = None
         self.processed_data = None
+        self.shop_totals = None
+        self.export_stats = {}
+        self.cube = None
+        self._cube_source = None
         self._load_data()
 
     def _load_data(self):
@@ -20,14 +34,14 @@ class DataProcessor:
         try:
             # 加载产品信息表
             product_file = f"{self.dataset_path}/产品信息表-总.xlsx"
-            self.product_df = pd.read_excel(product_file)
+            self.product_df = read_excel_cached(product_file)
 
             # 清理产品数据：移除标题行，重置索引
             self.product_df = self.product_df[self.product_df['商家编码'] != '商家编码'].reset_index(drop=True)
 
             # 加载订单数据
             order_file = f"{self.dataset_path}/订单9.14.xlsx"
-            self.order_df = pd.read_excel(order_file)
+            self.order_df = read_excel_cached(order_file)
 
             print(f"产品数据加载完成: {len(self.product_df)} 条记录")
             print(f"订单数据加载完成: {len(self.order_df)} 条记录")
@@ -45,7 +59,8 @@ class DataProcessor:
         if self.order_df is None:
             return pd.DataFrame()
 
-        df = self.order_df.copy()
+        # 过滤条件只读取用到的列，最后按掩码取一次行
+        df = self.order_df
 
         # 过滤条件
         filters = []
@@ -65,14 +80,14 @@ class DataProcessor:
         filters.append(~df['明细状态'].str.contains('退款', na=False))
 
         # 应用所有过滤条件
-        final_filter = np.logical_and.reduce(filters)
-        cleaned_df = df[final_filter].copy()
-
         # 店铺筛选
         if filter_options and 'selected_shops' in filter_options:
             selected_shops = filter_options['selected_shops']
             if selected_shops:
-                cleaned_df = cleaned_df[cleaned_df['店铺名称'].isin(selected_shops)]
+                filters.append(df['店铺名称'].isin(selected_shops))
+
+        final_filter = np.logical_and.reduce(filters)
+        cleaned_df = df[final_filter]
 
         print(f"原始订单: {len(df)}, 清理后: {len(cleaned_df)}")
         return cleaned_df
@@ -85,16 +100,16 @@ class DataProcessor:
         if self.product_df is None or order_df.empty:
             return pd.DataFrame()
 
-        # 准备产品数据
-        product_df = self.product_df.copy()
+        # 准备产品数据：只取参与合并的列
+        product_df = self.product_df[['商家编码', '商品', 'SKU', '成本', '实际价格', '一口价']]
 
-        # 清理并转换数据类型
-        product_df['商家编码'] = product_df['商家编码'].astype(str).str.strip()
-        order_df['商品编码'] = order_df['商品编码'].astype(str).str.strip()
+        # 清理并转换数据类型（assign 返回新表，不改动产品表和传入的订单数据）
+        product_df = product_df.assign(商家编码=normalize_keys(product_df['商家编码']))
+        order_df = order_df.assign(商品编码=normalize_keys(order_df['商品编码']))
 
         # 匹配逻辑：使用商品编码进行匹配
         matched_df = order_df.merge(
-            product_df[['商家编码', '商品', 'SKU', '成本', '实际价格', '一口价']],
+            product_df,
             left_on='商品编码',
             right_on='商家编码',
             how='left'
@@ -113,7 +128,8 @@ class DataProcessor:
         if matched_df.empty:
             return pd.DataFrame()
 
-        df = matched_df.copy()
+        # 浅拷贝即可：之后只整列新增或替换（不原地写入），不影响匹配结果
+        df = matched_df.copy(deep=False)
 
         # 数据类型转换
         def safe_convert_to_float(series):
@@ -138,32 +154,45 @@ class DataProcessor:
 
         return df
 
-    def analyze_by_shop(self, processed_df: pd.DataFrame) -> Dict[str, Any]:
-        """按店铺分析数据"""
+    def aggregate_shops(self, processed_df: pd.DataFrame) -> pd.DataFrame:
+        """按店铺一次性聚合，分析和导出共用"""
+        return aggregate_by_shop(
+            processed_df, '店铺名称',
+            revenue_col='买家实付', cost_col='成本', margin_col='毛利率', profit_col='利润',
+            order_id_col='订单号', margin_on_revenue_only=False
+        )
+
+    def analyze_by_shop(self, processed_df: pd.DataFrame, totals: Optional[pd.DataFrame] = None) -> Dict[str, Any]:
+        """按店铺分析数据，totals 为已计算的店铺聚合结果"""
         if processed_df.empty:
             return {}
 
-        shop_analysis = {}
-
-        for shop in processed_df['店铺名称'].unique():
-            shop_data = processed_df[processed_df['店铺名称'] == shop]
+        if totals is None:
+            totals = self.aggregate_shops(processed_df)
+
+        # 各店铺热销产品：一次按 (店铺, 商品名称) 分组，再按店铺取前5个
+        top_products = processed_df.groupby(['店铺名称', '商品名称']).agg({
+            '买家实付': 'sum',
+            '利润': 'sum',
+            '订单号': 'count'
+        }).round(2)
+        top_by_shop = {
+            shop: group.droplevel(0).head().to_dict('index')
+            for shop, group in top_products.groupby(level=0, sort=False)
+        }
 
-            analysis = {
+        shop_analysis = {}
+        for shop, row in zip(totals.index, totals.itertuples(index=False)):
+            shop_analysis[shop] = {
                 'shop_name': shop,
-                'total_orders': len(shop_data),
-                'total_revenue': shop_data['买家实付'].sum(),
-                'total_cost': shop_data['成本'].sum(),
-                'total_profit': shop_data['利润'].sum(),
-                'avg_profit_margin': shop_data['毛利率'].mean(),
-                'top_products': shop_data.groupby('商品名称').agg({
-                    '买家实付': 'sum',
-                    '利润': 'sum',
-                    '订单号': 'count'
-                }).round(2).head().to_dict('index')
+                'total_orders': int(row.lines),
+                'total_revenue': row.revenue,
+                'total_cost': row.cost,
+                'total_profit': row.profit,
+                'avg_profit_margin': row.avg_margin,
+                'top_products': top_by_shop.get(shop, {})
             }
 
-            shop_analysis[shop] = analysis
-
         return shop_analysis
 
     def get_summary_statistics(self, processed_df: pd.DataFrame) -> Dict[str, Any]:
@@ -188,6 +217,27 @@ class DataProcessor:
 
         return summary
 
+    def build_cube(self, processed_df: pd.DataFrame) -> Optional[AggregateCube]:
+        """按 店铺 × 商品编码 × 付款日 物化聚合立方体"""
+        self._cube_source = id(processed_df)
+        if processed_df is None or processed_df.empty:
+            self.cube = None
+            return None
+        self.cube = AggregateCube.build(
+            processed_df, '店铺名称', '商品编码',
+            revenue_col='买家实付', cost_col='成本', profit_col='利润',
+            quantity_col=find_column(self.order_df.columns, QUANTITY_KEYWORDS) if self.order_df is not None else None,
+            order_id_col='订单号',
+            date_col=find_column(self.order_df.columns, ORDER_FIELD_KEYWORDS['date']) if self.order_df is not None else None
+        )
+        return self.cube
+
+    def get_cube(self) -> Optional[AggregateCube]:
+        """当前处理结果的聚合立方体；处理结果来自后台任务时补建一次"""
+        if self.processed_data is not None and self._cube_source != id(self.processed_data):
+            return self.build_cube(self.processed_data)
+        return self.cube
+
     def get_available_shops(self) -> List[str]:
         """获取所有可用的店铺列表"""
         if self.order_df is None:
@@ -201,72 +251,138 @@ class DataProcessor:
         返回: (处理后的数据, 分析结果)
         """
         print("开始数据处理...")
+        recorder = StageRecorder('dataset')
+        try:
+            # 1. 清理订单数据
+            with recorder.stage('clean', len(self.order_df) if self.order_df is not None else None) as record:
+                cleaned_orders = self.clean_order_data(filter_options)
+                record['rows_out'] = len(cleaned_orders)
+
+            if cleaned_orders.empty:
+                return pd.DataFrame(), {}
+
+            # 2. 匹配产品信息
+            with recorder.stage('match', len(cleaned_orders)) as record:
+                matched_data = self.match_products_with_orders(cleaned_orders)
+                record['rows_out'] = len(matched_data)
+
+            # 3. 计算成本和利润
+            with recorder.stage('costs', len(matched_data)) as record:
+                processed_data = self.calculate_costs_and_profits(matched_data)
+                record['rows_out'] = len(processed_data)
+
+            # 4. 生成分析报告（店铺聚合结果保留给导出复用）
+            rows = len(processed_data)
+            with recorder.stage('summary', rows):
+                summary = self.get_summary_statistics(processed_data)
+            with recorder.stage('shops', rows) as record:
+                shop_totals = self.aggregate_shops(processed_data)
+                shop_analysis = self.analyze_by_shop(processed_data, shop_totals)
+                record['rows_out'] = len(shop_totals)
+            with recorder.stage('cube', rows) as record:
+                cube = self.build_cube(processed_data)
+                record['rows_out'] = cube.info()['cells'] if cube is not None else 0
 
-        # 1. 清理订单数据
-        cleaned_orders = self.clean_order_data(filter_options)
-
-        if cleaned_orders.empty:
-            return pd.DataFrame(), {}
-
-        # 2. 匹配产品信息
-        matched_data = self.match_products_with_orders(cleaned_orders)
-
-        # 3. 计算成本和利润
-        processed_data = self.calculate_costs_and_profits(matched_data)
-
-        # 4. 生成分析报告
-        analysis = {
-            'summary': self.get_summary_statistics(processed_data),
-            'shop_analysis': self.analyze_by_shop(processed_data),
-            'processing_info': {
-                'original_orders': len(self.order_df) if self.order_df is not None else 0,
-                'cleaned_orders': len(cleaned_orders),
-                'matched_orders': len(processed_data[processed_data['商家编码'].notna()]),
-                'processed_time': datetime.now().isoformat()
+            analysis = {
+                'summary': summary,
+                'shop_analysis': shop_analysis,
+                'processing_info': {
+                    'original_orders': len(self.order_df) if self.order_df is not None else 0,
+                    'cleaned_orders': len(cleaned_orders),
+                    'matched_orders': len(processed_data[processed_data['商家编码'].notna()]),
+                    'processed_time': datetime.now().isoformat(),
+                    **recorder.report()
+                }
             }
-        }
+        finally:
+            recorder.close()
 
         self.processed_data = processed_data
+        self.shop_totals = shop_totals
         print("数据处理完成!")
 
         return processed_data, analysis
 
-    def export_processed_data(self, output_path: str = "processed_data.xlsx") -> bool:
-        """导出处理后的数据"""
+    def export_processed_data(self, output_path: str = "processed_data.xlsx", fmt: str = 'xlsx') -> bool:
+        """
+        导出处理后的数据（主数据、店铺汇总、产品汇总）
+
+        Args:
+            output_path: 导出文件路径
+            fmt: 导出格式（xlsx / csv.gz / parquet）
+
+        Returns:
+            bool: 是否成功，导出统计保存在 export_stats
+        """
         if self.processed_data is None or self.processed_data.empty:
             return False
 
         try:
-            with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
-                # 主数据表
-                self.processed_data.to_excel(writer, sheet_name='处理后数据', index=False)
-
-                # 店铺汇总
-                shop_summary = self.processed_data.groupby('店铺名称').agg({
-                    '买家实付': 'sum',
-                    '成本': 'sum',
-                    '利润': 'sum',
-                    '毛利率': 'mean',
-                    '订单号': 'count'
-                }).round(2)
-                shop_summary.to_excel(writer, sheet_name='店铺汇总')
-
-                # 产品汇总
-                product_summary = self.processed_data.groupby(['商品名称', '商品编码']).agg({
-                    '买家实付': 'sum',
-                    '成本': 'sum',
-                    '利润': 'sum',
-                    '毛利率': 'mean',
-                    '订单号': 'count'
-                }).round(2)
-                product_summary.to_excel(writer, sheet_name='产品汇总')
-
+            # 店铺汇总：复用 process_data 中已计算的聚合结果
+            totals = self.shop_totals if self.shop_totals is not None else self.aggregate_shops(self.processed_data)
+            shop_summary = totals[['revenue', 'cost', 'profit', 'avg_margin', 'lines']].rename(columns={
+                'revenue': '买家实付',
+                'cost': '成本',
+                'profit': '利润',
+                'avg_margin': '毛利率',
+                'lines': '订单号'
+            }).sort_index().round(2)
+            shop_summary.index.name = '店铺名称'
+
+            # 产品汇总
+            product_summary = self.processed_data.groupby(['商品名称', '商品编码']).agg({
+                '买家实付': 'sum',
+                '成本': 'sum',
+                '利润': 'sum',
+                '毛利率': 'mean',
+                '订单号': 'count'
+            }).round(2)
+
+            sheets = {
+                '处理后数据': self.processed_data,
+                '店铺汇总': shop_summary.reset_index(),
+                '产品汇总': product_summary.reset_index()
+            }
+            self.export_stats = export_frames(output_path, sheets, fmt)
             print(f"数据已导出到: {output_path}")
             return True
         except Exception as e:
             print(f"导出失败: {e}")
             return False
 
+def run_dataset_process_job(job_id: str, dataset_path: str,
+                            filter_options: Dict[str, Any] = None) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """进程池任务：加载数据集并执行数据处理"""
+    report_progress(job_id, "loading", 0.1)
+    processor = DataProcessor(dataset_path)
+    report_progress(job_id, "processing", 0.3)
+    return processor.process_data(filter_options)
+
+
+def run_dataset_export_job(job_id: str, dataset_path: str, filter_options: Dict[str, Any],
+                           output_path: str, fmt: str = 'xlsx') -> Dict[str, Any]:
+    """
+    进程池任务：加载数据集、处理并导出
+
+    Raises:
+        ValueError: 没有可导出的数据或导出失败
+    """
+    report_progress(job_id, "loading", 0.1)
+    processor = DataProcessor(dataset_path)
+    report_progress(job_id, "processing", 0.3)
+    processed_df, analysis = processor.process_data(filter_options)
+    if processed_df.empty:
+        raise ValueError("没有数据可以导出")
+    report_progress(job_id, "exporting", 0.7)
+    if not processor.export_processed_data(output_path, fmt):
+        raise ValueError("数据导出失败")
+    return {
+        'filename': output_path,
+        'records_count': len(processed_df),
+        'export_stats': processor.export_stats,
+        'processing_info': analysis['processing_info']
+    }
+
 # 测试代码
 if __name__ == "__main__":
     processor = DataProcessor()
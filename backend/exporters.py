@@ -0,0 +1,179 @@
+"""
+数据导出
+按格式选择写出器：xlsx（openpyxl 只写模式逐行流式写出，内存占用与行数无关）、csv.gz、parquet；
+每次导出记录行数、耗时、行/秒和导出期间的内存峰值增量
+"""
+import os
+import gzip
+import time
+from typing import Dict, List, Any
+
+import pandas as pd
+import numpy as np
+from openpyxl import Workbook
+
+from metrics import memory_window
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow为可选依赖，缺失时不支持parquet
+    pa = None
+    pq = None
+
+EXPORT_CHUNK_SIZE = 20000
+EXPORT_FORMATS = {
+    'xlsx': '.xlsx',
+    'csv.gz': '.csv.gz',
+    'parquet': '.parquet',
+}
+MEDIA_TYPES = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv.gz': 'application/gzip',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def _iter_chunks(df: pd.DataFrame, chunk_size: int = EXPORT_CHUNK_SIZE):
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size]
+
+
+def _cell_rows(chunk: pd.DataFrame):
+    """按行产出可写入单元格的值：缺失值为None，numpy标量转为Python类型"""
+    columns = []
+    for _, series in chunk.items():
+        values = series.astype(object).to_numpy()
+        missing = pd.isna(values)
+        if missing.any():
+            values = values.copy()
+            values[missing] = None
+        columns.append(values)
+    for row in zip(*columns):
+        yield [v.item() if isinstance(v, np.generic) else v for v in row]
+
+
+def write_xlsx(path: str, sheets: Dict[str, pd.DataFrame]):
+    """openpyxl 只写模式，分块逐行写出，不在内存中保留整张工作表"""
+    wb = Workbook(write_only=True)
+    for sheet_name, df in sheets.items():
+        ws = wb.create_sheet(title=sheet_name)
+        ws.append([str(c) for c in df.columns])
+        for chunk in _iter_chunks(df):
+            for row in _cell_rows(chunk):
+                ws.append(row)
+    wb.save(path)
+
+
+def write_csv_gz(path: str, sheets: Dict[str, pd.DataFrame]) -> List[str]:
+    """主表写入 path，其余工作表写入同目录的 <文件名>_<表名>.csv.gz"""
+    written = []
+    stem = path[:-len(EXPORT_FORMATS['csv.gz'])] if path.endswith(EXPORT_FORMATS['csv.gz']) else path
+    for i, (sheet_name, df) in enumerate(sheets.items()):
+        target = path if i == 0 else f"{stem}_{sheet_name}{EXPORT_FORMATS['csv.gz']}"
+        # utf-8-sig 便于Excel直接打开中文列名
+        with gzip.open(target, 'wt', encoding='utf-8-sig', newline='', compresslevel=6) as f:
+            for j, chunk in enumerate(_iter_chunks(df)):
+                chunk.to_csv(f, index=False, header=(j == 0))
+        written.append(target)
+    return written
+
+
+def _arrow_safe(chunk: pd.DataFrame) -> pd.DataFrame:
+    """混合类型的object列（含分类列的类别）统一为字符串，避免pyarrow推断失败"""
+    chunk = chunk.copy()
+    for col in chunk.columns:
+        series = chunk[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            if series.cat.categories.dtype == object:
+                chunk[col] = series.astype(object).map(lambda v: None if pd.isna(v) else str(v)).astype('category')
+        elif series.dtype == object:
+            chunk[col] = series.map(lambda v: None if pd.isna(v) else str(v))
+    return chunk
+
+
+def write_parquet(path: str, sheets: Dict[str, pd.DataFrame]) -> List[str]:
+    """主表写入 path，其余工作表写入同目录的 <文件名>_<表名>.parquet；分类列保留字典编码"""
+    if pq is None:
+        raise ValueError("parquet导出需要安装 pyarrow")
+    written = []
+    stem = path[:-len(EXPORT_FORMATS['parquet'])] if path.endswith(EXPORT_FORMATS['parquet']) else path
+    for i, (sheet_name, df) in enumerate(sheets.items()):
+        target = path if i == 0 else f"{stem}_{sheet_name}{EXPORT_FORMATS['parquet']}"
+        writer = None
+        try:
+            for chunk in _iter_chunks(df):
+                table = pa.Table.from_pandas(_arrow_safe(chunk), preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(target, table.schema)
+                else:
+                    table = table.cast(writer.schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+        written.append(target)
+    return written
+
+
+def export_frames(path: str, sheets: Dict[str, pd.DataFrame], fmt: str = 'xlsx') -> Dict[str, Any]:
+    """
+    按格式导出
+
+    Args:
+        path: 目标文件路径（主表）
+        sheets: 表名 -> 数据，第一个为主表；csv.gz/parquet 每张表单独一个文件
+        fmt: 导出格式，见 EXPORT_FORMATS
+
+    Returns:
+        Dict[str, Any]: 导出统计（格式、文件、行数、耗时、行/秒、导出期间的RSS峰值增量 peak_mb）
+
+    Raises:
+        ValueError: 格式不支持
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {fmt}，可选: {list(EXPORT_FORMATS)}")
+
+    rows = int(sum(len(df) for df in sheets.values()))
+    start = time.perf_counter()
+    with memory_window() as memory:
+        if fmt == 'xlsx':
+            write_xlsx(path, sheets)
+            files = [path]
+        elif fmt == 'csv.gz':
+            files = write_csv_gz(path, sheets)
+        else:
+            files = write_parquet(path, sheets)
+    elapsed = time.perf_counter() - start
+
+    stats = {
+        'format': fmt,
+        'files': [os.path.basename(f) for f in files],
+        'rows': rows,
+        'bytes': int(sum(os.path.getsize(f) for f in files)),
+        'seconds': round(elapsed, 3),
+        'rows_per_sec': round(rows / elapsed, 1) if elapsed > 0 else None,
+        'peak_mb': round(memory['peak_bytes'] / 1024 / 1024, 2)
+    }
+    print(f"导出 {fmt}: {rows} 行，{stats['seconds']}s，{stats['rows_per_sec']} 行/秒，内存峰值增量 {stats['peak_mb']}MB")
+    return stats
+
+
+def export_format(filename: str) -> str:
+    """
+    按文件扩展名判断导出格式
+
+    Raises:
+        ValueError: 扩展名不是任何导出格式
+    """
+    for fmt, suffix in EXPORT_FORMATS.items():
+        if filename.endswith(suffix):
+            return fmt
+    raise ValueError(f"不是导出文件: {filename}")
+
+
+def export_path(directory: str, basename: str, fmt: str) -> str:
+    """按格式拼接导出文件路径"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {fmt}，可选: {list(EXPORT_FORMATS)}")
+    return os.path.join(directory, basename + EXPORT_FORMATS[fmt])
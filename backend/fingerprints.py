@@ -0,0 +1,100 @@
+"""
+行指纹
+每列向量化计算64位哈希，再组合成整行或任意列子集的指纹；
+去重和重复统计都基于指纹，不再做整表逐列比较
+"""
+from typing import Dict, List, Optional, Iterable, Callable
+
+import pandas as pd
+import numpy as np
+
+_INITIAL = np.uint64(0x345678)
+_MULTIPLIER = np.uint64(1000003)
+_FINAL = np.uint64(97531)
+
+
+def column_hashes(df: pd.DataFrame, columns: Optional[Iterable[str]] = None) -> Dict[str, np.ndarray]:
+    """
+    每列值的64位哈希（分类列按取值哈希，与同值的object列一致；NaN与NaN哈希相同）
+
+    Args:
+        df: 数据
+        columns: 只计算这些列，默认全部
+
+    Returns:
+        Dict[str, np.ndarray]: 列名 -> uint64数组
+    """
+    columns = df.columns if columns is None else columns
+    return {col: pd.util.hash_pandas_object(df[col], index=False).to_numpy() for col in columns}
+
+
+def combine(hashes: Iterable[np.ndarray], n: int, count: Optional[int] = None) -> np.ndarray:
+    """
+    按顺序组合多列哈希为行指纹（与 pandas 组合各列哈希的方式相同）
+
+    Args:
+        hashes: 各列哈希；传入生成器并给出 count 时逐列计算、逐列合并，同一时刻只保留一列哈希
+        n: 行数
+        count: 列数，hashes 为列表时可省略
+
+    Returns:
+        np.ndarray: uint64行指纹
+    """
+    if count is None:
+        hashes = list(hashes)
+        count = len(hashes)
+    out = np.full(n, _INITIAL, dtype=np.uint64)
+    multiplier = _MULTIPLIER
+    with np.errstate(over='ignore'):
+        for i, h in enumerate(hashes):
+            out ^= h
+            out *= multiplier
+            multiplier += np.uint64(82520 + 2 * (count - i))
+        out += _FINAL
+    return out
+
+
+def fold_columns(df: pd.DataFrame, columns: List[str],
+                 transform: Optional[Callable[[str, pd.Series], pd.Series]] = None) -> np.ndarray:
+    """
+    逐列哈希并合并为行指纹，不同时保留各列哈希
+
+    Args:
+        df: 数据
+        columns: 参与的列（按顺序）
+        transform: 可选，哈希前对列做变换，参数为 (列名, 列)
+
+    Returns:
+        np.ndarray: uint64行指纹，与 combine(column_hashes(...)) 相同
+    """
+    def hashes():
+        for col in columns:
+            series = df[col] if transform is None else transform(col, df[col])
+            yield pd.util.hash_pandas_object(series, index=False).to_numpy()
+    return combine(hashes(), len(df), len(columns))
+
+
+def row_fingerprints(df: pd.DataFrame, columns: Optional[List[str]] = None, as_object: bool = False) -> np.ndarray:
+    """
+    行指纹
+
+    Args:
+        df: 数据
+        columns: 参与的列，默认整行
+        as_object: 先转object再哈希；分块读取时同一列在不同块里推断出的dtype可能不同，需统一
+
+    Returns:
+        np.ndarray: uint64行指纹，64位碰撞概率可忽略
+    """
+    columns = list(df.columns) if columns is None else list(columns)
+    return fold_columns(df, columns, (lambda _, s: s.astype(object)) if as_object else None)
+
+
+def first_occurrence(fingerprints: np.ndarray) -> np.ndarray:
+    """每个指纹第一次出现的行为True，与 drop_duplicates(keep='first') 保留的行一致"""
+    return ~pd.Series(fingerprints, copy=False).duplicated(keep='first').to_numpy()
+
+
+def unique_count(fingerprints: np.ndarray) -> int:
+    """不同指纹的个数"""
+    return int(len(pd.unique(fingerprints)))
@@ -0,0 +1,253 @@
+"""
+Excel解析结果的列式缓存
+按文件内容哈希将解析后的DataFrame保存为Feather旁路文件，避免重复解析同一个xlsx；
+读取时仍需把Arrow表转换为DataFrame（一次复制），省下的是Excel解析本身
+"""
+import os
+import hashlib
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+import pandas as pd
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # pyarrow为可选依赖，缺失时退回pickle
+    pa = None
+    feather = None
+
+CACHE_DIR_NAME = ".frame_cache"
+DEFAULT_MAX_BYTES = int(os.getenv("FRAME_CACHE_MAX_MB", "512")) * 1024 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+HASH_MEMO_SIZE = int(os.getenv("FRAME_CACHE_HASH_MEMO", "4096"))
+
+
+class FrameCache:
+    """
+    Excel解析结果缓存
+
+    - 缓存键为文件内容的SHA-256（加读取参数），内容变化自动失效
+    - 旁路文件写在源文件所在目录的 .frame_cache/ 下（uploads/、dataset/）
+    - 优先使用未压缩的Feather：内存映射读取后由 to_pandas 转换为DataFrame（会复制一次数据，不是零拷贝）
+    - pyarrow不可用，或存在Arrow无法表示的列（如同一列混有数字和文字）时退回pickle，并打印原因
+    - 每个缓存目录按总大小做LRU淘汰
+    - 文件哈希按 (路径, 大小, mtime) 记忆，最多保留 hash_memo_size 条（LRU）
+
+    Attributes:
+        max_bytes: 单个缓存目录允许的最大字节数
+        hash_memo_size: 文件哈希记忆的最大条数
+        hits: 命中次数
+        misses: 未命中次数
+        feather_writes: 写为Feather的次数
+        pickle_writes: 退回pickle的次数
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, hash_memo_size: int = HASH_MEMO_SIZE):
+        self.max_bytes = max_bytes
+        self.hash_memo_size = hash_memo_size
+        self.hits = 0
+        self.misses = 0
+        self.feather_writes = 0
+        self.pickle_writes = 0
+        self._hash_memo: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+        self._memo_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+    def file_hash(self, path: str) -> str:
+        """计算文件内容哈希，按 (路径, 大小, mtime) 记忆避免重复读盘"""
+        st = os.stat(path)
+        memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+        with self._memo_lock:
+            digest = self._hash_memo.get(memo_key)
+            if digest is not None:
+                self._hash_memo.move_to_end(memo_key)
+                return digest
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        self._memoize(memo_key, digest)
+        return digest
+
+    def remember_hash(self, path: str, digest: str):
+        """登记已知的文件哈希（例如上传时边写边算得到的哈希）"""
+        st = os.stat(path)
+        self._memoize((os.path.abspath(path), st.st_size, st.st_mtime_ns), digest)
+
+    def _memoize(self, memo_key: Tuple[str, int, int], digest: str):
+        with self._memo_lock:
+            self._hash_memo[memo_key] = digest
+            self._hash_memo.move_to_end(memo_key)
+            while len(self._hash_memo) > self.hash_memo_size:
+                self._hash_memo.popitem(last=False)
+
+    @staticmethod
+    def _cache_dir(path: str) -> str:
+        return os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR_NAME)
+
+    @staticmethod
+    def _kwargs_tag(kwargs: Dict[str, Any]) -> str:
+        if not kwargs:
+            return ""
+        text = repr(sorted(kwargs.items()))
+        return "-" + hashlib.md5(text.encode("utf-8")).hexdigest()[:8]
+
+    def _sidecar_paths(self, path: str, kwargs: Dict[str, Any]) -> Tuple[str, str]:
+        base = os.path.join(self._cache_dir(path), self.file_hash(path) + self._kwargs_tag(kwargs))
+        return base + ".feather", base + ".pkl"
+
+    def is_cached(self, path: str, **kwargs) -> bool:
+        """是否已有该文件（及读取参数）的缓存"""
+        try:
+            feather_path, pickle_path = self._sidecar_paths(path, kwargs)
+        except OSError:
+            return False
+        return (feather is not None and os.path.exists(feather_path)) or os.path.exists(pickle_path)
+
+    def read_excel(self, path: str, **kwargs) -> pd.DataFrame:
+        """
+        读取Excel，优先命中列式缓存
+
+        带 nrows 的预览读取不会写入缓存：已有完整缓存时直接切片返回，
+        否则走普通的 pd.read_excel（只解析前几行，本身很便宜）
+
+        Args:
+            path: Excel文件路径
+            **kwargs: 透传给 pd.read_excel 的参数
+
+        Returns:
+            pd.DataFrame: 解析结果
+        """
+        nrows = kwargs.pop("nrows", None)
+
+        cached = self._load(path, kwargs)
+        if cached is not None:
+            self.hits += 1
+            return cached.head(nrows) if nrows is not None else cached
+
+        if nrows is not None:
+            return pd.read_excel(path, nrows=nrows, **kwargs)
+
+        self.misses += 1
+        df = pd.read_excel(path, **kwargs)
+        self._store(path, kwargs, df)
+        return df
+
+    def _load(self, path: str, kwargs: Dict[str, Any]) -> Optional[pd.DataFrame]:
+        try:
+            feather_path, pickle_path = self._sidecar_paths(path, kwargs)
+        except OSError:
+            return None
+
+        try:
+            if feather is not None and os.path.exists(feather_path):
+                table = feather.read_table(feather_path, memory_map=True)
+                df = table.to_pandas()
+                os.utime(feather_path)
+                return self._restore_nan(df)
+            if os.path.exists(pickle_path):
+                df = pd.read_pickle(pickle_path)
+                os.utime(pickle_path)
+                return df
+        except Exception as e:
+            print(f"缓存读取失败，重新解析: {e}")
+        return None
+
+    def _store(self, path: str, kwargs: Dict[str, Any], df: pd.DataFrame):
+        try:
+            feather_path, pickle_path = self._sidecar_paths(path, kwargs)
+            cache_dir = os.path.dirname(feather_path)
+            os.makedirs(cache_dir, exist_ok=True)
+
+            written = None
+            if feather is None:
+                reason = "未安装pyarrow"
+            elif not df.columns.map(lambda c: isinstance(c, str)).all():
+                reason = "存在非字符串列名"
+            else:
+                try:
+                    table = pa.Table.from_pandas(df, preserve_index=False)
+                    tmp = feather_path + ".tmp"
+                    feather.write_feather(table, tmp, compression="uncompressed")
+                    os.replace(tmp, feather_path)
+                    written = feather_path
+                    self.feather_writes += 1
+                except (pa.ArrowException, ValueError, TypeError) as e:
+                    reason = str(e)
+
+            if written is None:
+                print(f"列式缓存退回pickle（{os.path.basename(path)}）: {reason}")
+                tmp = pickle_path + ".tmp"
+                with open(tmp, "wb") as f:
+                    pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, pickle_path)
+                self.pickle_writes += 1
+
+            self._evict(cache_dir)
+        except Exception as e:
+            print(f"缓存写入失败（不影响结果）: {e}")
+
+    @staticmethod
+    def _restore_nan(df: pd.DataFrame) -> pd.DataFrame:
+        """Arrow会把object列里的NaN还原成None，这里统一换回NaN，和read_excel保持一致"""
+        for col in df.columns:
+            if df[col].dtype == object:
+                s = df[col]
+                mask = s.isna()
+                if mask.any():
+                    df[col] = s.where(~mask, np.nan)
+        return df
+
+    def _evict(self, cache_dir: str):
+        """按最近访问时间淘汰，直到目录总大小不超过 max_bytes"""
+        with self._lock:
+            entries = []
+            total = 0
+            for name in os.listdir(cache_dir):
+                if name.endswith(".tmp"):
+                    continue
+                full = os.path.join(cache_dir, name)
+                try:
+                    st = os.stat(full)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, full))
+                total += st.st_size
+
+            entries.sort()
+            # 至少保留最新的一个文件
+            while total > self.max_bytes and len(entries) > 1:
+                _, size, full = entries.pop(0)
+                try:
+                    os.remove(full)
+                    total -= size
+                except OSError:
+                    pass
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存命中统计"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total * 100, 2) if total > 0 else 0,
+            "backend": "feather" if feather is not None else "pickle",
+            "feather_writes": self.feather_writes,
+            "pickle_writes": self.pickle_writes,
+            "hash_memo_entries": len(self._hash_memo),
+            "max_bytes": self.max_bytes
+        }
+
+
+# 全局缓存实例
+frame_cache = FrameCache()
+
+
+def read_excel_cached(path: str, **kwargs) -> pd.DataFrame:
+    """使用全局缓存读取Excel"""
+    return frame_cache.read_excel(path, **kwargs)
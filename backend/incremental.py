@@ -0,0 +1,179 @@
+"""
+增量处理账本
+逐日追加订单批次，只处理新批次；店铺/产品汇总按增量更新，重复订单号以新批次为准
+"""
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+import pandas as pd
+
+TOTAL_COLUMNS = ['revenue', 'cost', 'margin_sum', 'margin_n', 'lines', 'orders']
+
+
+def _contributions(df: pd.DataFrame, key_col: Optional[str], order_id_col: Optional[str]) -> pd.DataFrame:
+    """按键汇总一批已处理行的可加总量（收入、成本、毛利率之和与计数、行数、订单数）"""
+    if df.empty or key_col is None or key_col not in df.columns:
+        return pd.DataFrame(columns=TOTAL_COLUMNS)
+
+    revenue = pd.to_numeric(df['销售收入'], errors='coerce').fillna(0)
+    margin = pd.to_numeric(df['毛利率'], errors='coerce').fillna(0)
+    positive = revenue > 0
+    work = pd.DataFrame({
+        'revenue': revenue,
+        'cost': pd.to_numeric(df['总成本'], errors='coerce').fillna(0),
+        'margin_sum': margin.where(positive, 0.0),
+        'margin_n': positive.astype(int),
+    })
+    grouped = work.groupby(df[key_col].astype(object), sort=False)
+    result = grouped.sum()
+    result['lines'] = grouped.size()
+    # 同一订单只属于一个店铺，整单替换时订单数可直接加减
+    if order_id_col is not None and order_id_col in df.columns:
+        result['orders'] = df[order_id_col].astype(str).groupby(df[key_col].astype(object), sort=False).nunique()
+    else:
+        result['orders'] = 0
+    return result[TOTAL_COLUMNS]
+
+
+class DeltaLedger:
+    """
+    增量处理账本
+
+    以订单号为替换单位：新批次中出现过的订单号（无论清理后是否保留）会先把旧行及其汇总贡献扣除，
+    再加上新批次处理后的行，因此更正过的订单不会被重复计算。
+
+    Attributes:
+        order_id_col: 订单号列
+        shop_col: 店铺列
+        sku_col: 商品编码列
+        processed: 累计的已处理数据
+        shop_totals: 店铺汇总
+        product_totals: 产品汇总
+        batches: 各批次的增量信息
+    """
+
+    def __init__(self, order_id_col: Optional[str], shop_col: Optional[str], sku_col: Optional[str]):
+        self.order_id_col = order_id_col
+        self.shop_col = shop_col
+        self.sku_col = sku_col
+        self.processed = pd.DataFrame()
+        self.shop_totals = pd.DataFrame(columns=TOTAL_COLUMNS)
+        self.product_totals = pd.DataFrame(columns=TOTAL_COLUMNS)
+        self.batches: List[Dict[str, Any]] = []
+
+    def seen_order_ids(self) -> set:
+        """已入账的订单号"""
+        if self.processed.empty or self.order_id_col not in self.processed.columns:
+            return set()
+        return set(self.processed[self.order_id_col].astype(str).unique())
+
+    def apply(self, batch_processed: Optional[pd.DataFrame], batch_order_ids, source: str = "") -> Dict[str, Any]:
+        """
+        入账一个批次
+
+        Args:
+            batch_processed: 新批次处理后的数据（清理后为空时可为None）
+            batch_order_ids: 新批次原始数据中的全部订单号
+            source: 批次来源文件名
+
+        Returns:
+            Dict[str, Any]: 本批次的增量信息
+        """
+        batch_ids = pd.Index(pd.Series(list(batch_order_ids), dtype=object).astype(str).unique())
+        removed = pd.DataFrame()
+        if not self.processed.empty and self.order_id_col in self.processed.columns:
+            replaced_mask = self.processed[self.order_id_col].astype(str).isin(batch_ids).to_numpy()
+            if replaced_mask.any():
+                removed = self.processed[replaced_mask]
+                self.processed = self.processed[~replaced_mask]
+
+        added = batch_processed if batch_processed is not None else pd.DataFrame()
+
+        self.shop_totals = self._update(self.shop_totals, removed, added, self.shop_col)
+        self.product_totals = self._update(self.product_totals, removed, added, self.sku_col)
+
+        if not added.empty:
+            self.processed = pd.concat([self.processed, added], ignore_index=True) if not self.processed.empty else added.reset_index(drop=True)
+        else:
+            self.processed = self.processed.reset_index(drop=True)
+
+        replaced_orders = int(removed[self.order_id_col].astype(str).nunique()) if not removed.empty else 0
+        info = {
+            'batch': len(self.batches) + 1,
+            'source': source,
+            'added_lines': int(len(added)),
+            'removed_lines': int(len(removed)),
+            'replaced_orders': replaced_orders,
+            'total_lines': int(len(self.processed)),
+            'applied_time': datetime.now().isoformat()
+        }
+        self.batches.append(info)
+        return info
+
+    def _update(self, totals: pd.DataFrame, removed: pd.DataFrame, added: pd.DataFrame,
+                key_col: Optional[str]) -> pd.DataFrame:
+        """汇总表 = 旧汇总 - 被替换行的贡献 + 新增行的贡献"""
+        if not removed.empty:
+            totals = totals.sub(_contributions(removed, key_col, self.order_id_col), fill_value=0)
+        if not added.empty:
+            totals = totals.add(_contributions(added, key_col, self.order_id_col), fill_value=0)
+        totals = totals[totals['lines'] > 0] if not totals.empty else totals
+        return totals.astype(float)
+
+    def _selected_shop_totals(self, selected_shops: Optional[List[str]]) -> pd.DataFrame:
+        totals = self.shop_totals
+        if selected_shops:
+            totals = totals[totals.index.isin(selected_shops)]
+        return totals
+
+    def shop_analysis(self, selected_shops: Optional[List[str]] = None) -> Dict[str, Any]:
+        """店铺分析，结构与 UploadProcessor.analyze_by_shop 相同"""
+        out = {}
+        for shop, row in self._selected_shop_totals(selected_shops).iterrows():
+            revenue, cost = float(row['revenue']), float(row['cost'])
+            out[str(shop)] = {
+                'shop_name': str(shop),
+                'total_orders': int(row['lines']),
+                'total_cost': cost,
+                'total_revenue': revenue,
+                'total_profit': round(revenue - cost, 2),
+                'avg_margin': float(row['margin_sum'] / row['margin_n']) if revenue > 0 and row['margin_n'] > 0 else 0.0
+            }
+        return out
+
+    def summary(self, selected_shops: Optional[List[str]] = None) -> Dict[str, Any]:
+        """汇总统计，结构与 UploadProcessor.get_summary_statistics 相同"""
+        totals = self._selected_shop_totals(selected_shops)
+        if totals.empty:
+            return {}
+        revenue, cost = float(totals['revenue'].sum()), float(totals['cost'].sum())
+        margin_n = float(totals['margin_n'].sum())
+        return {
+            'total_records': int(totals['lines'].sum()),
+            'total_shops': int(len(totals)),
+            'total_cost': cost,
+            'total_revenue': revenue,
+            'total_profit': round(revenue - cost, 2),
+            'avg_margin': float(totals['margin_sum'].sum() / margin_n) if revenue > 0 and margin_n > 0 else 0.0
+        }
+
+    def product_analysis(self) -> Dict[str, Any]:
+        """按商品编码的增量汇总"""
+        out = {}
+        for sku, row in self.product_totals.iterrows():
+            revenue, cost = float(row['revenue']), float(row['cost'])
+            out[str(sku)] = {
+                'sku': str(sku),
+                'total_lines': int(row['lines']),
+                'total_orders': int(row['orders']),
+                'total_cost': cost,
+                'total_revenue': revenue,
+                'total_profit': round(revenue - cost, 2)
+            }
+        return out
+
+    def rows(self, selected_shops: Optional[List[str]] = None) -> pd.DataFrame:
+        """累计的已处理数据（可按店铺筛选）"""
+        if selected_shops and self.shop_col in self.processed.columns:
+            return self.processed[self.processed[self.shop_col].isin(selected_shops)].reset_index(drop=True)
+        return self.processed
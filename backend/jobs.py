@@ -0,0 +1,208 @@
+"""
+后台任务队列
+数据处理与导出在进程池中执行，接口立即返回任务ID，通过任务ID查询状态、进度和结果
+"""
+import os
+import uuid
+import threading
+import traceback
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, Optional, Callable
+
+DEFAULT_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+MAX_FINISHED_JOBS = 200
+
+# 工作进程内的进度队列，由进程池初始化函数设置
+_progress_queue = None
+
+
+def _init_worker(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def report_progress(job_id: str, stage: str, progress: float):
+    """
+    在工作进程中上报任务进度
+
+    Args:
+        job_id: 任务ID
+        stage: 当前阶段说明
+        progress: 进度（0~1）
+    """
+    if _progress_queue is not None:
+        _progress_queue.put((job_id, stage, float(progress)))
+
+
+def _run_job(fn: Callable, job_id: str, args: tuple):
+    """工作进程入口：先上报开始，再执行任务函数"""
+    report_progress(job_id, "started", 0.0)
+    return fn(job_id, *args)
+
+
+class JobManager:
+    """
+    进程池任务管理器
+
+    任务函数必须是模块级函数（可被pickle），第一个参数为任务ID，可调用 report_progress 上报进度。
+    进程池在首次提交任务时创建；完成的任务只保留最近 MAX_FINISHED_JOBS 个。
+
+    Attributes:
+        max_workers: 工作进程数
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_WORKERS):
+        self.max_workers = max(1, max_workers)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._progress_queue = None
+        self._listener: Optional[threading.Thread] = None
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._results: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+
+    def _ensure_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._progress_queue = multiprocessing.Queue()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=_init_worker,
+                initargs=(self._progress_queue,)
+            )
+            self._listener = threading.Thread(target=self._listen_progress, daemon=True)
+            self._listener.start()
+        return self._executor
+
+    def _listen_progress(self):
+        """把工作进程上报的进度写回任务状态"""
+        while True:
+            try:
+                item = self._progress_queue.get()
+            except (EOFError, OSError, ValueError):
+                return
+            if item is None:
+                return
+            job_id, stage, progress = item
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None or job['status'] in ('succeeded', 'failed'):
+                    continue
+                if job['status'] == 'queued':
+                    job['status'] = 'running'
+                    job['started_time'] = datetime.now().isoformat()
+                job['stage'] = stage
+                job['progress'] = round(progress, 4)
+
+    def submit(self, kind: str, fn: Callable, *args,
+               on_done: Optional[Callable[[Any], Any]] = None) -> str:
+        """
+        提交任务
+
+        Args:
+            kind: 任务类型（process / export ...）
+            fn: 模块级任务函数，签名为 fn(job_id, *args)
+            *args: 任务参数（需可pickle）
+            on_done: 任务成功后在主进程中调用，参数为任务返回值，返回值作为任务结果保存
+
+        Returns:
+            str: 任务ID
+        """
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._jobs[job_id] = {
+                'job_id': job_id,
+                'kind': kind,
+                'status': 'queued',
+                'stage': 'queued',
+                'progress': 0.0,
+                'error': None,
+                'created_time': datetime.now().isoformat(),
+                'started_time': None,
+                'finished_time': None
+            }
+        future = self._ensure_executor().submit(_run_job, fn, job_id, args)
+        future.add_done_callback(lambda f: self._finish(job_id, f, on_done))
+        return job_id
+
+    def _finish(self, job_id: str, future, on_done: Optional[Callable[[Any], Any]]):
+        error = None
+        result = None
+        try:
+            result = future.result()
+            if on_done is not None:
+                result = on_done(result)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            print(f"任务 {job_id} 失败: {error}")
+            traceback.print_exc()
+
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job['finished_time'] = datetime.now().isoformat()
+            if error is None:
+                job['status'] = 'succeeded'
+                job['stage'] = 'done'
+                job['progress'] = 1.0
+                self._results[job_id] = result
+                self.completed += 1
+            else:
+                job['status'] = 'failed'
+                job['error'] = error
+                self.failed += 1
+            self._trim()
+
+    def _trim(self):
+        """只保留最近的已完成任务"""
+        finished = [jid for jid, job in self._jobs.items() if job['status'] in ('succeeded', 'failed')]
+        for jid in finished[:-MAX_FINISHED_JOBS]:
+            self._jobs.pop(jid, None)
+            self._results.pop(jid, None)
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """任务状态，任务不存在时返回None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def result(self, job_id: str) -> Any:
+        """任务结果，未完成或失败时为None"""
+        with self._lock:
+            return self._results.get(job_id)
+
+    def metrics(self) -> Dict[str, Any]:
+        """队列指标"""
+        with self._lock:
+            statuses = [job['status'] for job in self._jobs.values()]
+        queued = statuses.count('queued')
+        running = statuses.count('running')
+        return {
+            'workers': self.max_workers,
+            'queue_depth': queued,
+            'running': running,
+            'in_flight': queued + running,
+            'completed': self.completed,
+            'failed': self.failed,
+            'tracked_jobs': len(statuses)
+        }
+
+    def shutdown(self):
+        """关闭进程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._progress_queue is not None:
+            try:
+                self._progress_queue.put(None)
+            except (OSError, ValueError):
+                pass
+            self._progress_queue = None
+
+
+# 全局任务管理器
+job_manager = JobManager()
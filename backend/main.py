@@ -1,4 +1,4 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
@@ -10,8 +10,14 @@ from jose import JWTError, jwt
 from passlib.context import CryptContext
 from dotenv import load_dotenv
 import json
-from data_processor import DataProcessor
+from data_processor import DataProcessor, run_dataset_process_job, run_dataset_export_job
+from exporters import EXPORT_FORMATS, export_path
 from data_analyzer import DataAnalyzer
+from frame_cache import read_excel_cached
+from serialization import FastJSONResponse, frame_records
+from jobs import job_manager
+from metrics import install as install_metrics, metrics_registry
+from starlette.concurrency import run_in_threadpool
 
 load_dotenv()
 
@@ -23,7 +29,8 @@ ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
 app = FastAPI(
     title="京东店铺数据管理API",
     description="京东店铺数据处理与分析管理后端API",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
 # CORS中间件
@@ -35,6 +42,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# /metrics（Prometheus）与重接口的请求耗时
+install_metrics(app, [
+    "/data/preview/{filename}", "/data/analyze/{filename}", "/v2/data/analyze/{filename}", "/data/process", "/data/export",
+    "/data/cube", "/jobs/process", "/jobs/export", "/jobs/{job_id}/result"
+])
+
 # 安全配置
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -65,6 +78,9 @@ class DataProcessRequest(BaseModel):
     include_closed_orders: bool = False
     include_offline_orders: bool = False
 
+class ExportRequest(DataProcessRequest):
+    export_format: str = "xlsx"  # xlsx / csv.gz / parquet
+
 # 模拟用户数据库（实际项目中应使用真实数据库）
 fake_users_db = {
     "admin": {
@@ -188,7 +204,7 @@ async def preview_excel_file(filename: str, current_user: UserInDB = Depends(get
 
     try:
         # 读取Excel文件的前10行作为预览
-        df = pd.read_excel(file_path, nrows=10)
+        df = read_excel_cached(file_path, nrows=10)
 
         # 转换为JSON格式
         preview_data = {
@@ -213,7 +229,7 @@ async def analyze_excel_file(filename: str, current_user: UserInDB = Depends(get
         raise HTTPException(status_code=404, detail="文件不存在")
 
     try:
-        df = pd.read_excel(file_path)
+        df = await run_in_threadpool(read_excel_cached, file_path)
 
         analysis = {
             "basic_info": {
@@ -232,7 +248,37 @@ async def analyze_excel_file(filename: str, current_user: UserInDB = Depends(get
         if len(numeric_columns) > 0:
             analysis["numeric_summary"] = df[numeric_columns].describe().to_dict()
 
-        return analysis
+        return FastJSONResponse(analysis)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"分析文件错误: {str(e)}")
+
+@app.get("/v2/data/analyze/{filename}")
+async def analyze_excel_file_v2(filename: str, current_user: UserInDB = Depends(get_current_user)):
+    """分析Excel文件数据（v2：不整表载入，返回单次流式扫描的列概况及误差说明）"""
+    file_path = f"../dataset/{filename}"
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="文件不存在")
+
+    try:
+        # 单次流式扫描：空值数和均值/方差为精确值，去重数和分位数为估计值（误差见 error_bounds）
+        profile = await run_in_threadpool(DataAnalyzer.profile_file, file_path)
+        columns = profile["columns"]
+
+        analysis = {
+            "basic_info": {
+                "total_rows": profile["rows_scanned"],
+                "total_columns": len(columns),
+                "columns": list(columns),
+                "truncated": profile["truncated"]
+            },
+            "data_types": {col: info["dtype"] for col, info in columns.items()},
+            "null_counts": {col: info["null_count"] for col, info in columns.items()},
+            "unique_counts": {col: info["distinct"] for col, info in columns.items()},
+            "numeric_summary": {col: info["numeric"] for col, info in columns.items() if "numeric" in info},
+            "error_bounds": profile["error_bounds"]
+        }
+
+        return FastJSONResponse(analysis)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"分析文件错误: {str(e)}")
 
@@ -250,6 +296,34 @@ async def get_available_shops(current_user: UserInDB = Depends(get_current_user)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取店铺列表失败: {str(e)}")
 
+def process_response(processed_df: pd.DataFrame, analysis: dict) -> dict:
+    """/data/process 与处理任务结果的返回结构"""
+    if processed_df.empty:
+        return {
+            "success": False,
+            "message": "没有找到符合条件的数据",
+            "data": {},
+            "analysis": {}
+        }
+
+    # 转换DataFrame为JSON格式
+    data_records = frame_records(processed_df.head(100))  # 限制返回前100条
+
+    return {
+        "success": True,
+        "message": f"数据处理完成，共处理 {len(processed_df)} 条记录",
+        "data": {
+            "records": data_records,
+            "total_records": len(processed_df),
+            "columns": processed_df.columns.tolist()
+        },
+        "analysis": analysis
+    }
+
+@app.on_event("shutdown")
+async def shutdown_jobs():
+    job_manager.shutdown()
+
 @app.post("/data/process")
 async def process_data(
     request: DataProcessRequest,
@@ -263,29 +337,9 @@ async def process_data(
             'include_offline_orders': request.include_offline_orders
         }
 
-        processed_df, analysis = processor.process_data(filter_options)
-
-        if processed_df.empty:
-            return {
-                "success": False,
-                "message": "没有找到符合条件的数据",
-                "data": {},
-                "analysis": {}
-            }
-
-        # 转换DataFrame为JSON格式
-        data_records = processed_df.head(100).to_dict('records')  # 限制返回前100条
-
-        return {
-            "success": True,
-            "message": f"数据处理完成，共处理 {len(processed_df)} 条记录",
-            "data": {
-                "records": data_records,
-                "total_records": len(processed_df),
-                "columns": processed_df.columns.tolist()
-            },
-            "analysis": analysis
-        }
+        # 处理在线程池中执行，不阻塞事件循环
+        processed_df, analysis = await run_in_threadpool(processor.process_data, filter_options)
+        return FastJSONResponse(process_response(processed_df, analysis))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"数据处理失败: {str(e)}")
 
@@ -307,9 +361,39 @@ async def get_order_status_analysis(current_user: UserInDB = Depends(get_current
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"订单状态分析失败: {str(e)}")
 
+@app.get("/data/cube")
+async def query_cube(
+    by: Optional[List[str]] = Query(None, description="分组维度 shop / product / day，可重复，不传为总计"),
+    shops: Optional[List[str]] = Query(None, description="店铺筛选"),
+    products: Optional[List[str]] = Query(None, description="商品编码筛选"),
+    day_from: Optional[str] = Query(None, description="起始日期 YYYY-MM-DD（含）"),
+    day_to: Optional[str] = Query(None, description="结束日期 YYYY-MM-DD（含）"),
+    sort_by: Optional[str] = Query(None, description="排序指标或维度"),
+    descending: bool = Query(True),
+    limit: Optional[int] = Query(None, ge=1),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """从最近一次处理结果的聚合立方体按任意粗粒度汇总，不访问明细"""
+    cube = await run_in_threadpool(processor.get_cube)
+    if cube is None:
+        raise HTTPException(status_code=400, detail="请先处理数据")
+    try:
+        return FastJSONResponse(cube.query(by or [], shops=shops, products=products, day_from=day_from,
+                                           day_to=day_to, sort_by=sort_by, descending=descending, limit=limit))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/data/cube/info")
+async def get_cube_info(current_user: UserInDB = Depends(get_current_user)):
+    """聚合立方体规模"""
+    cube = await run_in_threadpool(processor.get_cube)
+    if cube is None:
+        raise HTTPException(status_code=400, detail="请先处理数据")
+    return cube.info()
+
 @app.post("/data/export")
 async def export_processed_data(
-    request: DataProcessRequest,
+    request: ExportRequest,
     current_user: UserInDB = Depends(get_current_user)
 ):
     """导出处理后的数据"""
@@ -320,30 +404,109 @@ async def export_processed_data(
             'include_offline_orders': request.include_offline_orders
         }
 
-        processed_df, analysis = processor.process_data(filter_options)
+        processed_df, analysis = await run_in_threadpool(processor.process_data, filter_options)
 
         if processed_df.empty:
             raise HTTPException(status_code=400, detail="没有数据可以导出")
 
+        if request.export_format not in EXPORT_FORMATS:
+            raise HTTPException(status_code=400, detail=f"不支持的导出格式: {request.export_format}")
+
         # 生成导出文件名
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"processed_data_{timestamp}.xlsx"
+        filename = export_path("", f"processed_data_{timestamp}", request.export_format)
 
-        success = processor.export_processed_data(filename)
+        success = await run_in_threadpool(processor.export_processed_data, filename, request.export_format)
 
         if success:
             return {
                 "success": True,
                 "message": "数据导出成功",
                 "filename": filename,
-                "records_count": len(processed_df)
+                "records_count": len(processed_df),
+                "export_stats": processor.export_stats
             }
         else:
             raise HTTPException(status_code=500, detail="数据导出失败")
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"导出失败: {str(e)}")
 
+@app.post("/jobs/process")
+async def submit_process_job(
+    request: DataProcessRequest,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """提交后台处理任务，立即返回任务ID"""
+    filter_options = {
+        'selected_shops': request.selected_shops,
+        'include_closed_orders': request.include_closed_orders,
+        'include_offline_orders': request.include_offline_orders
+    }
+
+    def on_done(result):
+        processed_df, analysis = result
+        processor.processed_data = processed_df
+        # 任务在工作进程中执行，阶段指标在主进程补记
+        metrics_registry.record_report(analysis.get('processing_info'))
+        return process_response(processed_df, analysis)
+
+    job_id = job_manager.submit("process", run_dataset_process_job, processor.dataset_path,
+                                filter_options, on_done=on_done)
+    return {"success": True, "job_id": job_id, "status_url": f"/jobs/{job_id}"}
+
+@app.post("/jobs/export")
+async def submit_export_job(
+    request: ExportRequest,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """提交后台导出任务，立即返回任务ID"""
+    if request.export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的导出格式: {request.export_format}")
+
+    filter_options = {
+        'selected_shops': request.selected_shops,
+        'include_closed_orders': request.include_closed_orders,
+        'include_offline_orders': request.include_offline_orders
+    }
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = export_path("", f"processed_data_{timestamp}_{os.urandom(3).hex()}", request.export_format)
+
+    def on_done(result):
+        metrics_registry.record_report(result.pop('processing_info', None))
+        return {"success": True, "message": "数据导出成功", **result}
+
+    job_id = job_manager.submit("export", run_dataset_export_job, processor.dataset_path,
+                                filter_options, filename, request.export_format, on_done=on_done)
+    return {"success": True, "job_id": job_id, "status_url": f"/jobs/{job_id}"}
+
+@app.get("/jobs/metrics")
+async def get_job_metrics(current_user: UserInDB = Depends(get_current_user)):
+    """任务队列指标（工作进程数、排队数、运行数、完成/失败数）"""
+    return job_manager.metrics()
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str, current_user: UserInDB = Depends(get_current_user)):
+    """任务状态与进度"""
+    job = job_manager.status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str, current_user: UserInDB = Depends(get_current_user)):
+    """任务结果；未完成时返回409"""
+    job = job_manager.status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if job['status'] == 'failed':
+        raise HTTPException(status_code=500, detail=f"任务失败: {job['error']}")
+    if job['status'] != 'succeeded':
+        raise HTTPException(status_code=409, detail=f"任务尚未完成: {job['status']}")
+    return FastJSONResponse(job_manager.result(job_id))
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
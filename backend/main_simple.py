@@ -1,20 +1,25 @@
 """
 简化版京东店铺数据管理API - 无需登录
 """
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional, List
-import pandas as pd
 import os
 from datetime import datetime
 from data_processor import DataProcessor
+from exporters import EXPORT_FORMATS, export_path
 from data_analyzer import DataAnalyzer
+from frame_cache import read_excel_cached
+from serialization import FastJSONResponse, frame_records
+from metrics import install as install_metrics
+from starlette.concurrency import run_in_threadpool
 
 app = FastAPI(
     title="京东店铺数据管理API",
     description="京东店铺数据处理与分析管理后端API（简化版）",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
 # CORS中间件
@@ -26,12 +31,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# /metrics（Prometheus）与重接口的请求耗时
+install_metrics(app, [
+    "/data/preview/{filename}", "/data/analyze/{filename}", "/v2/data/analyze/{filename}", "/data/process", "/data/export", "/data/cube"
+])
+
 # Pydantic模型
 class DataProcessRequest(BaseModel):
     selected_shops: Optional[List[str]] = None
     include_closed_orders: bool = False
     include_offline_orders: bool = False
 
+class ExportRequest(DataProcessRequest):
+    export_format: str = "xlsx"  # xlsx / csv.gz / parquet
+
 # 初始化数据处理器
 processor = DataProcessor()
 analyzer = DataAnalyzer()
@@ -91,7 +104,7 @@ async def process_data(request: DataProcessRequest):
             }
 
         # 转换DataFrame为JSON格式
-        data_records = processed_df.head(100).to_dict('records')  # 限制返回前100条
+        data_records = frame_records(processed_df.head(100))  # 限制返回前100条
 
         return {
             "success": True,
@@ -124,8 +137,37 @@ async def get_order_status_analysis():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"订单状态分析失败: {str(e)}")
 
+@app.get("/data/cube")
+async def query_cube(
+    by: Optional[List[str]] = Query(None, description="分组维度 shop / product / day，可重复，不传为总计"),
+    shops: Optional[List[str]] = Query(None, description="店铺筛选"),
+    products: Optional[List[str]] = Query(None, description="商品编码筛选"),
+    day_from: Optional[str] = Query(None, description="起始日期 YYYY-MM-DD（含）"),
+    day_to: Optional[str] = Query(None, description="结束日期 YYYY-MM-DD（含）"),
+    sort_by: Optional[str] = Query(None, description="排序指标或维度"),
+    descending: bool = Query(True),
+    limit: Optional[int] = Query(None, ge=1)
+):
+    """从最近一次处理结果的聚合立方体按任意粗粒度汇总，不访问明细"""
+    cube = await run_in_threadpool(processor.get_cube)
+    if cube is None:
+        raise HTTPException(status_code=400, detail="请先处理数据")
+    try:
+        return FastJSONResponse(cube.query(by or [], shops=shops, products=products, day_from=day_from,
+                                           day_to=day_to, sort_by=sort_by, descending=descending, limit=limit))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/data/cube/info")
+async def get_cube_info():
+    """聚合立方体规模"""
+    cube = await run_in_threadpool(processor.get_cube)
+    if cube is None:
+        raise HTTPException(status_code=400, detail="请先处理数据")
+    return cube.info()
+
 @app.post("/data/export")
-async def export_processed_data(request: DataProcessRequest):
+async def export_processed_data(request: ExportRequest):
     """导出处理后的数据"""
     try:
         filter_options = {
@@ -139,22 +181,28 @@ async def export_processed_data(request: DataProcessRequest):
         if processed_df.empty:
             raise HTTPException(status_code=400, detail="没有数据可以导出")
 
+        if request.export_format not in EXPORT_FORMATS:
+            raise HTTPException(status_code=400, detail=f"不支持的导出格式: {request.export_format}")
+
         # 生成导出文件名
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"processed_data_{timestamp}.xlsx"
+        filename = export_path("", f"processed_data_{timestamp}", request.export_format)
 
-        success = processor.export_processed_data(filename)
+        success = processor.export_processed_data(filename, request.export_format)
 
         if success:
             return {
                 "success": True,
                 "message": "数据导出成功",
                 "filename": filename,
-                "records_count": len(processed_df)
+                "records_count": len(processed_df),
+                "export_stats": processor.export_stats
             }
         else:
             raise HTTPException(status_code=500, detail="数据导出失败")
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"导出失败: {str(e)}")
 
@@ -167,7 +215,7 @@ async def preview_excel_file(filename: str):
 
     try:
         # 读取Excel文件的前10行作为预览
-        df = pd.read_excel(file_path, nrows=10)
+        df = read_excel_cached(file_path, nrows=10)
 
         # 转换为JSON格式
         preview_data = {
@@ -192,7 +240,7 @@ async def analyze_excel_file(filename: str):
         raise HTTPException(status_code=404, detail="文件不存在")
 
     try:
-        df = pd.read_excel(file_path)
+        df = await run_in_threadpool(read_excel_cached, file_path)
 
         analysis = {
             "basic_info": {
@@ -211,7 +259,37 @@ async def analyze_excel_file(filename: str):
         if len(numeric_columns) > 0:
             analysis["numeric_summary"] = df[numeric_columns].describe().to_dict()
 
-        return analysis
+        return FastJSONResponse(analysis)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"分析文件错误: {str(e)}")
+
+@app.get("/v2/data/analyze/{filename}")
+async def analyze_excel_file_v2(filename: str):
+    """分析Excel文件数据（v2：不整表载入，返回单次流式扫描的列概况及误差说明）"""
+    file_path = f"../dataset/{filename}"
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="文件不存在")
+
+    try:
+        # 单次流式扫描：空值数和均值/方差为精确值，去重数和分位数为估计值（误差见 error_bounds）
+        profile = await run_in_threadpool(DataAnalyzer.profile_file, file_path)
+        columns = profile["columns"]
+
+        analysis = {
+            "basic_info": {
+                "total_rows": profile["rows_scanned"],
+                "total_columns": len(columns),
+                "columns": list(columns),
+                "truncated": profile["truncated"]
+            },
+            "data_types": {col: info["dtype"] for col, info in columns.items()},
+            "null_counts": {col: info["null_count"] for col, info in columns.items()},
+            "unique_counts": {col: info["distinct"] for col, info in columns.items()},
+            "numeric_summary": {col: info["numeric"] for col, info in columns.items() if "numeric" in info},
+            "error_bounds": profile["error_bounds"]
+        }
+
+        return FastJSONResponse(analysis)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"分析文件错误: {str(e)}")
 
@@ -1,21 +1,33 @@
 """
 文件上传版京东店铺数据管理API
 """
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Header, Cookie, Depends, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional, List
 import os
-import shutil
+import time
 from datetime import datetime
 import tempfile
-from upload_processor import UploadProcessor
+import pandas as pd
+from upload_processor import UploadProcessor, run_process_job, run_export_job
+from catalog_index import catalog_store
+from result_cache import ResultCache
+from exporters import EXPORT_FORMATS, MEDIA_TYPES, export_format, export_frames, export_path
+from jobs import job_manager
+from sessions import session_registry, DEFAULT_EXPIRE_SECONDS
+from pagination import record_pager, parse_where, DEFAULT_PAGE_SIZE
+from serialization import FastJSONResponse, frame_records
+from upload_store import UploadStore
+from metrics import install as install_metrics, metrics_registry
 
 app = FastAPI(
     title="JD Shop Data Management API",
     description="支持文件上传的京东店铺数据处理与分析API",
-    version="2.0.0"
+    version="2.0.0",
+    default_response_class=FastJSONResponse
 )
 
 # CORS中间件 - 注释掉，由nginx处理
@@ -34,20 +46,125 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# /metrics（Prometheus）与重接口的请求耗时
+install_metrics(app, [
+    "/upload/files", "/upload/append", "/data/process", "/data/export", "/data/records",
+    "/data/records/stream", "/cube/query", "/jobs/process", "/jobs/export", "/jobs/{job_id}/result",
+    "/download/{filename}"
+])
+
 # 创建上传目录
 UPLOAD_DIR = "uploads"
 EXPORT_DIR = "exports"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(EXPORT_DIR, exist_ok=True)
 
+# 上传文件按内容哈希存储，重复上传同一文件时复用已保存的文件及其解析缓存
+upload_store = UploadStore(UPLOAD_DIR)
+
+# 上传时把会话ID写入 HttpOnly Cookie，管理后台的页面无需自行保存和携带会话ID
+SESSION_COOKIE = "jd_session_id"
+
 # Pydantic模型
 class DataProcessRequest(BaseModel):
     selected_shops: Optional[List[str]] = None
     include_closed_orders: bool = False
     include_offline_orders: bool = False
 
-# 全局处理器实例
-current_processor = None
+class ExportRequest(DataProcessRequest):
+    export_format: str = "xlsx"  # xlsx / csv.gz / parquet
+
+class ColumnMappingRequest(BaseModel):
+    order_id: Optional[str] = None
+    shop: Optional[str] = None
+    amount: Optional[str] = None
+    mark: Optional[str] = None
+    sku: Optional[str] = None
+    spec: Optional[str] = None
+    date: Optional[str] = None
+    status: Optional[List[str]] = None
+    order_sku_candidates: Optional[List[str]] = None
+    product_sku_candidates: Optional[List[str]] = None
+    product_cost: Optional[str] = None
+    quantity: Optional[str] = None
+    revenue: Optional[str] = None
+
+def session_processor(
+    x_session_id: Optional[str] = Header(None, description="上传时返回的会话ID；不传时使用上传时设置的会话Cookie"),
+    session_cookie: Optional[str] = Cookie(None, alias=SESSION_COOKIE)
+):
+    """按会话ID（请求头优先，其次Cookie）取处理器并在请求期间固定会话；请求结束后解除固定并更新会话内存占用"""
+    session_id = x_session_id or session_cookie
+    if not session_id:
+        raise HTTPException(status_code=400, detail="缺少会话ID，请先上传文件（或通过 X-Session-Id 请求头传入 session_id）")
+    processor = session_registry.acquire(session_id)
+    if processor is None:
+        raise HTTPException(status_code=400, detail="会话不存在或已过期，请重新上传文件")
+    try:
+        yield processor
+    finally:
+        session_registry.release(session_id)
+
+# 处理结果缓存
+result_cache = ResultCache()
+
+def process_with_cache(processor: UploadProcessor, filter_options: dict, make_current: bool = True):
+    """
+    按 (数据指纹, 处理参数) 复用处理结果
+
+    Args:
+        processor: 会话的处理器
+        filter_options: 处理参数
+        make_current: 命中缓存时是否同步为处理器的当前结果（/data/records 等接口读取的结果）
+
+    Returns:
+        Tuple[pd.DataFrame, dict]: 处理后的数据和分析结果
+    """
+    key = result_cache.make_key(processor.dataset_fingerprint(), filter_options)
+    cached = result_cache.get(key)
+    if cached is not None:
+        if make_current:
+            processor.processed_data = cached[0]
+        return cached
+
+    processed_df, analysis = processor.process_data(filter_options)
+    result_cache.put(key, processed_df, analysis)
+    return processed_df, analysis
+
+def _filter_options(request: DataProcessRequest) -> dict:
+    return {
+        'selected_shops': request.selected_shops,
+        'include_closed_orders': request.include_closed_orders,
+        'include_offline_orders': request.include_offline_orders
+    }
+
+def process_response(processed_df: pd.DataFrame, analysis: dict) -> dict:
+    """/data/process 与处理任务结果的返回结构"""
+    if processed_df.empty:
+        return {
+            "success": False,
+            "message": "没有找到符合条件的数据",
+            "data": {},
+            "analysis": {}
+        }
+
+    # 转换DataFrame为JSON格式，限制返回条数；缺失值按列置0
+    data_records = frame_records(processed_df.head(100), na_value=0)
+
+    return {
+        "success": True,
+        "message": f"数据处理完成，共处理 {len(processed_df)} 条记录",
+        "data": {
+            "records": data_records,
+            "total_records": len(processed_df),
+            "columns": processed_df.columns.tolist()
+        },
+        "analysis": analysis
+    }
+
+@app.on_event("shutdown")
+async def shutdown_jobs():
+    job_manager.shutdown()
 
 @app.get("/")
 async def root():
@@ -60,160 +177,376 @@ async def options_upload_files():
 
 @app.post("/upload/files")
 async def upload_files(
-    product_file: UploadFile = File(..., description="产品信息表Excel文件"),
-    order_file: UploadFile = File(..., description="订单信息表Excel文件")
+    response: Response,
+    product_file: Optional[UploadFile] = File(None, description="产品信息表Excel文件，不传时复用最近一次的产品目录"),
+    order_file: UploadFile = File(..., description="订单信息表Excel文件"),
+    streaming: bool = Form(False, description="流式模式：原始订单表不整体载入内存，处理时按块读取（处理结果仍整体保存在内存中）")
 ):
-    """上传产品和订单Excel文件"""
-    global current_processor
-
+    """上传产品和订单Excel文件，返回会话ID"""
+    upload_start = time.perf_counter()
     try:
         # 验证文件类型
-        if not product_file.filename.endswith(('.xlsx', '.xls')):
+        if product_file is not None and not product_file.filename.endswith(('.xlsx', '.xls')):
             raise HTTPException(status_code=400, detail="产品文件必须是Excel格式")
 
         if not order_file.filename.endswith(('.xlsx', '.xls')):
             raise HTTPException(status_code=400, detail="订单文件必须是Excel格式")
 
-        # 生成唯一文件名
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        product_filename = f"product_{timestamp}_{product_file.filename}"
-        order_filename = f"order_{timestamp}_{order_file.filename}"
-
-        # 保存文件
-        product_path = os.path.join(UPLOAD_DIR, product_filename)
-        order_path = os.path.join(UPLOAD_DIR, order_filename)
-
-        with open(product_path, "wb") as buffer:
-            shutil.copyfileobj(product_file.file, buffer)
-
-        with open(order_path, "wb") as buffer:
-            shutil.copyfileobj(order_file.file, buffer)
-
-        # 初始化处理器并加载数据
-        current_processor = UploadProcessor()
-        success = current_processor.load_from_files(product_path, order_path)
+        # 按块写盘并计算哈希，以内容哈希命名
+        product_saved = None
+        if product_file is not None:
+            product_saved = await run_in_threadpool(upload_store.save, product_file.file, "product", product_file.filename)
+        order_saved = await run_in_threadpool(upload_store.save, order_file.file, "order", order_file.filename)
+
+        product_path = product_saved["path"] if product_saved else None
+        product_filename = product_saved["filename"] if product_saved else None
+        order_path = order_saved["path"]
+        order_filename = order_saved["filename"]
+
+        # 初始化处理器并加载数据（两个文件在工作进程中并行解析）
+        processor = UploadProcessor()
+        if streaming:
+            if product_path:
+                success = await run_in_threadpool(processor.load_product_file, product_path)
+            else:
+                success = processor.load_latest_catalog()
+            processor.order_file_path = order_path
+        else:
+            success = await run_in_threadpool(processor.load_from_files, product_path, order_path)
 
         if not success:
             raise HTTPException(status_code=500, detail="文件加载失败")
 
+        # 每个文件从上传到可用的耗时 = 写盘 + 解析/加载
+        timings = {'parallel_parse': processor.load_report.get('parallel_parse', False)}
+        for name, saved in (('product', product_saved), ('order', order_saved)):
+            report = dict(processor.load_report.get(name) or {})
+            if saved is not None:
+                report['save_seconds'] = saved['seconds']
+                report['ready_seconds'] = round(saved['seconds'] + report.get('ready_seconds', 0), 3)
+            timings[name] = report
+
         # 分析文件结构
-        analysis = current_processor.analyze_uploaded_files(product_path, order_path)
+        analysis = processor.analyze_uploaded_files(product_path, order_path)
+        session_id = session_registry.create(processor)
+        response.set_cookie(SESSION_COOKIE, session_id, max_age=DEFAULT_EXPIRE_SECONDS,
+                            httponly=True, samesite="lax")
 
         return {
             "success": True,
             "message": "文件上传成功",
+            "session_id": session_id,
             "files": {
                 "product_file": product_filename,
-                "order_file": order_filename
+                "order_file": order_filename,
+                "product_reused": product_saved["reused"] if product_saved else None,
+                "order_reused": order_saved["reused"]
             },
-            "analysis": analysis
+            "analysis": analysis,
+            "column_mapping": processor.get_column_mapping().to_dict(),
+            "catalog": processor.catalog.info(),
+            "timings": {**timings, 'total_seconds': round(time.perf_counter() - upload_start, 3)}
         }
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"文件上传失败: {str(e)}")
 
-@app.get("/data/shops")
-async def get_available_shops():
-    """获取所有可用店铺列表"""
-    global current_processor
+@app.get("/catalog")
+async def get_catalog_versions():
+    """查看产品目录版本"""
+    latest = catalog_store.latest()
+    return {
+        "latest": latest.info() if latest is not None else None,
+        "versions": catalog_store.versions()
+    }
+
+@app.get("/data/columns")
+async def get_column_mapping(processor: UploadProcessor = Depends(session_processor)):
+    """获取当前上传文件的列映射"""
+    return {"column_mapping": processor.get_column_mapping().to_dict()}
+
+@app.put("/data/columns")
+async def update_column_mapping(request: ColumnMappingRequest,
+                                processor: UploadProcessor = Depends(session_processor)):
+    """手动指定列映射，覆盖自动识别结果"""
+    try:
+        mapping = processor.set_column_overrides(request.model_dump(exclude_none=True))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    if current_processor is None:
-        raise HTTPException(status_code=400, detail="请先上传文件")
+    return {"success": True, "column_mapping": mapping.to_dict()}
 
+@app.post("/upload/append")
+async def append_order_file(
+    order_file: UploadFile = File(..., description="新一批订单Excel文件"),
+    selected_shops: Optional[List[str]] = Form(None, description="返回结果的店铺筛选"),
+    processor: UploadProcessor = Depends(session_processor)
+):
+    """增量模式：追加一批订单，只处理新批次，已存在的订单号以新批次为准"""
     try:
-        shops = current_processor.get_available_shops()
+        if not order_file.filename.endswith(('.xlsx', '.xls')):
+            raise HTTPException(status_code=400, detail="订单文件必须是Excel格式")
+
+        order_saved = await run_in_threadpool(upload_store.save, order_file.file, "order", order_file.filename)
+        order_path = order_saved["path"]
+        order_filename = order_saved["filename"]
+
+        # 解析新批次并处理，在线程池中执行，不阻塞事件循环
+        processed_df, analysis = await run_in_threadpool(
+            processor.append_order_batch, order_path, {'selected_shops': selected_shops}
+        )
+
+        return FastJSONResponse({
+            "success": True,
+            "message": f"增量处理完成，累计 {len(processed_df)} 条记录",
+            "order_file": order_filename,
+            "analysis": analysis
+        })
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"增量处理失败: {str(e)}")
+
+@app.get("/data/shops")
+async def get_available_shops(processor: UploadProcessor = Depends(session_processor)):
+    """获取所有可用店铺列表"""
+    try:
+        shops = processor.get_available_shops()
         return {"shops": shops, "total": len(shops)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取店铺列表失败: {str(e)}")
 
 @app.post("/data/process")
-async def process_data(request: DataProcessRequest):
+async def process_data(request: DataProcessRequest,
+                       processor: UploadProcessor = Depends(session_processor)):
     """处理上传的数据"""
-    global current_processor
-
-    if current_processor is None:
-        raise HTTPException(status_code=400, detail="请先上传文件")
 
     try:
-        filter_options = {
-            'selected_shops': request.selected_shops,
-            'include_closed_orders': request.include_closed_orders,
-            'include_offline_orders': request.include_offline_orders
-        }
-
-        processed_df, analysis = current_processor.process_data(filter_options)
-
-        if processed_df.empty:
-            return {
-                "success": False,
-                "message": "没有找到符合条件的数据",
-                "data": {},
-                "analysis": {}
-            }
-
-        # 转换DataFrame为JSON格式，限制返回条数
-        data_records = processed_df.head(100).fillna(0).to_dict('records')
-
-        # 清理数据中的NaN值
-        for record in data_records:
-            for key, value in record.items():
-                if pd.isna(value):
-                    record[key] = None
+        filter_options = _filter_options(request)
 
-        return {
-            "success": True,
-            "message": f"数据处理完成，共处理 {len(processed_df)} 条记录",
-            "data": {
-                "records": data_records,
-                "total_records": len(processed_df),
-                "columns": processed_df.columns.tolist()
-            },
-            "analysis": analysis
-        }
+        # 处理在线程池中执行，不阻塞事件循环
+        processed_df, analysis = await run_in_threadpool(process_with_cache, processor, filter_options)
+        return FastJSONResponse(process_response(processed_df, analysis))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"数据处理失败: {str(e)}")
 
+@app.post("/data/explain")
+async def explain_process(request: DataProcessRequest,
+                          processor: UploadProcessor = Depends(session_processor)):
+    """返回本次处理参数对应的优化后查询计划（谓词下推结果），不执行处理"""
+    try:
+        return await run_in_threadpool(processor.explain, _filter_options(request))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"生成查询计划失败: {str(e)}")
+
+def _record_view(processor: UploadProcessor, sort_by: Optional[str], descending: bool,
+                 shops: Optional[List[str]], where: Optional[List[str]]) -> dict:
+    """分页/流式接口共用的排序与筛选参数"""
+    if processor.processed_data is None:
+        raise HTTPException(status_code=400, detail="请先处理数据")
+    try:
+        conditions = parse_where(where)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    shop_col = processor.get_column_mapping().shop
+    return {
+        'sort_by': sort_by,
+        'descending': descending,
+        'shop_col': shop_col,
+        'shops': shops,
+        'where': conditions
+    }
+
+@app.get("/data/records")
+async def get_records(
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=5000),
+    sort_by: Optional[str] = Query(None, description="排序列"),
+    descending: bool = Query(False),
+    shops: Optional[List[str]] = Query(None, description="店铺筛选"),
+    where: Optional[List[str]] = Query(None, description="等值筛选，格式 列名=值，可重复"),
+    processor: UploadProcessor = Depends(session_processor)
+):
+    """分页获取最近一次处理结果的记录（游标分页）"""
+    view = _record_view(processor, sort_by, descending, shops, where)
+    try:
+        page = await run_in_threadpool(record_pager.page, processor.processed_data, cursor, limit, **view)
+        return FastJSONResponse(page)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/data/records/stream")
+async def stream_records(
+    sort_by: Optional[str] = Query(None, description="排序列"),
+    descending: bool = Query(False),
+    shops: Optional[List[str]] = Query(None, description="店铺筛选"),
+    where: Optional[List[str]] = Query(None, description="等值筛选，格式 列名=值，可重复"),
+    processor: UploadProcessor = Depends(session_processor)
+):
+    """以NDJSON流式输出最近一次处理结果的全部记录"""
+    view = _record_view(processor, sort_by, descending, shops, where)
+    df = processor.processed_data
+    try:
+        # 先计算行顺序，排序/筛选列错误时返回400而不是中断的流
+        await run_in_threadpool(record_pager.positions, df, **view)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(record_pager.iter_ndjson(df, **view), media_type="application/x-ndjson")
+
+@app.get("/cube/query")
+async def query_cube(
+    by: Optional[List[str]] = Query(None, description="分组维度 shop / product / day，可重复，不传为总计"),
+    shops: Optional[List[str]] = Query(None, description="店铺筛选"),
+    products: Optional[List[str]] = Query(None, description="商品编码筛选"),
+    day_from: Optional[str] = Query(None, description="起始日期 YYYY-MM-DD（含）"),
+    day_to: Optional[str] = Query(None, description="结束日期 YYYY-MM-DD（含）"),
+    sort_by: Optional[str] = Query(None, description="排序指标或维度"),
+    descending: bool = Query(True),
+    limit: Optional[int] = Query(None, ge=1),
+    processor: UploadProcessor = Depends(session_processor)
+):
+    """从聚合立方体按任意粗粒度汇总收入、成本、利润、数量、行数、订单数，不访问明细"""
+    cube = await run_in_threadpool(processor.get_cube)
+    if cube is None:
+        raise HTTPException(status_code=400, detail="请先处理数据")
+    try:
+        return FastJSONResponse(cube.query(by or [], shops=shops, products=products, day_from=day_from,
+                                           day_to=day_to, sort_by=sort_by, descending=descending, limit=limit))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/cube/info")
+async def get_cube_info(processor: UploadProcessor = Depends(session_processor)):
+    """聚合立方体规模（单元格数、各维度取值数、构建耗时、内存）"""
+    cube = await run_in_threadpool(processor.get_cube)
+    if cube is None:
+        raise HTTPException(status_code=400, detail="请先处理数据")
+    return cube.info()
+
 @app.post("/data/export")
-async def export_processed_data(request: DataProcessRequest):
+async def export_processed_data(request: ExportRequest,
+                                processor: UploadProcessor = Depends(session_processor)):
     """导出处理后的数据"""
-    global current_processor
-
-    if current_processor is None:
-        raise HTTPException(status_code=400, detail="请先上传文件")
 
     try:
-        filter_options = {
-            'selected_shops': request.selected_shops,
-            'include_closed_orders': request.include_closed_orders,
-            'include_offline_orders': request.include_offline_orders
-        }
+        filter_options = _filter_options(request)
 
-        processed_df, analysis = current_processor.process_data(filter_options)
+        processed_df, analysis = await run_in_threadpool(process_with_cache, processor, filter_options, False)
 
         if processed_df.empty:
             raise HTTPException(status_code=400, detail="没有数据可以导出")
 
+        if request.export_format not in EXPORT_FORMATS:
+            raise HTTPException(status_code=400, detail=f"不支持的导出格式: {request.export_format}")
+
         # 生成导出文件名
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"processed_data_{timestamp}.xlsx"
-        filepath = os.path.join(EXPORT_DIR, filename)
-
-        success = current_processor.export_processed_data(filepath)
-
-        if success:
-            return {
-                "success": True,
-                "message": "数据导出成功",
-                "filename": filename,
-                "records_count": len(processed_df),
-                "download_url": f"/download/{filename}"
-            }
-        else:
-            raise HTTPException(status_code=500, detail="数据导出失败")
+        filepath = export_path(EXPORT_DIR, f"processed_data_{timestamp}_{os.urandom(3).hex()}", request.export_format)
+        filename = os.path.basename(filepath)
 
+        # 导出本次请求得到的结果本身，不经过处理器上的共享状态：
+        # 同一会话的其他请求可能在两次线程池调用之间改写 processor.processed_data / export_stats
+        export_stats = await run_in_threadpool(
+            export_frames, filepath, {'处理后数据': processed_df}, request.export_format
+        )
+
+        return {
+            "success": True,
+            "message": "数据导出成功",
+            "filename": filename,
+            "records_count": len(processed_df),
+            "download_url": f"/download/{filename}",
+            "export_stats": export_stats
+        }
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"导出失败: {str(e)}")
 
+@app.post("/jobs/process")
+async def submit_process_job(request: DataProcessRequest,
+                             processor: UploadProcessor = Depends(session_processor)):
+    """提交后台处理任务，立即返回任务ID"""
+    if not processor.order_file_path:
+        raise HTTPException(status_code=400, detail="请先上传文件")
+
+    filter_options = _filter_options(request)
+
+    def on_done(result):
+        processed_df, analysis, fingerprint = result
+        # 任务在工作进程中执行，阶段指标在主进程补记
+        metrics_registry.record_report(analysis.get('processing_info'))
+        # 任务执行期间会话可能追加了批次或修改了列映射：只有工作进程处理的数据与会话当前数据一致时，
+        # 才写入处理结果缓存并同步为处理器的当前结果
+        if fingerprint is not None and fingerprint == processor.dataset_fingerprint():
+            result_cache.put(result_cache.make_key(fingerprint, filter_options), processed_df, analysis)
+            processor.processed_data = processed_df
+        return process_response(processed_df, analysis)
+
+    job_id = job_manager.submit("process", run_process_job, processor.job_spec(), filter_options, on_done=on_done)
+    return {"success": True, "job_id": job_id, "status_url": f"/jobs/{job_id}"}
+
+@app.post("/jobs/export")
+async def submit_export_job(request: ExportRequest,
+                            processor: UploadProcessor = Depends(session_processor)):
+    """提交后台导出任务，立即返回任务ID"""
+    if not processor.order_file_path:
+        raise HTTPException(status_code=400, detail="请先上传文件")
+    if request.export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的导出格式: {request.export_format}")
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filepath = export_path(EXPORT_DIR, f"processed_data_{timestamp}_{os.urandom(3).hex()}", request.export_format)
+
+    def on_done(result):
+        metrics_registry.record_report(result.pop('processing_info', None))
+        return {
+            "success": True,
+            "message": "数据导出成功",
+            "download_url": f"/download/{result['filename']}",
+            **result
+        }
+
+    job_id = job_manager.submit("export", run_export_job, processor.job_spec(),
+                                _filter_options(request), filepath, request.export_format, on_done=on_done)
+    return {"success": True, "job_id": job_id, "status_url": f"/jobs/{job_id}"}
+
+@app.get("/jobs/metrics")
+async def get_job_metrics():
+    """任务队列指标（工作进程数、排队数、运行数、完成/失败数）"""
+    return job_manager.metrics()
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """任务状态与进度"""
+    job = job_manager.status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """任务结果；未完成时返回409"""
+    job = job_manager.status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if job['status'] == 'failed':
+        raise HTTPException(status_code=500, detail=f"任务失败: {job['error']}")
+    if job['status'] != 'succeeded':
+        raise HTTPException(status_code=409, detail=f"任务尚未完成: {job['status']}")
+    return FastJSONResponse(job_manager.result(job_id))
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """处理结果缓存的命中统计"""
+    return result_cache.stats()
+
+@app.get("/sessions/stats")
+async def get_session_stats():
+    """上传会话统计（内存中/已落盘的会话数、内存占用）"""
+    return session_registry.stats()
+
 @app.get("/download/{filename}")
 async def download_file(filename: str):
     """下载导出的文件"""
@@ -222,29 +555,22 @@ async def download_file(filename: str):
     if not os.path.exists(filepath):
         raise HTTPException(status_code=404, detail="文件不存在")
 
+    try:
+        media_type = MEDIA_TYPES[export_format(filename)]
+    except ValueError:
+        media_type = 'application/octet-stream'
+
     return FileResponse(
         path=filepath,
         filename=filename,
-        media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        media_type=media_type
     )
 
 @app.get("/files/list")
 async def list_uploaded_files():
     """列出已上传的文件"""
     try:
-        files = []
-        if os.path.exists(UPLOAD_DIR):
-            for file in os.listdir(UPLOAD_DIR):
-                if file.endswith(('.xlsx', '.xls')):
-                    filepath = os.path.join(UPLOAD_DIR, file)
-                    file_size = os.path.getsize(filepath)
-                    files.append({
-                        "name": file,
-                        "size": file_size,
-                        "size_mb": round(file_size / 1024 / 1024, 2),
-                        "upload_time": datetime.fromtimestamp(os.path.getctime(filepath)).isoformat()
-                    })
-
+        files = upload_store.files()
         return {"files": files, "total": len(files)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取文件列表失败: {str(e)}")
@@ -252,14 +578,9 @@ async def list_uploaded_files():
 @app.delete("/files/clear")
 async def clear_uploaded_files():
     """清理上传的文件"""
-    global current_processor
-
     try:
         # 清理上传文件
-        if os.path.exists(UPLOAD_DIR):
-            for file in os.listdir(UPLOAD_DIR):
-                filepath = os.path.join(UPLOAD_DIR, file)
-                os.remove(filepath)
+        upload_store.clear()
 
         # 清理导出文件
         if os.path.exists(EXPORT_DIR):
@@ -267,8 +588,9 @@ async def clear_uploaded_files():
                 filepath = os.path.join(EXPORT_DIR, file)
                 os.remove(filepath)
 
-        # 重置处理器
-        current_processor = None
+        # 清空会话
+        session_registry.clear()
+        result_cache.clear()
 
         return {"success": True, "message": "文件清理完成"}
     except Exception as e:
@@ -276,5 +598,4 @@ async def clear_uploaded_files():
 
 if __name__ == "__main__":
     import uvicorn
-    import pandas as pd  # 添加pandas导入
     uvicorn.run(app, host="0.0.0.0", port=6532)
\ No newline at end of file
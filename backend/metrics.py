@@ -0,0 +1,371 @@
+"""
+处理流程指标
+每次处理按阶段记录墙钟时间、CPU时间、输入/输出行数和内存峰值，结果写入 analysis['processing_info']['stages']；
+同时累计到进程内的直方图，由 /metrics 接口以 Prometheus 文本格式输出，另含重接口的请求耗时
+"""
+import os
+import time
+import bisect
+import resource
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, List, Any, Optional, Tuple, Iterable
+
+# 设为1时用 tracemalloc 精确记录每阶段的内存分配峰值（处理变慢约一倍，并发请求的分配会互相计入）；
+# 默认按进程RSS估计：阶段开始时的RSS到阶段结束时RSS/历史峰值RSS的增量
+TRACE_MEMORY = os.getenv("STAGE_TRACE_MEMORY", "0") == "1"
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+ROWS_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+BYTES_BUCKETS = tuple(2 ** p * 1024 * 1024 for p in range(0, 14, 2))  # 1MB ~ 4GB
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss() -> int:
+    """当前常驻内存（字节）；读不到 /proc 时退回历史峰值"""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return peak_rss()
+
+
+def peak_rss() -> int:
+    """进程历史峰值常驻内存（字节，Linux下 ru_maxrss 单位为KB）"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+@contextmanager
+def memory_window():
+    """
+    记录块内的内存峰值增量：块开始时的RSS到块结束时的RSS、或块内被刷新的历史峰值RSS
+
+    历史峰值没有在块内被刷新时说明块内的峰值低于之前的峰值，只能取结束时的RSS估计；
+    同一进程中并发执行的请求会互相计入
+
+    Yields:
+        Dict[str, Any]: 块结束后含 peak_bytes
+    """
+    window = {}
+    base = current_rss()
+    high_water = peak_rss()
+    try:
+        yield window
+    finally:
+        after = peak_rss()
+        window['peak_bytes'] = max(max(current_rss(), after if after > high_water else 0) - base, 0)
+
+
+class Histogram:
+    """
+    按标签分组的累计直方图（Prometheus histogram 语义：每个桶计 <= 上界的观测数）
+
+    Attributes:
+        name: 指标名
+        help: 说明
+        label_names: 标签名
+        buckets: 桶上界（升序，不含 +Inf）
+    """
+
+    def __init__(self, name: str, help: str, label_names: Tuple[str, ...], buckets: Tuple[float, ...]):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.buckets = tuple(sorted(buckets))
+        # 标签值 -> [各桶计数（非累计，最后一个为 +Inf）, 总和, 次数]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *label_values: str):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total, count) in sorted(self._series.items()):
+            labels = _format_labels(self.label_names, label_values)
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float('inf') else _format_number(bound)
+                sep = "," if labels else ""
+                lines.append(f'{self.name}_bucket{{{labels}{sep}le="{le}"}} {cumulative}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {_format_number(total)}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    return ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+
+
+def _format_number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class MetricsRegistry:
+    """
+    进程内指标注册表：流程阶段直方图、请求耗时直方图和处理次数
+
+    后台任务在工作进程中执行，工作进程里的观测不会出现在主进程的 /metrics 中，
+    因此任务完成回调需调用 record_stages 把结果里的阶段指标计入主进程
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stage_seconds = Histogram(
+            "pipeline_stage_duration_seconds", "处理流程各阶段墙钟耗时",
+            ("pipeline", "stage"), SECONDS_BUCKETS)
+        self.stage_cpu_seconds = Histogram(
+            "pipeline_stage_cpu_seconds", "处理流程各阶段CPU耗时（执行线程）",
+            ("pipeline", "stage"), SECONDS_BUCKETS)
+        self.stage_rows = Histogram(
+            "pipeline_stage_rows", "处理流程各阶段输入/输出行数",
+            ("pipeline", "stage", "direction"), ROWS_BUCKETS)
+        self.stage_memory = Histogram(
+            "pipeline_stage_peak_memory_bytes", "处理流程各阶段内存峰值增量",
+            ("pipeline", "stage"), BYTES_BUCKETS)
+        self.request_seconds = Histogram(
+            "http_request_duration_seconds", "重接口请求耗时（流式响应只计到开始发送）",
+            ("method", "path", "status"), SECONDS_BUCKETS)
+        self.runs: Dict[str, int] = {}
+
+    def record_stages(self, pipeline: str, stages: List[Dict[str, Any]]):
+        """
+        把一次处理的阶段报告计入直方图
+
+        Args:
+            pipeline: 流程名（upload / dataset ...）
+            stages: StageRecorder.report() 中的 stages
+        """
+        with self._lock:
+            self.runs[pipeline] = self.runs.get(pipeline, 0) + 1
+            for s in stages:
+                name = s['stage']
+                self.stage_seconds.observe(s['wall_seconds'], pipeline, name)
+                self.stage_cpu_seconds.observe(s['cpu_seconds'], pipeline, name)
+                if s.get('rows_in') is not None:
+                    self.stage_rows.observe(s['rows_in'], pipeline, name, "in")
+                if s.get('rows_out') is not None:
+                    self.stage_rows.observe(s['rows_out'], pipeline, name, "out")
+                if s.get('peak_mb') is not None:
+                    self.stage_memory.observe(s['peak_mb'] * 1024 * 1024, pipeline, name)
+
+    def record_report(self, processing_info: Dict[str, Any]):
+        """按 processing_info 中的流程名和阶段报告计入（后台任务结果在主进程补记时使用）"""
+        if processing_info and processing_info.get('stages'):
+            self.record_stages(processing_info.get('pipeline', 'unknown'), processing_info['stages'])
+
+    def observe_request(self, method: str, path: str, status: int, seconds: float):
+        with self._lock:
+            self.request_seconds.observe(seconds, method, path, str(status))
+
+    def render(self) -> str:
+        """Prometheus 文本格式"""
+        with self._lock:
+            lines = []
+            for histogram in (self.stage_seconds, self.stage_cpu_seconds, self.stage_rows,
+                              self.stage_memory, self.request_seconds):
+                lines += histogram.render()
+            lines += ["# HELP pipeline_runs_total 完成的处理次数", "# TYPE pipeline_runs_total counter"]
+            lines += [f'pipeline_runs_total{{pipeline="{_escape(p)}"}} {n}' for p, n in sorted(self.runs.items())]
+        lines += [
+            "# HELP process_resident_memory_bytes 当前常驻内存",
+            "# TYPE process_resident_memory_bytes gauge",
+            f"process_resident_memory_bytes {current_rss()}",
+            "# HELP process_peak_resident_memory_bytes 历史峰值常驻内存",
+            "# TYPE process_peak_resident_memory_bytes gauge",
+            f"process_peak_resident_memory_bytes {peak_rss()}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+class StageRecorder:
+    """
+    一次处理的阶段记录器
+
+    同名阶段多次进入（流式模式逐块处理）时累加耗时和行数，内存峰值取最大；
+    report() 按首次进入的顺序输出，并计入全局注册表
+
+    Attributes:
+        pipeline: 流程名
+        trace_memory: 是否用 tracemalloc 记录内存峰值
+    """
+
+    def __init__(self, pipeline: str, trace_memory: bool = TRACE_MEMORY):
+        self.pipeline = pipeline
+        self.trace_memory = trace_memory
+        self._stages: Dict[str, Dict[str, Any]] = {}
+        self._started_tracing = False
+        self._start = time.perf_counter()
+        self._cpu_start = time.thread_time()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    @contextmanager
+    def stage(self, name: str, rows_in: Optional[int] = None):
+        """
+        记录一个阶段；调用方在块内设置 record['rows_out']
+
+        Args:
+            name: 阶段名
+            rows_in: 输入行数
+
+        Yields:
+            Dict[str, Any]: 本次阶段记录
+        """
+        record = {'rows_in': rows_in, 'rows_out': None}
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            with memory_window() as rss:
+                yield record
+        finally:
+            record['wall_seconds'] = time.perf_counter() - wall
+            record['cpu_seconds'] = time.thread_time() - cpu
+            if self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1] - base
+            else:
+                peak = rss['peak_bytes']
+            record['peak_mb'] = max(peak, 0) / 1024 / 1024
+            self._merge(name, record)
+
+    def _merge(self, name: str, record: Dict[str, Any]):
+        total = self._stages.get(name)
+        if total is None:
+            self._stages[name] = dict(record, stage=name, calls=1)
+            return
+        total['calls'] += 1
+        total['wall_seconds'] += record['wall_seconds']
+        total['cpu_seconds'] += record['cpu_seconds']
+        total['peak_mb'] = max(total['peak_mb'], record['peak_mb'])
+        for key in ('rows_in', 'rows_out'):
+            if record[key] is not None:
+                total[key] = (total[key] or 0) + record[key]
+
+    def close(self):
+        """停止由本记录器开启的内存追踪（提前结束、不调用 report 时也需调用）"""
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def report(self) -> Dict[str, Any]:
+        """
+        结束记录并计入全局注册表
+
+        Returns:
+            Dict[str, Any]: 流程名、stages（每阶段 stage, calls, wall_seconds, cpu_seconds, rows_in, rows_out, peak_mb）、
+            总耗时和内存口径
+        """
+        self.close()
+        stages = [
+            {
+                'stage': s['stage'],
+                'calls': s['calls'],
+                'wall_seconds': round(s['wall_seconds'], 4),
+                'cpu_seconds': round(s['cpu_seconds'], 4),
+                'rows_in': s['rows_in'],
+                'rows_out': s['rows_out'],
+                'peak_mb': round(s['peak_mb'], 2)
+            }
+            for s in self._stages.values()
+        ]
+        metrics_registry.record_stages(self.pipeline, stages)
+        return {
+            'pipeline': self.pipeline,
+            'stages': stages,
+            'total_wall_seconds': round(time.perf_counter() - self._start, 4),
+            'total_cpu_seconds': round(time.thread_time() - self._cpu_start, 4),
+            'memory_source': 'tracemalloc' if self.trace_memory else 'rss',
+            'peak_rss_mb': round(peak_rss() / 1024 / 1024, 2)
+        }
+
+
+def stage(recorder: Optional[StageRecorder], name: str, rows_in: Optional[int] = None):
+    """recorder 为None时返回空记录的上下文（处理器方法被单独调用时不记录）"""
+    if recorder is None:
+        return _noop_stage()
+    return recorder.stage(name, rows_in)
+
+
+@contextmanager
+def _noop_stage():
+    yield {}
+
+
+_END = object()
+
+
+def timed_iter(recorder: Optional[StageRecorder], name: str, iterable: Iterable):
+    """
+    逐个取值并把每次取值计入阶段（流式读取时只统计读取本身，不含消费方的处理时间）
+
+    Args:
+        recorder: 阶段记录器，None时不记录
+        name: 阶段名
+        iterable: 产出 DataFrame 等带长度对象的可迭代对象
+
+    Yields:
+        原样产出 iterable 的元素
+    """
+    iterator = iter(iterable)
+    while True:
+        with stage(recorder, name) as record:
+            item = next(iterator, _END)
+            if item is not _END:
+                record['rows_out'] = len(item)
+        if item is _END:
+            return
+        yield item
+
+
+def install(app, heavy_paths: Iterable[str]):
+    """
+    给FastAPI应用加上 /metrics 接口和重接口的请求耗时记录
+
+    Args:
+        app: FastAPI应用
+        heavy_paths: 需要记录耗时的路由模板（如 /data/process、/jobs/{job_id}/result）
+    """
+    from fastapi.responses import Response
+
+    heavy = set(heavy_paths)
+
+    @app.middleware("http")
+    async def record_request_latency(request, call_next):
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            route = request.scope.get("route")
+            path = getattr(route, "path", None)
+            if path in heavy:
+                metrics_registry.observe_request(request.method, path, status, time.perf_counter() - start)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def prometheus_metrics():
+        """Prometheus 文本格式的处理流程与请求指标"""
+        return Response(content=metrics_registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+# 全局指标注册表
+metrics_registry = MetricsRegistry()
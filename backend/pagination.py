@@ -0,0 +1,185 @@
+"""
+处理结果的分页与流式输出
+按 (结果, 排序, 筛选) 计算一次行顺序并缓存，之后每页只切片 limit 行；游标为不透明的base64字符串
+"""
+import json
+import base64
+import hashlib
+import weakref
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple, Iterator
+
+import pandas as pd
+import numpy as np
+
+from serialization import frame_records
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 5000
+STREAM_CHUNK_SIZE = 10000
+MAX_CACHED_VIEWS = 32
+
+
+def encode_cursor(payload: Dict[str, Any]) -> str:
+    raw = json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """
+    解析游标
+
+    Raises:
+        ValueError: 游标格式错误
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except Exception:
+        raise ValueError("游标无效")
+    if not isinstance(payload, dict) or 'offset' not in payload:
+        raise ValueError("游标无效")
+    return payload
+
+
+def parse_where(where: Optional[List[str]]) -> List[Tuple[str, str]]:
+    """把 ['列名=值', ...] 解析为等值筛选条件"""
+    conditions = []
+    for item in where or []:
+        column, sep, value = item.partition('=')
+        if not sep or not column:
+            raise ValueError(f"筛选条件格式应为 列名=值: {item}")
+        conditions.append((column, value))
+    return conditions
+
+
+class RecordPager:
+    """
+    处理结果的分页器
+
+    行顺序（筛选 + 排序后的行号数组）按 (结果对象, 排序列, 方向, 筛选条件) 缓存，
+    翻页时只做 iloc 切片，首屏之后每页与总行数无关。
+    """
+
+    def __init__(self, max_views: int = MAX_CACHED_VIEWS):
+        self.max_views = max_views
+        self._views: "OrderedDict[Tuple, np.ndarray]" = OrderedDict()
+        self._tracked = set()
+        self._lock = threading.Lock()
+
+    def _result_token(self, df: pd.DataFrame) -> str:
+        """结果对象的标识；对象被回收时清掉它的缓存，避免内存地址复用后命中旧的行顺序"""
+        token = f"{id(df):x}-{len(df)}"
+        with self._lock:
+            if token not in self._tracked:
+                self._tracked.add(token)
+                weakref.finalize(df, self._forget, token)
+        return token
+
+    def _forget(self, token: str):
+        with self._lock:
+            self._tracked.discard(token)
+            for key in [k for k in self._views if k[0] == token]:
+                del self._views[key]
+
+    def positions(self, df: pd.DataFrame, sort_by: Optional[str] = None, descending: bool = False,
+                  shop_col: Optional[str] = None, shops: Optional[List[str]] = None,
+                  where: Optional[List[Tuple[str, str]]] = None) -> np.ndarray:
+        """
+        筛选并排序后的行号
+
+        Raises:
+            ValueError: 排序列或筛选列不存在
+        """
+        shops_key = tuple(sorted(set(shops))) if shops else ()
+        where_key = tuple(where or ())
+        key = (self._result_token(df), sort_by, bool(descending), shop_col, shops_key, where_key)
+        with self._lock:
+            cached = self._views.get(key)
+            if cached is not None:
+                self._views.move_to_end(key)
+                return cached
+
+        mask = np.ones(len(df), dtype=bool)
+        if shops_key and shop_col in df.columns:
+            mask &= df[shop_col].isin(shops_key).to_numpy()
+        for column, value in where_key:
+            if column not in df.columns:
+                raise ValueError(f"筛选列不存在: {column}")
+            mask &= (df[column].astype(str) == value).to_numpy()
+        positions = np.flatnonzero(mask)
+
+        if sort_by:
+            if sort_by not in df.columns:
+                raise ValueError(f"排序列不存在: {sort_by}")
+            values = df[sort_by].iloc[positions]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                values = values.astype(object)
+            # 稳定排序，缺失值排在最后
+            order = values.reset_index(drop=True).sort_values(
+                ascending=not descending, kind='mergesort', na_position='last'
+            ).index.to_numpy()
+            positions = positions[order]
+
+        with self._lock:
+            self._views[key] = positions
+            while len(self._views) > self.max_views:
+                self._views.popitem(last=False)
+        return positions
+
+    def page(self, df: pd.DataFrame, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE,
+             **view) -> Dict[str, Any]:
+        """
+        取一页记录
+
+        Args:
+            df: 处理结果
+            cursor: 上一页返回的 next_cursor；为空时从第一行开始
+            limit: 每页条数
+            **view: sort_by / descending / shop_col / shops / where，翻页时须与首页一致
+
+        Returns:
+            Dict[str, Any]: records、next_cursor（没有下一页时为None）、total
+
+        Raises:
+            ValueError: 游标无效或已失效
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        token = self._result_token(df)
+        signature = hashlib.sha1(repr(sorted(view.items())).encode('utf-8')).hexdigest()[:12]
+        offset = 0
+        if cursor:
+            payload = decode_cursor(cursor)
+            if payload.get('result') != token:
+                raise ValueError("游标已失效（处理结果已更新），请从第一页重新获取")
+            if payload.get('view') != signature:
+                raise ValueError("游标与当前的排序/筛选条件不一致")
+            offset = int(payload['offset'])
+
+        positions = self.positions(df, **view)
+        chunk = df.iloc[positions[offset:offset + limit]]
+        next_offset = offset + len(chunk)
+        next_cursor = encode_cursor({'result': token, 'view': signature, 'offset': next_offset}) if next_offset < len(positions) else None
+        return {
+            'records': frame_records(chunk),
+            'next_cursor': next_cursor,
+            'total': int(len(positions)),
+            'columns': df.columns.tolist()
+        }
+
+    def iter_ndjson(self, df: pd.DataFrame, chunk_size: int = STREAM_CHUNK_SIZE, **view) -> Iterator[bytes]:
+        """按块输出NDJSON，每块序列化后立即交给响应，服务端只保留一块的文本"""
+        positions = self.positions(df, **view)
+        for start in range(0, len(positions), chunk_size):
+            chunk = df.iloc[positions[start:start + chunk_size]]
+            text = chunk.to_json(orient='records', lines=True, force_ascii=False, date_format='iso')
+            yield text.encode('utf-8') if text.endswith('\n') else (text + '\n').encode('utf-8')
+
+    def clear(self):
+        with self._lock:
+            self._views.clear()
+
+
+# 全局分页器
+record_pager = RecordPager()
@@ -0,0 +1,342 @@
+"""
+列概况（Profiling）
+整表只扫描一遍：示例值用蓄水池抽样，去重数用HyperLogLog估计，数值列用流式矩统计；
+每列的内存固定，可设置行数和时间上限，结果附带各项统计的误差范围
+"""
+import os
+import math
+import time
+from typing import Dict, List, Any, Optional, Iterable
+
+import pandas as pd
+import numpy as np
+
+from frame_cache import frame_cache, read_excel_cached
+
+HLL_PRECISION = 12                  # 2^12 个寄存器，相对标准误差约 1.6%
+EXACT_DISTINCT_LIMIT = 2048         # 去重数不超过该值时精确计数
+RESERVOIR_SIZE = 256                # 每列的抽样个数（示例值与分位数）
+PROFILE_CHUNK_SIZE = 50000
+DEFAULT_TIME_BUDGET = float(os.getenv("PROFILE_TIME_BUDGET", "30"))
+QUANTILE_CONFIDENCE = 0.95
+
+_MASK64 = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+
+def _bit_length(x: np.ndarray) -> np.ndarray:
+    """uint64数组每个元素的二进制位数（0 的位数为0）"""
+    x = x.copy()
+    n = np.zeros(len(x), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = x >= (np.uint64(1) << np.uint64(shift))
+        n += high * shift
+        x = np.where(high, x >> np.uint64(shift), x)
+    return n + (x > 0)
+
+
+class HyperLogLog:
+    """
+    HyperLogLog去重计数
+
+    去重数较少时保留精确的哈希集合，超过 EXACT_DISTINCT_LIMIT 后只用寄存器估计，
+    相对标准误差为 1.04 / sqrt(2^precision)。
+    """
+
+    def __init__(self, precision: int = HLL_PRECISION, exact_limit: int = EXACT_DISTINCT_LIMIT):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+        self.exact_limit = exact_limit
+        self._exact: Optional[set] = set()
+
+    def add_hashes(self, hashes: np.ndarray):
+        """加入一批64位哈希值"""
+        if len(hashes) == 0:
+            return
+        hashes = hashes.astype(np.uint64, copy=False)
+        if self._exact is not None:
+            self._exact.update(np.unique(hashes).tolist())
+            if len(self._exact) > self.exact_limit:
+                self._exact = None
+
+        p = np.uint64(self.precision)
+        index = (hashes >> (np.uint64(64) - p)).astype(np.int64)
+        rest = (hashes << p) & _MASK64
+        # 剩余 64-p 位中第一个1的位置；全0时取最大值
+        rank = np.minimum(64 - _bit_length(rest) + 1, 64 - self.precision + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    @property
+    def exact(self) -> bool:
+        return self._exact is not None
+
+    def relative_error(self) -> float:
+        """估计值的相对标准误差，精确计数时为0"""
+        return 0.0 if self.exact else 1.04 / math.sqrt(self.m)
+
+    def estimate(self) -> int:
+        if self._exact is not None:
+            return len(self._exact)
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / float(np.sum(np.exp2(-self.registers.astype(np.float64))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # 小基数修正：线性计数
+            return int(round(m * math.log(m / zeros)))
+        return int(round(raw))
+
+
+class Reservoir:
+    """
+    蓄水池抽样（Algorithm R），每个非空值被选中的概率相同
+
+    按块批量处理：为块内每个值生成 [0, 已见个数] 的随机位置，落在池内的依次替换
+    """
+
+    def __init__(self, size: int = RESERVOIR_SIZE, seed: int = 0):
+        self.size = size
+        self.seen = 0
+        self.values: List[Any] = []
+        self._rng = np.random.default_rng(seed)
+
+    def add(self, values: np.ndarray):
+        n = len(values)
+        if n == 0:
+            return
+        fill = min(self.size - len(self.values), n)
+        if fill > 0:
+            self.values.extend(values[:fill].tolist())
+        if fill < n:
+            rest = values[fill:]
+            seen = np.arange(self.seen + fill, self.seen + n, dtype=np.int64)
+            slots = (self._rng.random(len(rest)) * (seen + 1)).astype(np.int64)
+            chosen = np.flatnonzero(slots < self.size)
+            # 按出现顺序替换，同一位置被多次选中时保留最后一个，与逐个处理的结果一致
+            for i in chosen:
+                self.values[slots[i]] = rest[i].item() if isinstance(rest[i], np.generic) else rest[i]
+        self.seen += n
+
+
+class StreamingMoments:
+    """数值列的流式统计：个数、均值、方差（按块合并的Welford算法）、最小值、最大值"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, values: np.ndarray):
+        n = len(values)
+        if n == 0:
+            return
+        chunk_mean = float(values.mean())
+        chunk_m2 = float(((values - chunk_mean) ** 2).sum())
+        total = self.count + n
+        delta = chunk_mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += chunk_m2 + delta * delta * self.count * n / total
+        self.count = total
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+
+class ColumnProfile:
+    """单列的概况：空值计数、去重估计、示例值抽样、数值统计"""
+
+    def __init__(self, name: str, seed: int = 0):
+        self.name = name
+        self.rows = 0
+        self.nulls = 0
+        self.numeric_values = 0
+        self.dtypes: Dict[str, int] = {}
+        self.distinct = HyperLogLog()
+        self.samples = Reservoir(seed=seed)
+        self.numeric_samples = Reservoir(seed=seed + 1)
+        self.moments = StreamingMoments()
+
+    def add(self, series: pd.Series):
+        self.rows += len(series)
+        values = series.dropna()
+        self.nulls += len(series) - len(values)
+        if len(values) == 0:
+            return
+        self.dtypes[str(series.dtype)] = self.dtypes.get(str(series.dtype), 0) + len(values)
+
+        # 先转object再哈希，同一个值在不同块里推断出的dtype不同也能得到相同哈希
+        self.distinct.add_hashes(pd.util.hash_array(values.astype(object).to_numpy()))
+        self.samples.add(values.to_numpy())
+
+        if series.dtype.kind in 'bmM':
+            return
+        numbers = pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+        numbers = numbers[np.isfinite(numbers)]
+        self.numeric_values += len(numbers)
+        self.moments.add(numbers)
+        self.numeric_samples.add(numbers)
+
+    @property
+    def non_null(self) -> int:
+        return self.rows - self.nulls
+
+    @property
+    def is_numeric(self) -> bool:
+        """所有非空值都能转为数值"""
+        return self.non_null > 0 and self.numeric_values == self.non_null
+
+    def inferred_dtype(self) -> str:
+        if self.non_null == 0:
+            return "empty"
+        if self.is_numeric:
+            return "int64" if self.moments.count and all(float(v).is_integer() for v in self.numeric_samples.values) else "float64"
+        if len(self.dtypes) == 1:
+            return next(iter(self.dtypes))
+        return "object"
+
+    def to_dict(self, n_samples: int = 3) -> Dict[str, Any]:
+        estimate = min(self.distinct.estimate(), self.non_null)
+        error = self.distinct.relative_error()
+        result = {
+            "dtype": self.inferred_dtype(),
+            "rows": self.rows,
+            "null_count": self.nulls,
+            "unique_count": estimate,
+            "distinct": {
+                "estimate": estimate,
+                "exact": self.distinct.exact,
+                "relative_std_error": round(error, 4),
+                # 约95%置信区间（±2倍标准误差），且不超过非空值个数
+                "ci95": [max(0, int(estimate * (1 - 2 * error))), min(self.non_null, int(math.ceil(estimate * (1 + 2 * error))))]
+            },
+            "sample_values": self.samples.values[:n_samples]
+        }
+        if self.is_numeric:
+            result["numeric"] = self.numeric_summary()
+        return result
+
+    def numeric_summary(self) -> Dict[str, Any]:
+        """与 describe() 相同的键；均值和方差为精确值，分位数来自抽样"""
+        moments = self.moments
+        sample = np.sort(np.asarray(self.numeric_samples.values, dtype=np.float64))
+        summary = {
+            "count": moments.count,
+            "mean": moments.mean,
+            "std": moments.std,
+            "min": moments.min,
+            "max": moments.max
+        }
+        for q, key in ((0.25, "25%"), (0.5, "50%"), (0.75, "75%")):
+            summary[key] = float(np.quantile(sample, q)) if len(sample) else None
+        return summary
+
+
+def quantile_rank_error(sample_size: int, confidence: float = QUANTILE_CONFIDENCE) -> float:
+    """DKW不等式：抽样分位数的秩误差上界（按比例）"""
+    if sample_size <= 0:
+        return 1.0
+    return math.sqrt(math.log(2 / (1 - confidence)) / (2 * sample_size))
+
+
+def profile_frames(chunks: Iterable[pd.DataFrame], max_rows: Optional[int] = None,
+                   time_budget: Optional[float] = DEFAULT_TIME_BUDGET) -> Dict[str, Any]:
+    """
+    对数据块序列做一次扫描，计算各列概况
+
+    Args:
+        chunks: DataFrame块序列（列一致）
+        max_rows: 最多扫描的行数，为空时扫描全部
+        time_budget: 扫描的时间上限（秒），为空时不限
+
+    Returns:
+        Dict[str, Any]: rows_scanned、truncated（是否因行数或时间上限提前结束）、columns（列名 -> 概况）、error_bounds
+    """
+    start = time.perf_counter()
+    profiles: Dict[str, ColumnProfile] = {}
+    columns: List[str] = []
+    rows = 0
+    truncated = False
+
+    for chunk in chunks:
+        if not columns:
+            columns = [str(c) for c in chunk.columns]
+            profiles = {col: ColumnProfile(col, seed=i * 2) for i, col in enumerate(columns)}
+        if max_rows is not None and rows + len(chunk) > max_rows:
+            chunk = chunk.iloc[:max_rows - rows]
+            truncated = True
+        for col, series in zip(columns, (chunk.iloc[:, i] for i in range(chunk.shape[1]))):
+            profiles[col].add(series)
+        rows += len(chunk)
+        if truncated:
+            break
+        if time_budget is not None and time.perf_counter() - start > time_budget:
+            truncated = True
+            break
+
+    profiled = {col: profiles[col].to_dict() for col in columns}
+    sample_size = min([len(p.numeric_samples.values) for p in profiles.values() if p.is_numeric] or [0])
+    return {
+        "rows_scanned": rows,
+        "truncated": truncated,
+        "seconds": round(time.perf_counter() - start, 3),
+        "columns": profiled,
+        "error_bounds": {
+            "null_count": "exact" if not truncated else "exact for scanned rows",
+            "mean_std": "exact" if not truncated else "exact for scanned rows",
+            "distinct_relative_std_error": round(1.04 / math.sqrt(1 << HLL_PRECISION), 4),
+            "distinct_exact_below": EXACT_DISTINCT_LIMIT,
+            "quantile_rank_error": round(quantile_rank_error(sample_size), 4),
+            "quantile_confidence": QUANTILE_CONFIDENCE,
+            "sample_size": RESERVOIR_SIZE
+        }
+    }
+
+
+def _frame_chunks(df: pd.DataFrame, chunk_size: int) -> Iterable[pd.DataFrame]:
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size]
+
+
+def profile_excel(path: str, frame: Optional[pd.DataFrame] = None, max_rows: Optional[int] = None,
+                  time_budget: Optional[float] = DEFAULT_TIME_BUDGET,
+                  chunk_size: int = PROFILE_CHUNK_SIZE) -> Dict[str, Any]:
+    """
+    Excel文件的列概况
+
+    已解析的数据（传入的 frame 或解析缓存中的表）按块切片扫描；
+    否则以openpyxl只读模式逐块读取，内存只保留一块数据和每列固定大小的统计量
+
+    Args:
+        path: 文件路径
+        frame: 已在内存中的整表，可为空
+        max_rows: 最多扫描的行数
+        time_budget: 扫描的时间上限（秒）
+        chunk_size: 每块行数
+
+    Returns:
+        Dict[str, Any]: 见 profile_frames，另含 file、source（memory / cache / stream）
+    """
+    if frame is not None:
+        source, chunks = "memory", _frame_chunks(frame, chunk_size)
+    elif frame_cache.is_cached(path):
+        source, chunks = "cache", _frame_chunks(read_excel_cached(path), chunk_size)
+    else:
+        from upload_processor import UploadProcessor
+        source, chunks = "stream", UploadProcessor().iter_order_chunks(path, chunk_size)
+
+    try:
+        profile = profile_frames(chunks, max_rows=max_rows, time_budget=time_budget)
+    finally:
+        # 提前结束时关闭只读工作簿
+        if hasattr(chunks, "close"):
+            chunks.close()
+    profile["file"] = os.path.basename(path)
+    profile["source"] = source
+    print(f"列概况 {profile['file']}: {profile['rows_scanned']} 行，{len(profile['columns'])} 列，"
+          f"{profile['seconds']}秒（{source}{'，已截断' if profile['truncated'] else ''}）")
+    return profile
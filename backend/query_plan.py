@@ -0,0 +1,181 @@
+"""
+订单处理的惰性查询计划
+process_data 先把各阶段组成逻辑计划，不立即执行：
+扫描 -> 整行去重 -> 状态过滤 -> 订单级金额过滤 -> 店铺筛选 -> 匹配 -> 成本计算 -> 业务去重；
+优化时把店铺谓词下推到扫描，之后各阶段只处理所选店铺的行；explain 返回优化后的计划
+"""
+from typing import Dict, List, Any, Optional, Iterable
+
+import pandas as pd
+import numpy as np
+
+from column_mapping import ColumnMapping
+
+# 店铺谓词可以越过的操作及理由；同一订单只属于一个店铺，订单级合计按店铺拆开后不变
+PUSHDOWN_RULES = {
+    'filter_order_total': '同一订单只属于一个店铺，订单合计不受其他店铺的行影响',
+    'filter_amount': '逐行过滤',
+    'filter_status': '逐行过滤',
+    'dedup_rows': '完全重复的行店铺相同',
+}
+
+
+class PlanNode:
+    """
+    计划中的一步
+
+    Attributes:
+        op: 操作名
+        columns: 本步读取的列
+        params: 其他参数（谓词、规则等）
+    """
+
+    def __init__(self, op: str, columns: Optional[Iterable[str]] = None, **params):
+        self.op = op
+        self.columns = [c for c in (columns or []) if c is not None]
+        self.params = params
+
+    def copy(self) -> "PlanNode":
+        return PlanNode(self.op, self.columns, **dict(self.params))
+
+    def describe(self) -> Dict[str, Any]:
+        return {'op': self.op, 'columns': self.columns, **self.params}
+
+    def __str__(self) -> str:
+        parts = [self.op]
+        if self.params:
+            parts.append(' '.join(f"{k}={v}" for k, v in self.params.items() if v is not None))
+        if self.columns:
+            parts.append(f"[{', '.join(map(str, self.columns))}]")
+        return ' '.join(p for p in parts if p)
+
+
+class QueryPlan:
+    """
+    订单处理计划，nodes 按执行顺序排列，第一个总是 scan
+
+    Attributes:
+        nodes: 计划中的各步
+        shop_col: 店铺列
+        scan_shops: 下推到扫描的店铺列表；为None时扫描全部行
+        optimized: 是否已优化
+        pushdown: 优化时做的下推说明
+    """
+
+    def __init__(self, nodes: List[PlanNode], shop_col: Optional[str] = None,
+                 scan_shops: Optional[List[str]] = None, optimized: bool = False,
+                 pushdown: Optional[List[str]] = None):
+        self.nodes = nodes
+        self.shop_col = shop_col
+        self.scan_shops = scan_shops
+        self.optimized = optimized
+        self.pushdown = pushdown or []
+
+    @classmethod
+    def build(cls, mapping: ColumnMapping, columns: Iterable[str], filter_options: Dict[str, Any] = None,
+              source: str = 'memory') -> "QueryPlan":
+        """
+        按 clean_order_data / run_pipeline 的执行顺序生成逻辑计划
+
+        Args:
+            mapping: 列映射
+            columns: 订单表列名
+            filter_options: 过滤选项（selected_shops）
+            source: 'memory'（已载入的订单表）或 'stream'（逐块读取文件）
+
+        Returns:
+            QueryPlan: 未优化的计划
+        """
+        columns = list(columns)
+
+        def has(col):
+            return col if col is not None and col in columns else None
+
+        order_id, amount, shop = has(mapping.order_id), has(mapping.amount), has(mapping.shop)
+        nodes = [
+            # 处理结果保留订单表的全部列，整行去重也要用到全部列
+            PlanNode('scan', columns, source=source),
+            PlanNode('dedup_rows', columns, key='整行指纹'),
+            PlanNode('filter_status', [has(mapping.mark)] + [has(c) for c in mapping.status]),
+        ]
+        if amount and order_id:
+            nodes.append(PlanNode('filter_order_total', [order_id, amount], rule=f"sum({amount}) by {order_id} > 0"))
+        elif amount:
+            nodes.append(PlanNode('filter_amount', [amount], rule=f"{amount} > 0"))
+
+        selected = list((filter_options or {}).get('selected_shops') or [])
+        if selected and shop:
+            nodes.append(PlanNode('filter_shop', [shop], shops=selected))
+
+        nodes += [
+            PlanNode('match', [has(c) for c in mapping.order_sku_candidates]),
+            PlanNode('costs', [has(mapping.quantity), has(mapping.revenue)]),
+            PlanNode('final_dedup', [c for c in mapping.final_dedup_keys() if has(c)]),
+        ]
+        return cls(nodes, shop_col=shop)
+
+    def optimize(self) -> "QueryPlan":
+        """
+        谓词下推：店铺筛选逐步越过 PUSHDOWN_RULES 中的操作，到达扫描时并入扫描，
+        扫描只对店铺一列求值，再按行号取出所选店铺的行
+
+        Returns:
+            QueryPlan: 新的已优化计划（原计划不变）
+        """
+        nodes = [node.copy() for node in self.nodes]
+        notes = []
+        scan_shops = self.scan_shops
+        for i, node in enumerate(nodes):
+            if node.op != 'filter_shop':
+                continue
+            j = i
+            while j > 1 and nodes[j - 1].op in PUSHDOWN_RULES:
+                notes.append(f"filter_shop 越过 {nodes[j - 1].op}：{PUSHDOWN_RULES[nodes[j - 1].op]}")
+                nodes[j - 1], nodes[j] = nodes[j], nodes[j - 1]
+                j -= 1
+            if j == 1:
+                scan_shops = node.params['shops']
+                nodes[0].params['predicate'] = f"{self.shop_col} IN {scan_shops}"
+                nodes[0].params['predicate_columns'] = [self.shop_col]
+                del nodes[1]
+                notes.append("filter_shop 并入 scan")
+            break
+        return QueryPlan(nodes, self.shop_col, scan_shops, optimized=True, pushdown=notes)
+
+    def scan_rows(self, df: pd.DataFrame) -> Optional[np.ndarray]:
+        """
+        在已载入的订单表上执行扫描谓词，只读取店铺一列
+
+        Args:
+            df: 订单表
+
+        Returns:
+            Optional[np.ndarray]: 所选店铺的行号（升序）；没有扫描谓词时为None
+        """
+        shops = self.scan_shops
+        if shops is None:
+            return None
+        return np.flatnonzero(df[self.shop_col].isin(shops).to_numpy())
+
+    def explain(self, df: Optional[pd.DataFrame] = None) -> Dict[str, Any]:
+        """
+        计划说明
+
+        Args:
+            df: 已载入的订单表；给出时附上扫描的总行数与谓词选中的行数
+
+        Returns:
+            Dict[str, Any]: optimized、pushdown、nodes（执行顺序）、plan（自顶向下的文本形式）
+        """
+        nodes = [node.describe() for node in self.nodes]
+        if df is not None:
+            nodes[0]['rows'] = len(df)
+            rows = self.scan_rows(df)
+            nodes[0]['rows_selected'] = len(df) if rows is None else len(rows)
+        lines = [f"{'  ' * depth}{node}" for depth, node in enumerate(reversed(self.nodes))]
+        return {
+            'optimized': self.optimized,
+            'pushdown': self.pushdown,
+            'nodes': nodes,
+            'plan': '\n'.join(lines)
+        }
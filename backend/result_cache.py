@@ -0,0 +1,99 @@
+"""
+处理结果缓存
+按 (数据集指纹: 按顺序的全部订单文件哈希与产品目录哈希, 规范化的处理参数) 缓存 process_data 的结果，按内存占用做LRU淘汰
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+import pandas as pd
+
+DEFAULT_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_MB", "256")) * 1024 * 1024
+
+
+def normalize_filter_options(filter_options: Optional[Dict[str, Any]]) -> Tuple:
+    """
+    把处理参数规范化为可哈希的元组：店铺列表排序去重，空列表与None等价
+
+    只包含处理流程实际使用的参数：include_closed_orders / include_offline_orders 不影响处理结果
+    （关闭和线下订单总是按订单状态过滤），计入键只会让相同结果重复缓存、导出时无法命中
+    """
+    options = filter_options or {}
+    shops = tuple(sorted(set(options.get('selected_shops') or [])))
+    return (('selected_shops', shops),)
+
+
+class ResultCache:
+    """
+    process_data 结果的LRU缓存
+
+    Attributes:
+        max_bytes: 缓存的DataFrame总内存上限
+        hits: 命中次数
+        misses: 未命中次数
+        evictions: 淘汰次数
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Tuple, Tuple[pd.DataFrame, Dict[str, Any], int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(fingerprint: Optional[Tuple], filter_options: Optional[Dict[str, Any]]) -> Optional[Tuple]:
+        """数据指纹不可用时返回None（不缓存）"""
+        if fingerprint is None:
+            return None
+        return (fingerprint, normalize_filter_options(filter_options))
+
+    def get(self, key: Optional[Tuple]) -> Optional[Tuple[pd.DataFrame, Dict[str, Any]]]:
+        """查找缓存，命中时移到最近使用"""
+        with self._lock:
+            if key is None or key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            df, analysis, _ = self._entries[key]
+            return df, analysis
+
+    def put(self, key: Optional[Tuple], df: pd.DataFrame, analysis: Dict[str, Any]):
+        """写入缓存；单个结果超过上限时不缓存"""
+        if key is None:
+            return
+        size = int(df.memory_usage(deep=True).sum()) if not df.empty else 0
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[2]
+            self._entries[key] = (df, analysis, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, (_, _, old_size) = self._entries.popitem(last=False)
+                self._bytes -= old_size
+                self.evictions += 1
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """命中统计"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total * 100, 2) if total > 0 else 0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes
+        }
@@ -0,0 +1,110 @@
+"""
+JSON序列化
+缺失值和无穷值按列清理后再转为Python对象；响应使用orjson编码（不可用时退回标准库json）
+"""
+import json
+from typing import Dict, List, Any
+
+import pandas as pd
+import numpy as np
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # orjson为可选依赖，缺失时退回标准库json
+    orjson = None
+
+
+def sanitize_frame(df: pd.DataFrame, na_value: Any = None) -> pd.DataFrame:
+    """
+    按列清理：浮点列的 ±inf 视为缺失，缺失值替换为 na_value；
+    只有含缺失值的列才转换为object，其余列保持原类型
+
+    Args:
+        df: 数据
+        na_value: 缺失值的替代值
+
+    Returns:
+        pd.DataFrame: 可直接 to_dict('records') 并编码为JSON的数据
+    """
+    out = {}
+    for col, series in df.items():
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            series = series.astype(object)
+        values = series.to_numpy()
+        if values.dtype.kind == 'f':
+            missing = ~np.isfinite(values)
+        elif values.dtype.kind == 'M':
+            missing = np.isnat(values)
+            values = series.astype(object).to_numpy()
+        elif values.dtype.kind == 'O':
+            missing = pd.isna(values)
+        else:
+            out[col] = series
+            continue
+        if missing.any():
+            values = values.astype(object)
+            values[missing] = na_value
+            series = pd.Series(values, index=series.index, name=col)
+        out[col] = series
+    return pd.DataFrame(out, index=df.index, columns=df.columns)
+
+
+def frame_records(df: pd.DataFrame, na_value: Any = None) -> List[Dict[str, Any]]:
+    """DataFrame -> 记录列表，缺失值和无穷值为 na_value"""
+    return sanitize_frame(df, na_value).to_dict('records')
+
+
+def finite(value: Any, default: float = 0.0) -> float:
+    """标量转float，NaN/inf 记为 default"""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return default
+    return value if np.isfinite(value) else default
+
+
+def _plain(obj):
+    """标准库json的兜底转换：numpy类型转为Python类型，NaN/inf 转为None"""
+    if isinstance(obj, dict):
+        return {k if isinstance(k, str) else str(k): _plain(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_plain(v) for v in obj]
+    if isinstance(obj, np.ndarray):
+        return [_plain(v) for v in obj.tolist()]
+    if isinstance(obj, np.generic):
+        obj = obj.item()
+    if isinstance(obj, float) and not np.isfinite(obj):
+        return None
+    if obj is pd.NaT:
+        return None
+    if isinstance(obj, pd.Timestamp):
+        return obj.isoformat()
+    return obj
+
+
+def _orjson_default(obj):
+    """orjson不支持的类型：时间戳转ISO字符串，NaT为null，其余转字符串"""
+    if obj is pd.NaT:
+        return None
+    if isinstance(obj, pd.Timestamp):
+        return obj.isoformat()
+    return str(obj)
+
+
+def dumps(content: Any) -> bytes:
+    """
+    编码为JSON字节串；NaN/inf 输出为null，支持numpy标量和非字符串键
+    """
+    if orjson is not None:
+        return orjson.dumps(content, default=_orjson_default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(_plain(content), ensure_ascii=False, allow_nan=False).encode('utf-8')
+
+
+class FastJSONResponse(Response):
+    """用 dumps 编码的JSON响应；直接返回该对象可跳过FastAPI对返回值的逐层转换"""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
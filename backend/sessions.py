@@ -0,0 +1,187 @@
+"""
+上传会话注册表
+每个上传会话持有独立的 UploadProcessor；按全局内存预算做LRU淘汰，空闲超时的会话落盘，
+再次访问时从磁盘恢复（订单表已分类编码，产品目录按哈希共享），无需重新解析Excel
+"""
+import os
+import time
+import uuid
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+from upload_processor import UploadProcessor
+
+SESSION_DIR = "sessions"
+DEFAULT_MAX_BYTES = int(os.getenv("SESSION_MEMORY_MB", "1024")) * 1024 * 1024
+DEFAULT_IDLE_SECONDS = int(os.getenv("SESSION_IDLE_SECONDS", "1800"))
+DEFAULT_EXPIRE_SECONDS = int(os.getenv("SESSION_EXPIRE_SECONDS", "86400"))
+
+
+class SessionRegistry:
+    """
+    会话注册表
+
+    内存中的会话按最近访问排序；超过内存预算时把最久未访问的会话落盘，
+    空闲超过 idle_seconds 的会话也会落盘，落盘超过 expire_seconds 的会话被删除。
+    请求通过 acquire/release 使用会话，期间会话被固定（引用计数），不会被落盘或删除，
+    避免处理中的处理器被序列化、处理结果丢失。
+
+    Attributes:
+        max_bytes: 内存中会话的DataFrame总内存上限
+        idle_seconds: 空闲多久后落盘
+        expire_seconds: 空闲多久后删除
+    """
+
+    def __init__(self, root: str = SESSION_DIR, max_bytes: int = DEFAULT_MAX_BYTES,
+                 idle_seconds: int = DEFAULT_IDLE_SECONDS, expire_seconds: int = DEFAULT_EXPIRE_SECONDS):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.expire_seconds = expire_seconds
+        # 会话ID -> {'processor', 'bytes', 'last_access', 'spill_path', 'pins'}，按最近访问排序
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.spills = 0
+        self.restores = 0
+        self.expired = 0
+
+    def create(self, processor: UploadProcessor) -> str:
+        """登记新会话，返回会话ID"""
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self._sessions[session_id] = {
+                'processor': processor,
+                'bytes': processor.memory_usage(),
+                'last_access': time.time(),
+                'spill_path': None,
+                'pins': 0
+            }
+            self._enforce(keep=session_id)
+        return session_id
+
+    def acquire(self, session_id: str) -> Optional[UploadProcessor]:
+        """
+        获取并固定会话的处理器，已落盘的会话从磁盘恢复；用完后必须调用 release
+
+        Args:
+            session_id: 会话ID
+
+        Returns:
+            Optional[UploadProcessor]: 会话不存在或已过期时返回None（此时不固定）
+        """
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            if entry['processor'] is None:
+                entry['processor'] = self._restore(entry['spill_path'])
+                if entry['processor'] is None:
+                    self._drop(session_id)
+                    return None
+                self.restores += 1
+            entry['pins'] += 1
+            entry['last_access'] = time.time()
+            self._sessions.move_to_end(session_id)
+            self._enforce()
+            return entry['processor']
+
+    def release(self, session_id: str):
+        """请求处理完后解除固定，更新会话的内存占用并按预算淘汰"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                entry['pins'] = max(entry['pins'] - 1, 0)
+                if entry['processor'] is not None:
+                    entry['bytes'] = entry['processor'].memory_usage()
+                entry['last_access'] = time.time()
+            self._enforce(keep=session_id)
+
+    def remove(self, session_id: str):
+        """删除会话"""
+        with self._lock:
+            self._drop(session_id)
+
+    def clear(self):
+        """删除所有会话"""
+        with self._lock:
+            for session_id in list(self._sessions):
+                self._drop(session_id)
+
+    def _drop(self, session_id: str):
+        entry = self._sessions.pop(session_id, None)
+        if entry is not None and entry['spill_path']:
+            try:
+                os.remove(entry['spill_path'])
+            except OSError:
+                pass
+
+    def _spill(self, session_id: str):
+        """把会话序列化到磁盘并释放内存"""
+        entry = self._sessions[session_id]
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, f"{session_id}.pkl")
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(entry['processor'], f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        entry['processor'] = None
+        entry['bytes'] = 0
+        entry['spill_path'] = path
+        self.spills += 1
+        print(f"会话 {session_id[:8]} 已落盘: {os.path.getsize(path) / 1024 / 1024:.2f}MB")
+
+    @staticmethod
+    def _restore(path: Optional[str]) -> Optional[UploadProcessor]:
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except Exception as e:
+            print(f"会话恢复失败: {e}")
+            return None
+
+    def _enforce(self, keep: Optional[str] = None):
+        """过期删除、空闲落盘，再按内存预算从最久未访问的会话开始落盘（keep 与被固定的会话除外）"""
+        now = time.time()
+        for session_id, entry in list(self._sessions.items()):
+            if session_id == keep or entry['pins'] > 0:
+                continue
+            idle = now - entry['last_access']
+            if idle > self.expire_seconds:
+                self._drop(session_id)
+                self.expired += 1
+            elif idle > self.idle_seconds and entry['processor'] is not None:
+                self._spill(session_id)
+
+        total = sum(entry['bytes'] for entry in self._sessions.values())
+        for session_id in list(self._sessions):
+            if total <= self.max_bytes:
+                break
+            entry = self._sessions[session_id]
+            if session_id == keep or entry['pins'] > 0 or entry['processor'] is None:
+                continue
+            total -= entry['bytes']
+            self._spill(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """会话统计"""
+        with self._lock:
+            in_memory = [e for e in self._sessions.values() if e['processor'] is not None]
+            return {
+                'sessions': len(self._sessions),
+                'in_memory': len(in_memory),
+                'spilled': len(self._sessions) - len(in_memory),
+                'pinned': sum(1 for e in self._sessions.values() if e['pins'] > 0),
+                'memory_bytes': int(sum(e['bytes'] for e in in_memory)),
+                'max_bytes': self.max_bytes,
+                'spills': self.spills,
+                'restores': self.restores,
+                'expired': self.expired
+            }
+
+
+# 全局会话注册表
+session_registry = SessionRegistry()
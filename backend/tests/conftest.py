@@ -0,0 +1,21 @@
+"""后端模块以 backend 目录为导入根（与 uvicorn 在 backend 下启动一致）"""
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, "benchmarks"))
+
+
+@pytest.fixture
+def isolated_catalog(tmp_path, monkeypatch):
+    """产品目录写到临时目录，Excel在当前进程中解析（不启动解析进程池）"""
+    import upload_processor
+    from catalog_index import catalog_store
+
+    monkeypatch.setattr(catalog_store, "root", str(tmp_path / "catalog"))
+    monkeypatch.setattr(catalog_store, "_latest", None)
+    monkeypatch.setattr(upload_processor, "parse_workbooks", lambda paths: {})
+    return catalog_store
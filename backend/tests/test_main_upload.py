@@ -0,0 +1,67 @@
+"""上传接口的会话识别与导出"""
+import os
+
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+
+from synthetic_data import generate
+from exporters import write_xlsx
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch, isolated_catalog):
+    import main_upload
+    from sessions import session_registry
+    from upload_store import UploadStore
+
+    monkeypatch.setattr(main_upload, "upload_store", UploadStore(str(tmp_path / "uploads")))
+    monkeypatch.setattr(main_upload, "EXPORT_DIR", str(tmp_path / "exports"))
+    os.makedirs(tmp_path / "exports")
+    monkeypatch.setattr(session_registry, "root", str(tmp_path / "sessions"))
+    return TestClient(main_upload.app)
+
+
+@pytest.fixture
+def upload(tmp_path):
+    """产品表和订单表的上传表单"""
+    products, orders = generate(200, seed=1)
+    paths = {}
+    for name, df in (('product_file', products), ('order_file', orders)):
+        paths[name] = tmp_path / f"{name}.xlsx"
+        write_xlsx(str(paths[name]), {'Sheet1': df})
+    return {name: (path.name, path.read_bytes()) for name, path in paths.items()}
+
+
+def test_upload_sets_session_cookie(client, upload):
+    response = client.post("/upload/files", files=upload)
+    assert response.status_code == 200
+    session_id = response.json()["session_id"]
+    assert client.cookies.get("jd_session_id") == session_id
+
+    # 管理后台只带Cookie，不传请求头
+    shops = client.get("/data/shops")
+    assert shops.status_code == 200
+    assert shops.json()["total"] > 0
+
+    # 请求头优先于Cookie
+    assert client.get("/data/shops", headers={"X-Session-Id": "missing"}).status_code == 400
+
+    client.cookies.clear()
+    assert client.get("/data/shops").status_code == 400
+    assert client.get("/data/shops", headers={"X-Session-Id": session_id}).status_code == 200
+
+
+def test_export_writes_the_requested_result(client, upload, tmp_path):
+    assert client.post("/upload/files", files=upload).status_code == 200
+    shop = client.get("/data/shops").json()["shops"][0]
+
+    everything = client.post("/data/process", json={}).json()["data"]["total_records"]
+    one_shop = client.post("/data/process", json={"selected_shops": [shop]}).json()["data"]["total_records"]
+    assert one_shop < everything
+
+    # 导出命中缓存的全部数据：文件内容与请求一致，会话当前结果仍是上一次处理的单店铺结果
+    exported = client.post("/data/export", json={"export_format": "csv.gz"}).json()
+    assert exported["records_count"] == everything
+    assert len(pd.read_csv(tmp_path / "exports" / exported["filename"])) == everything
+    assert client.get("/data/records").json()["total"] == one_shop
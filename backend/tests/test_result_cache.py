@@ -0,0 +1,13 @@
+"""处理结果缓存的键"""
+from result_cache import ResultCache
+
+
+def test_key_ignores_options_the_pipeline_does_not_use():
+    cache = ResultCache()
+    fingerprint = ('orders', 'catalog')
+    plain = cache.make_key(fingerprint, {'selected_shops': ['b', 'a']})
+    flagged = cache.make_key(fingerprint, {'selected_shops': ['a', 'b', 'a'],
+                                           'include_closed_orders': True, 'include_offline_orders': True})
+    assert plain == flagged
+    assert cache.make_key(fingerprint, None) == cache.make_key(fingerprint, {'selected_shops': []})
+    assert cache.make_key(fingerprint, {'selected_shops': ['a']}) != plain
@@ -0,0 +1,26 @@
+"""SessionRegistry 的固定与落盘"""
+from sessions import SessionRegistry
+from upload_processor import UploadProcessor
+
+
+def test_pinned_session_is_not_spilled(tmp_path):
+    # idle_seconds=-1：未固定的会话在每次淘汰检查时都会落盘
+    registry = SessionRegistry(root=str(tmp_path), idle_seconds=-1)
+    first = registry.create(UploadProcessor())
+    processor = registry.acquire(first)
+
+    registry.create(UploadProcessor())
+    assert registry.stats()['pinned'] == 1
+    assert registry.stats()['spills'] == 0
+
+    # 解除固定后照常落盘，再次获取时从磁盘恢复
+    registry.release(first)
+    registry.create(UploadProcessor())
+    assert registry.acquire(first) is not processor
+    assert registry.stats()['restores'] == 1
+
+
+def test_unknown_session_is_not_pinned(tmp_path):
+    registry = SessionRegistry(root=str(tmp_path))
+    assert registry.acquire("missing") is None
+    assert registry.stats()['pinned'] == 0
@@ -0,0 +1,142 @@
+"""
+UploadProcessor 处理结果的回归测试
+数据来自 benchmarks/synthetic_data.py
+"""
+import warnings
+
+import pandas as pd
+import pytest
+
+from synthetic_data import generate
+from exporters import write_xlsx
+from upload_processor import UploadProcessor
+
+
+def make_processor(products: pd.DataFrame, orders: pd.DataFrame, encode: bool) -> UploadProcessor:
+    """与 load_from_files 相同的加载结果；encode=False 时跳过分类编码，作为基准"""
+    processor = UploadProcessor()
+    processor.product_df = products
+    processor.order_df = orders.copy()
+    mapping = processor.resolve_column_mapping()
+    processor.get_catalog()
+    if encode:
+        processor.encode_low_cardinality(processor.order_df, mapping)
+    return processor
+
+
+@pytest.fixture(scope="module")
+def synthetic():
+    return generate(5000, seed=1)
+
+
+@pytest.mark.parametrize("filter_options", [None, {'selected_shops': ['[京东]飞鸽官方店', '[淘宝]小土豆母婴']}])
+def test_encoding_does_not_change_output_dtypes(synthetic, filter_options):
+    products, orders = synthetic
+    baseline, _ = make_processor(products, orders, encode=False).process_data(filter_options)
+    encoded, _ = make_processor(products, orders, encode=True).process_data(filter_options)
+
+    assert not baseline.empty
+    pd.testing.assert_series_equal(encoded.dtypes, baseline.dtypes)
+    pd.testing.assert_frame_equal(encoded.drop(columns=['数据处理时间']),
+                                  baseline.drop(columns=['数据处理时间']))
+
+
+@pytest.fixture
+def workbooks(tmp_path, isolated_catalog):
+    """产品表、两个内容不同的基础订单表和一个追加批次"""
+    products, base_a = generate(400, seed=1)
+    _, base_b = generate(400, seed=2)
+    _, batch = generate(300, seed=3)
+    paths = {}
+    for name, df in (('products', products), ('base_a', base_a), ('base_b', base_b), ('batch', batch)):
+        paths[name] = str(tmp_path / f"{name}.xlsx")
+        write_xlsx(paths[name], {'Sheet1': df})
+    return paths
+
+
+def test_fingerprint_covers_every_order_file(workbooks):
+    sessions = {}
+    for name in ('base_a', 'base_b'):
+        processor = UploadProcessor()
+        assert processor.load_from_files(workbooks['products'], workbooks[name])
+        processor.append_order_batch(workbooks['batch'])
+        sessions[name] = processor
+
+    a, b = sessions['base_a'], sessions['base_b']
+    assert a.source_order_files() == [workbooks['base_a'], workbooks['batch']]
+    assert a.dataset_fingerprint() != b.dataset_fingerprint()
+
+    # 同样的文件序列得到同样的指纹
+    again = UploadProcessor()
+    assert again.load_from_files(workbooks['products'], workbooks['base_a'])
+    assert again.dataset_fingerprint() != a.dataset_fingerprint()
+    again.append_order_batch(workbooks['batch'])
+    assert again.dataset_fingerprint() == a.dataset_fingerprint()
+
+
+def test_job_spec_rebuilds_appended_batches(workbooks):
+    session = UploadProcessor()
+    assert session.load_from_files(workbooks['products'], workbooks['base_a'])
+    session.append_order_batch(workbooks['batch'])
+    expected, _ = session.process_data()
+
+    rebuilt = UploadProcessor.from_job_spec(session.job_spec())
+    result, _ = rebuilt.process_data()
+
+    assert rebuilt.dataset_fingerprint() == session.dataset_fingerprint()
+    assert len(result) == len(expected)
+    pd.testing.assert_frame_equal(result.drop(columns=['数据处理时间']), expected.drop(columns=['数据处理时间']))
+
+
+def test_append_keeps_categorical_encoding(tmp_path, isolated_catalog):
+    products, base = generate(400, seed=1)
+    _, batch = generate(300, seed=3)
+    # 文本订单号（读回后仍为object，会被分类编码）；新批次重发前10个订单并带来新店铺
+    base['订单号'] = 'JD' + base['订单号'].astype(str)
+    batch['订单号'] = 'JD' + batch['订单号'].astype(str)
+    resent = base[base['订单号'].isin(base['订单号'].unique()[:10])].assign(店铺名称='[京东]新店铺')
+    batch = pd.concat([resent, batch], ignore_index=True)
+    paths = {}
+    for name, df in (('products', products), ('base', base), ('batch', batch)):
+        paths[name] = str(tmp_path / f"{name}.xlsx")
+        write_xlsx(paths[name], {'Sheet1': df})
+
+    session = UploadProcessor()
+    assert session.load_from_files(paths['products'], paths['base'])
+    mapping = session.get_column_mapping()
+    encoded = [col for col, dtype in session.order_df.dtypes.items() if isinstance(dtype, pd.CategoricalDtype)]
+    assert mapping.order_id in encoded and mapping.shop in encoded
+    loaded = session.order_df.astype({col: object for col in encoded})
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", RuntimeWarning)
+        # 填充缺失值不依赖 pandas 已弃用的隐式向下转换
+        warnings.simplefilter("error", FutureWarning)
+        session.append_order_batch(paths['batch'])
+
+    merged = session.order_df
+    for col in encoded:
+        assert isinstance(merged[col].dtype, pd.CategoricalDtype), col
+
+    # 被新批次替换的订单只保留新批次的行
+    appended = pd.read_excel(paths['batch'])
+    replaced = loaded[mapping.order_id].isin(appended[mapping.order_id])
+    assert replaced.sum() > 0
+    expected = pd.concat([loaded[~replaced], appended], ignore_index=True)
+    pd.testing.assert_frame_equal(merged.astype({col: object for col in encoded}), expected, check_dtype=False)
+
+
+@pytest.mark.parametrize("copy_on_write", [False, True])
+def test_processing_leaves_order_table_untouched(synthetic, copy_on_write):
+    """不依赖全局的写时复制选项：两种模式下结果相同，且不改动已加载的订单表"""
+    products, orders = synthetic
+    with pd.option_context("mode.copy_on_write", copy_on_write):
+        processor = make_processor(products, orders, encode=True)
+        loaded = processor.order_df.copy()
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", pd.errors.SettingWithCopyWarning)
+            result, _ = processor.process_data()
+        pd.testing.assert_frame_equal(processor.order_df, loaded)
+
+    expected, _ = make_processor(products, orders, encode=True).process_data()
+    pd.testing.assert_frame_equal(result.drop(columns=['数据处理时间']), expected.drop(columns=['数据处理时间']))
@@ -4,11 +4,74 @@
 """
 import os
 import json
+import time
+import weakref
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from typing import Dict, List, Any, Optional, Tuple
 
 import pandas as pd
 import numpy as np
+from pandas.api.types import union_categoricals
+from openpyxl import load_workbook
+
+from frame_cache import read_excel_cached, frame_cache
+from column_mapping import ColumnMapping, present
+from catalog_index import CatalogIndex, catalog_store, normalize_keys
+from aggregation import aggregate_by_shop, order_codes, order_reductions, count_orders
+from incremental import DeltaLedger
+from exporters import export_frames
+from jobs import report_progress
+from serialization import sanitize_frame, frame_records
+from cube import AggregateCube
+from fingerprints import fold_columns, row_fingerprints, first_occurrence, unique_count
+from metrics import StageRecorder, stage, timed_iter, memory_window
+from query_plan import QueryPlan
+
+# 流式模式下每块的行数
+STREAM_CHUNK_SIZE = 50000
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "2"))
+
+_parse_pool: Optional[ProcessPoolExecutor] = None
+
+
+
+def _parse_excel_job(path: str) -> float:
+    """工作进程：解析Excel并写入列式缓存，返回解析耗时（秒）"""
+    start = time.perf_counter()
+    read_excel_cached(path)
+    return time.perf_counter() - start
+
+
+def parse_workbooks(paths: List[str]) -> Dict[str, float]:
+    """
+    在工作进程中并行解析多个Excel文件，解析结果写入列式缓存，之后的读取直接命中缓存
+
+    只有一个文件需要解析、或当前已在工作进程中时不启用进程池（由调用方直接解析）
+
+    Args:
+        paths: 需要解析的文件
+
+    Returns:
+        Dict[str, float]: 文件 -> 解析耗时；未并行解析的文件不在结果中
+    """
+    global _parse_pool
+    if len(paths) < 2 or multiprocessing.current_process().name != 'MainProcess':
+        return {}
+    try:
+        if _parse_pool is None:
+            _parse_pool = ProcessPoolExecutor(max_workers=max(1, PARSE_WORKERS))
+        futures = {path: _parse_pool.submit(_parse_excel_job, path) for path in paths}
+        return {path: future.result() for path, future in futures.items()}
+    except Exception as e:
+        # 进程池不可用时退回顺序解析
+        print(f"并行解析失败，改为顺序解析: {e}")
+        _parse_pool = None
+        return {}
+
+# 唯一值占比低于该值的列转为分类类型
+CATEGORY_MAX_RATIO = 0.5
 
 class UploadProcessor:
     """
@@ -27,6 +90,15 @@ class UploadProcessor:
         order_df: 订单数据DataFrame
         processed_data: 处理后的数据DataFrame
         dedup_stats: 去重统计信息
+        order_file_path: 订单文件路径（流式模式按块重新读取）
+        order_files: 构成当前订单数据的全部订单文件，按顺序为基础文件和逐批追加的文件
+        last_match_pair: 最近一次匹配使用的 (产品表列, 订单表列)
+        column_mapping: 已解析的列映射（每次上传解析一次，各环节共用）
+        column_overrides: 用户手动指定的列
+        match_report: 最近一次匹配各候选列组合的重合度打分
+        encoding_report: 加载时低基数列分类编码的内存统计
+        ledger: 增量处理账本（逐日追加订单时使用）
+        catalog: 产品目录索引（持久化、带版本，跨订单上传复用）
     """
 
     def __init__(self):
@@ -35,161 +107,589 @@ class UploadProcessor:
         self.order_df = None
         self.processed_data = None
         self.dedup_stats = {}
-
-    def load_from_files(self, product_file_path: str, order_file_path: str) -> bool:
+        self.order_file_path = None
+        self.order_files = []
+        self.product_file_path = None
+        self.last_match_pair = None
+        self.column_mapping = None
+        self.column_overrides = {}
+        self.match_report = []
+        self.encoding_report = {}
+        self.ledger = None
+        self.catalog = None
+        self.export_stats = {}
+        self.load_report = {}
+        self.cube = None
+        self._cube_source = None
+        # 订单表整行指纹缓存 (订单表弱引用, 指纹) 与最近一次匹配结果的整行指纹
+        self._order_fingerprints = None
+        self.match_fingerprints = None
+
+    def load_product_file(self, product_file_path: str) -> bool:
         """
-        从Excel文件加载产品和订单数据
+        只加载产品信息表（流式模式下订单表按块读取，不整体载入）
+
+        内容与最新产品目录版本一致时直接复用目录，不再解析Excel；
+        否则解析后发布为新的目录版本
 
         Args:
             product_file_path: 产品信息表文件路径
-            order_file_path: 订单数据文件路径
 
         Returns:
             bool: 加载成功返回True，失败返回False
         """
         try:
-            # 加载产品信息表
-            self.product_df = pd.read_excel(product_file_path)
+            content_hash = frame_cache.file_hash(product_file_path)
+            catalog = catalog_store.find(content_hash)
+            if catalog is None:
+                product_df = read_excel_cached(product_file_path)
+
+                # 清理产品数据：移除标题行，重置索引
+                if '商家编码' in product_df.columns:
+                    product_df = product_df[product_df['商家编码'] != '商家编码'].reset_index(drop=True)
 
-            # 清理产品数据：移除标题行，重置索引
-            if '商家编码' in self.product_df.columns:
-                self.product_df = self.product_df[self.product_df['商家编码'] != '商家编码'].reset_index(drop=True)
+                catalog = catalog_store.publish(product_df, content_hash, os.path.basename(product_file_path))
 
+            self._use_catalog(catalog)
+            self.product_file_path = product_file_path
+            return True
+        except Exception as e:
+            print(f"数据加载错误: {e}")
+            return False
+
+    def load_latest_catalog(self) -> bool:
+        """
+        使用最近一次上传的产品目录（只上传订单文件时）
+
+        Returns:
+            bool: 存在可用目录返回True
+        """
+        catalog = catalog_store.latest()
+        if catalog is None:
+            print("数据加载错误: 尚无产品目录，请先上传产品信息表")
+            return False
+        self._use_catalog(catalog)
+        return True
+
+    def _use_catalog(self, catalog: CatalogIndex):
+        self.catalog = catalog
+        self.product_df = catalog.frame
+        self.column_mapping = None
+        print(f"产品数据加载完成: {len(self.product_df)} 条记录 (目录 v{catalog.version})")
+
+    def get_catalog(self) -> CatalogIndex:
+        """获取与当前产品表对应的目录索引；产品表被直接替换过时临时重建"""
+        if self.catalog is None or self.catalog.frame is not self.product_df:
+            self.catalog = CatalogIndex(self.product_df)
+            self.product_df = self.catalog.frame
+        return self.catalog
+
+    def load_from_files(self, product_file_path: Optional[str], order_file_path: str) -> bool:
+        """
+        从Excel文件加载产品和订单数据
+
+        Args:
+            product_file_path: 产品信息表文件路径；为None时复用最新的产品目录
+            order_file_path: 订单数据文件路径
+
+        Returns:
+            bool: 加载成功返回True，失败返回False
+        """
+        # 需要解析Excel的文件（产品目录和列式缓存都未命中）先在工作进程中并行解析
+        product_source = 'catalog'
+        if product_file_path is not None and catalog_store.find(frame_cache.file_hash(product_file_path)) is None:
+            product_source = 'frame_cache' if frame_cache.is_cached(product_file_path) else 'parsed'
+        order_source = 'frame_cache' if frame_cache.is_cached(order_file_path) else 'parsed'
+        to_parse = [p for p, src in ((product_file_path, product_source), (order_file_path, order_source))
+                    if src == 'parsed']
+        parse_seconds = parse_workbooks(to_parse)
+
+        # 加载产品信息表
+        start = time.perf_counter()
+        if product_file_path is None:
+            if not self.load_latest_catalog():
+                return False
+        elif not self.load_product_file(product_file_path):
+            return False
+        self.load_report = {
+            'product': self._file_load_report(product_source, parse_seconds.get(product_file_path),
+                                              time.perf_counter() - start, len(self.product_df)),
+            'parallel_parse': len(parse_seconds) > 1
+        }
+
+        try:
             # 加载订单数据
-            self.order_df = pd.read_excel(order_file_path)
+            start = time.perf_counter()
+            self.order_df = read_excel_cached(order_file_path)
+            self.order_file_path = order_file_path
+            self.order_files = [order_file_path]
+            self.load_report['order'] = self._file_load_report(
+                order_source, parse_seconds.get(order_file_path), time.perf_counter() - start, len(self.order_df)
+            )
 
-            print(f"产品数据加载完成: {len(self.product_df)} 条记录")
             print(f"订单数据加载完成: {len(self.order_df)} 条记录")
 
+            self.column_mapping = None
+            mapping = self.resolve_column_mapping()
+            self.encoding_report = self.encode_low_cardinality(self.order_df, mapping)
+
             return True
         except Exception as e:
             print(f"数据加载错误: {e}")
             return False
 
 
+    @staticmethod
+    def _file_load_report(source: str, parse_seconds: Optional[float], load_seconds: float,
+                          rows: int) -> Dict[str, Any]:
+        """单个文件的加载耗时：source 为 catalog / frame_cache / parsed"""
+        return {
+            'source': source,
+            'parsed_in_worker': parse_seconds is not None,
+            'parse_seconds': round(parse_seconds, 3) if parse_seconds is not None else None,
+            'load_seconds': round(load_seconds, 3),
+            'ready_seconds': round((parse_seconds or 0) + load_seconds, 3),
+            'rows': int(rows)
+        }
+
+    @staticmethod
+    def _preview(df: pd.DataFrame) -> Dict[str, Any]:
+        return {
+            "columns": df.columns.tolist(),
+            "sample_data": frame_records(df.head(3), na_value=""),
+            "total_columns": len(df.columns)
+        }
+
     def analyze_uploaded_files(self, product_file_path: str, order_file_path: str) -> Dict[str, Any]:
-        """分析上传的文件结构"""
+        """分析上传的文件结构；已加载的表直接取前几行，不重新读取文件"""
         analysis = {"product_file": None, "order_file": None}
 
         try:
             # 分析产品文件
-            if os.path.exists(product_file_path):
-                df = pd.read_excel(product_file_path, nrows=5)
-                analysis["product_file"] = {
-                    "columns": df.columns.tolist(),
-                    "sample_data": df.head(3).fillna("").to_dict('records'),
-                    "total_columns": len(df.columns)
-                }
-
-            # 分析订单文件
-            if os.path.exists(order_file_path):
-                df = pd.read_excel(order_file_path, nrows=5)
-                analysis["order_file"] = {
-                    "columns": df.columns.tolist(),
-                    "sample_data": df.head(3).fillna("").to_dict('records'),
-                    "total_columns": len(df.columns)
-                }
+            if product_file_path and self.product_df is not None:
+                analysis["product_file"] = self._preview(self.product_df)
+            elif product_file_path and os.path.exists(product_file_path):
+                analysis["product_file"] = self._preview(read_excel_cached(product_file_path, nrows=5))
+
+            # 分析订单文件（流式模式下订单表未载入，只读前几行）
+            if self.order_df is not None:
+                analysis["order_file"] = self._preview(self.order_df)
+            elif os.path.exists(order_file_path):
+                analysis["order_file"] = self._preview(read_excel_cached(order_file_path, nrows=5))
 
         except Exception as e:
             analysis["error"] = str(e)
 
         return analysis
 
-    def clean_order_data(self, filter_options: Dict[str, Any] = None) -> pd.DataFrame:
+    def resolve_column_mapping(self, order_columns=None) -> ColumnMapping:
         """
-        清理订单数据，包含去重和过滤功能
+        解析并缓存列映射，已指定的覆盖项会一并应用
 
-        按订单级过滤金额与状态，保留订单内所有行（包括0元赠品/返现行）
+        Args:
+            order_columns: 订单表列名；不传时取已加载的订单表，流式模式下读取文件表头
+
+        Returns:
+            ColumnMapping: 列映射
+        """
+        if order_columns is None:
+            if self.order_df is not None:
+                order_columns = self.order_df.columns
+            elif self.order_file_path:
+                order_columns = self._read_order_header(self.order_file_path)
+            else:
+                order_columns = []
+        product_columns = self.product_df.columns if self.product_df is not None else []
+
+        mapping = ColumnMapping.resolve(order_columns, product_columns)
+        if self.column_overrides:
+            mapping = mapping.with_overrides(self.column_overrides)
+        self.column_mapping = mapping
+        return mapping
+
+    def get_column_mapping(self) -> ColumnMapping:
+        """获取列映射，未解析时先解析"""
+        if self.column_mapping is None:
+            return self.resolve_column_mapping()
+        return self.column_mapping
+
+    def set_column_overrides(self, overrides: Dict[str, Any]) -> ColumnMapping:
+        """
+        用户手动指定列，覆盖关键词识别结果
 
         Args:
-            filter_options: 过滤选项，包含店铺筛选等参数
+            overrides: 字段名 -> 列名
 
         Returns:
-            pd.DataFrame: 清理后的订单数据
+            ColumnMapping: 应用覆盖后的列映射
+
+        Raises:
+            ValueError: 字段名未知或列不存在
         """
-        if self.order_df is None:
-            return pd.DataFrame()
+        merged = {**self.column_overrides, **{k: v for k, v in overrides.items() if v is not None}}
+        mapping = self.get_column_mapping()
+        ColumnMapping.resolve(mapping.order_columns, mapping.product_columns).with_overrides(merged)
+        self.column_overrides = merged
+        return self.resolve_column_mapping(mapping.order_columns)
 
-        df = self.order_df.copy()
+    def memory_usage(self) -> int:
+        """
+        本会话独占的DataFrame内存（字节）；产品目录由所有会话共享，不计入
 
-        # ✅ 关键修复3：订单数据预处理去重，移除完全重复的订单行
-        original_order_rows = len(df)
-        df = df.drop_duplicates().reset_index(drop=True)
-        dedup_order_rows = len(df)
-        if original_order_rows != dedup_order_rows:
-            print(f"⚠️ 订单原始数据去重: {original_order_rows} -> {dedup_order_rows} 行 (去除了 {original_order_rows - dedup_order_rows} 个重复行)")
+        Returns:
+            int: 订单表、处理结果、增量账本的内存之和
+        """
+        frames = [self.order_df, self.processed_data]
+        if self.ledger is not None:
+            frames.append(self.ledger.processed)
+        return int(sum(df.memory_usage(deep=True).sum() for df in frames if df is not None and not df.empty))
 
-        filters = []
+    def __getstate__(self) -> Dict[str, Any]:
+        """
+        序列化（会话落盘）时不保存产品目录和可重算的处理结果：
+        目录按内容哈希从目录存储恢复，处理结果由结果缓存或重新处理得到
+        """
+        state = self.__dict__.copy()
+        state['processed_data'] = None
+        state['_order_fingerprints'] = None
+        state['match_fingerprints'] = None
+        if self.catalog is not None and self.catalog.content_hash and self.catalog.frame is self.product_df:
+            state['catalog'] = None
+            state['product_df'] = None
+            state['_catalog_hash'] = self.catalog.content_hash
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]):
+        catalog_hash = state.pop('_catalog_hash', None)
+        self.__dict__.update(state)
+        if catalog_hash is None:
+            return
+        catalog = catalog_store.get(catalog_hash)
+        if catalog is not None:
+            self.catalog = catalog
+            self.product_df = catalog.frame
+        elif self.product_file_path and os.path.exists(self.product_file_path):
+            self.load_product_file(self.product_file_path)
+        else:
+            print(f"产品目录 {catalog_hash[:12]} 已不存在，请重新上传产品信息表")
+
+    def job_spec(self) -> Dict[str, Any]:
+        """
+        可在工作进程中重建当前处理器的描述（只含文件路径和设置，不含DataFrame）
+
+        追加过批次的会话带上全部订单文件（基础文件 + 各批次，按顺序），重建出相同的合并订单表
 
-        # 订单标记列
-        order_mark_columns = [c for c in df.columns if any(k in str(c).lower() for k in ['订单标记','标记','mark'])]
-        if order_mark_columns:
-            mc = order_mark_columns[0]
-            filters.append(df[mc].astype(str).str.contains('空单', na=False) == False)
-            print(f"发现订单标记列: {mc}")
+        Returns:
+            Dict[str, Any]: 传给 from_job_spec 的参数
+        """
+        return {
+            'product_file_path': self.product_file_path,
+            'order_file_path': self.order_file_path,
+            'order_files': self.source_order_files(),
+            'streaming': self.order_df is None,
+            'column_overrides': dict(self.column_overrides)
+        }
+
+    @classmethod
+    def from_job_spec(cls, spec: Dict[str, Any]) -> "UploadProcessor":
+        """
+        按 job_spec 重建处理器；Excel解析结果和产品目录都走磁盘缓存，不会重复解析
+
+        Raises:
+            ValueError: 文件加载失败，或追加的批次缺少列
+        """
+        processor = cls()
+        order_files = spec['order_files']
+        if spec['streaming']:
+            if spec['product_file_path']:
+                success = processor.load_product_file(spec['product_file_path'])
+            else:
+                success = processor.load_latest_catalog()
+            processor.order_file_path = order_files[0]
         else:
-            print("警告：未找到订单标记列")
+            success = processor.load_from_files(spec['product_file_path'], order_files[0])
+        if not success:
+            raise ValueError("文件加载失败")
+        if spec['column_overrides']:
+            processor.set_column_overrides(spec['column_overrides'])
+        for order_file_path in order_files[1:]:
+            processor.merge_order_batch(order_file_path)
+        return processor
+
+    def source_order_files(self) -> List[str]:
+        """构成当前订单数据的订单文件（基础文件在前，追加的批次按顺序在后）"""
+        if self.order_files:
+            return list(self.order_files)
+        return [self.order_file_path] if self.order_file_path else []
+
+    def dataset_fingerprint(self) -> Optional[Tuple]:
+        """
+        当前数据集的指纹：按顺序排列的全部订单文件哈希、产品目录哈希、列映射覆盖项
 
-        # 金额列（买家实付）
-        amount_columns = [c for c in df.columns if any(k in str(c).lower() for k in ['买家实付','实付','金额','付款'])]
-        amount_col = amount_columns[0] if amount_columns else None
-        if amount_col:
-            # 统一为数值
-            df[amount_col] = pd.to_numeric(df[amount_col], errors='coerce').fillna(0)
-            print(f"发现买家实付列: {amount_col}")
+        Returns:
+            Optional[Tuple]: 订单来源不是文件（或文件已不存在）时返回None
+        """
+        files = self.source_order_files()
+        if not files or not all(os.path.exists(path) for path in files):
+            return None
+        catalog = self.get_catalog() if self.product_df is not None else None
+        product_hash = catalog.content_hash if catalog is not None else ""
+        overrides = tuple(sorted((k, repr(v)) for k, v in self.column_overrides.items()))
+        return (tuple(frame_cache.file_hash(path) for path in files), product_hash, overrides)
+
+    def _log_order_columns(self, mapping: ColumnMapping):
+        """打印清理所需列的识别结果"""
+        if mapping.mark:
+            print(f"发现订单标记列: {mapping.mark}")
+        else:
+            print("警告：未找到订单标记列")
+        if mapping.amount:
+            print(f"发现买家实付列: {mapping.amount}")
         else:
             print("警告：未找到买家实付列")
-
-        # 状态列
-        status_columns = [c for c in df.columns if any(k in str(c).lower() for k in ['状态','status'])]
-        for sc in status_columns:
-            s = df[sc].astype(str)
-            filters.append(s != '关闭')
-            filters.append(~s.str.contains('退款', na=False))
-            filters.append(s != '[线下订单]')
+        for sc in mapping.status:
             print(f"发现状态列: {sc}")
 
-        # 订单号列（用于“订单级”过滤）
-        order_id_cols = [c for c in df.columns if any(k in str(c).lower() for k in ['订单号','订单编号','order'])]
-        order_id_col = order_id_cols[0] if order_id_cols else None
+    @staticmethod
+    def encode_low_cardinality(df: pd.DataFrame, mapping: ColumnMapping) -> Dict[str, Any]:
+        """
+        把店铺、状态、订单标记、商品编码等低基数列原地转为分类类型；
+        订单号列不论基数都转换，分类编码即订单号的整数编码，供订单级归约使用；
+        成本计算时由 decode_categories 还原，分类类型不出现在处理结果中
+
+        Args:
+            df: 订单数据（原地修改）
+            mapping: 列映射
+
+        Returns:
+            Dict[str, Any]: 转换的列及转换前后的内存占用
+        """
+        candidates = [mapping.shop, mapping.mark, mapping.order_id] + mapping.status + mapping.order_sku_candidates
+        columns = [c for c in dict.fromkeys(candidates) if c is not None and c in df.columns]
+        columns = [c for c in columns if df[c].dtype == object]
+        if not columns or df.empty:
+            return {"columns": [], "memory_before_bytes": 0, "memory_after_bytes": 0}
+
+        before = int(df[columns].memory_usage(deep=True, index=False).sum())
+        encoded = []
+        for col in columns:
+            if col == mapping.order_id or df[col].nunique(dropna=True) <= len(df) * CATEGORY_MAX_RATIO:
+                df[col] = df[col].astype('category')
+                encoded.append(col)
+        after = int(df[columns].memory_usage(deep=True, index=False).sum())
+
+        if encoded:
+            print(f"分类编码: {encoded}，内存 {before / 1024 / 1024:.2f}MB -> {after / 1024 / 1024:.2f}MB")
+        return {"columns": encoded, "memory_before_bytes": before, "memory_after_bytes": after}
+
+    @staticmethod
+    def decode_categories(df: pd.DataFrame) -> List[str]:
+        """
+        把 encode_low_cardinality 转成分类类型的列原地还原为object列，
+        处理结果（导出、接口记录）的列类型与未编码时一致
+
+        Args:
+            df: 数据（原地修改）
+
+        Returns:
+            List[str]: 还原的列
+        """
+        columns = [col for col, dtype in df.dtypes.items() if isinstance(dtype, pd.CategoricalDtype)]
+        for col in columns:
+            df[col] = df[col].astype(object)
+        return columns
+
+    @staticmethod
+    def _str_predicate_mask(series: pd.Series, predicate) -> np.ndarray:
+        """
+        对 series.astype(str) 求布尔条件；分类列只对每个唯一值求一次，再按编码广播到各行
+
+        Args:
+            series: 待判断的列
+            predicate: 接收字符串Series、返回布尔Series的函数
+
+        Returns:
+            np.ndarray: 每行的判断结果
+        """
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            categories = pd.Series(series.cat.categories.astype(str))
+            # 末尾追加缺失值的字符串形式，编码 -1 正好取到它
+            lookup = predicate(pd.concat([categories, pd.Series(['nan'])], ignore_index=True)).to_numpy(dtype=bool)
+            return lookup[series.cat.codes.to_numpy()]
+        return predicate(series.astype(str)).to_numpy(dtype=bool)
+
+    def _base_filter_mask(self, df: pd.DataFrame, mapping: ColumnMapping) -> np.ndarray:
+        """行级基础过滤：空单标记、关闭/退款/线下订单"""
+        filters = []
+
+        mc = mapping.mark
+        if mc:
+            filters.append(self._str_predicate_mask(df[mc], lambda s: s.str.contains('空单', na=False) == False))
+
+        for sc in mapping.status:
+            filters.append(self._str_predicate_mask(
+                df[sc], lambda s: (s != '关闭') & ~s.str.contains('退款', na=False) & (s != '[线下订单]')))
+
+        return np.logical_and.reduce(filters) if filters else np.ones(len(df), dtype=bool)
+
+    def clean_order_data(self, filter_options: Dict[str, Any] = None,
+                         order_df: Optional[pd.DataFrame] = None,
+                         rows: Optional[np.ndarray] = None) -> pd.DataFrame:
+        """
+        清理订单数据，包含去重和过滤功能
+
+        按订单级过滤金额与状态，保留订单内所有行（包括0元赠品/返现行）
+
+        Args:
+            filter_options: 过滤选项，包含店铺筛选等参数
+            order_df: 要清理的订单数据，默认为已加载的订单表
+            rows: 查询计划扫描选出的行号（店铺谓词已下推）；给出时只处理这些行，不再按 selected_shops 筛选
+
+        Returns:
+            pd.DataFrame: 清理后的订单数据
+        """
+        if order_df is None:
+            order_df = self.order_df
+        if order_df is None:
+            return pd.DataFrame()
+
+        # 各步只在用到的列上求行掩码，最后按掩码取一次行，不产生中间的整表拷贝
+        # ✅ 关键修复3：订单数据预处理去重，移除完全重复的订单行（按整行指纹）
+        if rows is not None:
+            # 完全重复的行店铺相同，只在选出的行内去重；指纹已缓存时按行号取，否则只对这些行计算
+            cached = self._cached_order_fingerprints(order_df)
+            order_df = order_df.take(rows)
+            fingerprints = cached[rows] if cached is not None else row_fingerprints(order_df)
+        else:
+            fingerprints = self.order_row_fingerprints(order_df)
+        keep = first_occurrence(fingerprints)
+        del fingerprints
+        original_order_rows = len(order_df)
+        dedup_order_rows = int(keep.sum())
+        if original_order_rows != dedup_order_rows:
+            print(f"⚠️ 订单原始数据去重: {original_order_rows} -> {dedup_order_rows} 行 (去除了 {original_order_rows - dedup_order_rows} 个重复行)")
+
+        mapping = self.get_column_mapping()
+        self._log_order_columns(mapping)
+        amount_col = present(order_df.columns, mapping.amount)
+        order_id_col = present(order_df.columns, mapping.order_id)
+        # 统一为数值
+        amounts = pd.to_numeric(order_df[amount_col], errors='coerce').fillna(0) if amount_col else None
 
         # 应用基础过滤（标记/状态）
-        base_filter = np.logical_and.reduce(filters) if filters else np.ones(len(df), dtype=bool)
-        base_df = df[base_filter].copy()
+        filter_start = time.perf_counter()
+        base_filter = keep & self._base_filter_mask(order_df, mapping)
+        self.encoding_report['filter_time_ms'] = round((time.perf_counter() - filter_start) * 1000, 3)
 
         # ——关键：订单级金额过滤（合计>0的订单全部保留其所有行）
+        # 订单级归约在订单号编码上用 bincount 完成，过滤和订单数统计共用
+        if order_id_col:
+            codes, n_orders = order_codes(order_df[order_id_col])
         if amount_col and order_id_col:
-            order_sum = base_df.groupby(order_id_col)[amount_col].transform('sum')
-            keep_orders = order_sum > 0
-            cleaned_df = base_df[keep_orders].copy()
+            total_paid = order_reductions(codes, n_orders, base_filter, amounts=amounts.to_numpy())['total_paid']
+            mask = base_filter & (codes >= 0)
+            mask[mask] = total_paid[codes[mask]] > 0
         elif amount_col:
             # 无订单号时，只能行级兜底
-            cleaned_df = base_df[base_df[amount_col] > 0].copy()
+            mask = base_filter & (amounts.to_numpy() > 0)
         else:
-            cleaned_df = base_df.copy()
+            mask = base_filter
 
-        # 店铺筛选（可选）
-        if filter_options and 'selected_shops' in filter_options:
+        # 店铺筛选（可选，未下推到扫描时）
+        if rows is None and filter_options and 'selected_shops' in filter_options:
             selected = filter_options['selected_shops'] or []
             if selected:
-                shop_cols = [c for c in df.columns if any(k in str(c).lower() for k in ['店铺','shop'])]
-                if shop_cols:
-                    cleaned_df = cleaned_df[cleaned_df[shop_cols[0]].isin(selected)]
+                shop_col = present(order_df.columns, mapping.shop)
+                if shop_col:
+                    mask = mask & order_df[shop_col].isin(selected).to_numpy()
+
+        # 行号沿用去重后的顺序编号；按行号取行得到独立的新表，之后改写金额列不会影响原表
+        cleaned_df = order_df.take(np.flatnonzero(mask))
+        cleaned_df.index = pd.RangeIndex(dedup_order_rows)[mask[keep]]
+        if amount_col:
+            cleaned_df[amount_col] = amounts[mask].to_numpy()
 
         # ——统计信息（行数 vs 订单数）
-        original_lines = len(df)
+        original_lines = dedup_order_rows
         cleaned_lines = len(cleaned_df)
         if order_id_col:
-            original_orders = int(df[order_id_col].nunique())
-            cleaned_orders = int(cleaned_df[order_id_col].nunique())
+            original_orders = count_orders(codes, n_orders, keep)
+            cleaned_orders = count_orders(codes, n_orders, mask)
             print(f"原始：{original_lines} 行 / {original_orders} 单；清理后：{cleaned_lines} 行 / {cleaned_orders} 单")
+            if mapping.status:
+                # 含退款行的订单（退款行已按行剔除，订单其余行仍保留）
+                refund = np.logical_or.reduce([
+                    self._str_predicate_mask(order_df[sc], lambda s: s.str.contains('退款', na=False))
+                    for sc in mapping.status
+                ])
+                has_refund = order_reductions(codes, n_orders, keep, refund=refund)['has_refund']
+                print(f"含退款行的订单: {int(np.count_nonzero(has_refund))} 单")
         else:
             print(f"原始：{original_lines} 行；清理后：{cleaned_lines} 行（无订单号列，无法统计订单数）")
 
         return cleaned_df
 
 
-    def match_products_with_orders(self, order_df: pd.DataFrame) -> pd.DataFrame:
+    def order_row_fingerprints(self, order_df: pd.DataFrame) -> np.ndarray:
+        """
+        订单表整行指纹；同一张订单表按不同筛选条件多次处理时只计算一次
+
+        Args:
+            order_df: 订单数据
+
+        Returns:
+            np.ndarray: uint64行指纹
+        """
+        cached = self._cached_order_fingerprints(order_df)
+        if cached is not None:
+            return cached
+        fingerprints = row_fingerprints(order_df)
+        self._order_fingerprints = (weakref.ref(order_df), fingerprints)
+        return fingerprints
+
+    def _cached_order_fingerprints(self, order_df: pd.DataFrame) -> Optional[np.ndarray]:
+        """已缓存的整行指纹，缓存的不是这张订单表时为None"""
+        cached = self._order_fingerprints
+        if cached is not None and cached[0]() is order_df and len(cached[1]) == len(order_df):
+            return cached[1]
+        return None
+
+    def query_plan(self, filter_options: Dict[str, Any] = None,
+                   columns: Optional[List[str]] = None, optimize: bool = True) -> QueryPlan:
+        """
+        当前订单来源的处理计划
+
+        Args:
+            filter_options: 过滤选项
+            columns: 订单表列名，默认取列映射解析时的列
+            optimize: 是否做谓词下推
+
+        Returns:
+            QueryPlan: 处理计划
+        """
+        mapping = self.get_column_mapping()
+        source = 'memory' if self.order_df is not None else 'stream'
+        plan = QueryPlan.build(mapping, mapping.order_columns if columns is None else columns,
+                               filter_options, source)
+        return plan.optimize() if optimize else plan
+
+    def explain(self, filter_options: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        处理计划说明：优化后的计划、下推说明，以及未优化的逻辑计划
+
+        Args:
+            filter_options: 过滤选项
+
+        Returns:
+            Dict[str, Any]: 见 QueryPlan.explain，另含 logical_plan
+        """
+        logical = self.query_plan(filter_options, optimize=False)
+        result = logical.optimize().explain(self.order_df)
+        result['logical_plan'] = logical.explain()['plan']
+        return result
+
+    def match_products_with_orders(self, order_df: pd.DataFrame,
+                                   key_pair: Optional[Tuple[str, str]] = None) -> pd.DataFrame:
         """
         匹配产品信息和订单信息，自动处理重复数据
 
@@ -198,95 +698,116 @@ class UploadProcessor:
 
         Args:
             order_df: 清理后的订单数据
+            key_pair: 指定 (产品表列, 订单表列) 时只用这一组匹配，不再逐组尝试
 
         Returns:
             pd.DataFrame: 匹配后的数据
         """
+        self.match_fingerprints = None
         if self.product_df is None or order_df.empty:
             return pd.DataFrame()
 
-        # 获取列名信息用于匹配
-
-        # 查找商品编码列
-        product_sku_cols = []
-        for col in self.product_df.columns:
-            col_str = str(col).lower()
-            if any(keyword in col_str for keyword in ['商家编码', 'sku', '编号', '商品编码', '货号', 'code']):
-                product_sku_cols.append(col)
+        # 候选编码列来自列映射
+        mapping = self.get_column_mapping()
+        product_sku_cols = [c for c in mapping.product_sku_candidates if c in self.product_df.columns]
+        order_sku_cols = [c for c in mapping.order_sku_candidates if c in order_df.columns]
 
-        order_sku_cols = []
-        for col in order_df.columns:
-            col_str = str(col).lower()
-            if any(keyword in col_str for keyword in ['商品编码', 'sku', '编号', '商家编码', '货号', 'code']):
-                order_sku_cols.append(col)
+        if key_pair is not None:
+            product_sku_cols = [key_pair[0]] if key_pair[0] in self.product_df.columns else []
+            order_sku_cols = [key_pair[1]] if key_pair[1] in order_df.columns else []
 
         # 检查是否找到可匹配的编码列
 
         if not product_sku_cols or not order_sku_cols:
             print("警告：未找到匹配的商品编码列")
             # 如果无法匹配，至少要保留订单数据，并手动创建一个成本列用于后续处理
-            order_df = order_df.copy()
-            order_df['匹配状态'] = '未匹配'
-            return order_df
-
-        # 尝试多个组合进行匹配
-        best_matched_df = None
-        best_match_count = 0
-
-        for product_col in product_sku_cols:
-            for order_col in order_sku_cols:
-                print(f"\n尝试匹配: 产品表[{product_col}] <-> 订单表[{order_col}]")
-
-                # 准备数据
-                product_df = self.product_df.copy()
-                temp_order_df = order_df.copy()
-
-                product_df[product_col] = product_df[product_col].astype(str).str.strip()
-                temp_order_df[order_col] = temp_order_df[order_col].astype(str).str.strip()
-
-                # ✅ 关键修复1：产品表去重，避免同一商品编码对应多个产品记录导致重复
-                product_before_dedup = len(product_df)
-                product_df = product_df.drop_duplicates(subset=[product_col], keep='first')
-                product_after_dedup = len(product_df)
-                if product_before_dedup != product_after_dedup:
-                    print(f"⚠️ 产品表去重: {product_before_dedup} -> {product_after_dedup} 行 (去除了 {product_before_dedup - product_after_dedup} 个重复商品编码)")
-
-                # 进行数据匹配
-
-                # 匹配逻辑
-                matched_df = temp_order_df.merge(
-                    product_df,
-                    left_on=order_col,
-                    right_on=product_col,
-                    how='left',
-                    suffixes=('_order', '_product')
-                )
-
-                matched_count = len(matched_df[matched_df[product_col].notna()])
-                # 记录匹配结果
-
-                if matched_count > best_match_count:
-                    best_match_count = matched_count
-                    best_matched_df = matched_df
-                    # 更新最佳匹配结果
-
-        if best_matched_df is not None and best_match_count > 0:
-            # 使用最佳匹配结果
-
-            # ✅ 关键修复2：最终结果去重，确保没有完全重复的行
-            original_rows = len(best_matched_df)
-            best_matched_df = best_matched_df.drop_duplicates().reset_index(drop=True)
-            final_rows = len(best_matched_df)
-            if original_rows != final_rows:
-                print(f"⚠️ 最终结果去重: {original_rows} -> {final_rows} 行 (去除了 {original_rows - final_rows} 个重复行)")
-
-            return best_matched_df
-        else:
+            return order_df.assign(匹配状态='未匹配')
+
+        # 先用归一化后的编码集合为每组列打分，只对得分最高的一组做一次合并
+        scores = self.score_key_pairs(order_df, product_sku_cols, order_sku_cols)
+        self.match_report = scores
+        for item in scores:
+            print(f"匹配打分: 产品表[{item['product_col']}] <-> 订单表[{item['order_col']}] 命中 {item['matched_rows']}/{item['total_rows']} 行")
+
+        best = None
+        for item in scores:
+            if best is None or item['matched_rows'] > best['matched_rows']:
+                best = item
+
+        if best is None or best['matched_rows'] == 0:
             print("\n警告：所有匹配尝试都失败！")
             # 返回原始订单数据，但添加标记
-            order_df = order_df.copy()
-            order_df['匹配状态'] = '匹配失败'
-            return order_df
+            return order_df.assign(匹配状态='匹配失败')
+
+        product_col, order_col = best['product_col'], best['order_col']
+        self.last_match_pair = (product_col, order_col)
+
+        # ✅ 关键修复1：产品目录按编码取第一条记录，避免同一商品编码对应多个产品记录导致重复
+        catalog = self.get_catalog()
+        product_rows, unique_keys = len(catalog.frame), len(catalog.unique_keys(product_col))
+        if product_rows != unique_keys:
+            print(f"⚠️ 产品表去重: {product_rows} -> {unique_keys} 行 (去除了 {product_rows - unique_keys} 个重复商品编码)")
+
+        # 匹配逻辑：按编码向量化查表，代替左连接
+        matched_df = catalog.lookup(order_df, order_col, product_col, suffixes=('_order', '_product'))
+
+        # ✅ 关键修复2：最终结果去重，确保没有完全重复的行
+        # 产品侧各列由归一化后的编码唯一确定，合并后整行重复等价于订单侧各列（编码列取归一化值）重复，
+        # 所以只哈希订单侧，不做整表比较
+        fingerprints = fold_columns(order_df, list(order_df.columns),
+                                    lambda col, s: normalize_keys(s) if col == order_col else s)
+        keep = first_occurrence(fingerprints)
+        original_rows = len(matched_df)
+        if not keep.all():
+            matched_df = matched_df[keep].reset_index(drop=True)
+            fingerprints = fingerprints[keep]
+        self.match_fingerprints = fingerprints
+        final_rows = len(matched_df)
+        if original_rows != final_rows:
+            print(f"⚠️ 最终结果去重: {original_rows} -> {final_rows} 行 (去除了 {original_rows - final_rows} 个重复行)")
+
+        return matched_df
+
+    def score_key_pairs(self, order_df: pd.DataFrame, product_cols: List[str],
+                        order_cols: List[str]) -> List[Dict[str, Any]]:
+        """
+        为每组 (产品表列, 订单表列) 计算编码重合度
+
+        每列只归一化一次（转字符串 + 去空格）：产品列取唯一编码集合，
+        订单列按编码计数，命中行数 = 订单编码落在产品编码集合中的行数，
+        与左连接后的匹配行数一致，但无需真正合并
+
+        Args:
+            order_df: 订单数据
+            product_cols: 产品表候选编码列
+            order_cols: 订单表候选编码列
+
+        Returns:
+            List[Dict[str, Any]]: 按尝试顺序排列的打分结果
+        """
+        catalog = self.get_catalog()
+        product_keys = {col: catalog.unique_keys(col) for col in product_cols}
+        order_key_counts = {
+            col: normalize_keys(order_df[col]).value_counts(sort=False)
+            for col in order_cols
+        }
+
+        total_rows = len(order_df)
+        scores = []
+        for product_col in product_cols:
+            for order_col in order_cols:
+                counts = order_key_counts[order_col]
+                hit = counts.index.isin(product_keys[product_col])
+                matched_rows = int(counts.to_numpy()[hit].sum())
+                scores.append({
+                    'product_col': product_col,
+                    'order_col': order_col,
+                    'matched_rows': matched_rows,
+                    'total_rows': total_rows,
+                    'matched_keys': int(hit.sum()),
+                    'overlap_rate': round(matched_rows / total_rows * 100, 2) if total_rows > 0 else 0
+                })
+        return scores
 
     def calculate_costs_and_profits(self, matched_df: pd.DataFrame) -> pd.DataFrame:
         """
@@ -304,40 +825,29 @@ class UploadProcessor:
         if matched_df.empty:
             return pd.DataFrame()
 
-        df = matched_df.copy()
+        # 浅拷贝即可：之后只整列新增或替换（不原地写入），不影响匹配结果
+        df = matched_df.copy(deep=False)
 
-        # —— 只从【产品表】来的列里找成本（带 _product 后缀优先）
+        mapping = self.get_column_mapping()
+
+        # —— 只从【产品表】来的列里找成本（与订单表同名时取带 _product 后缀的列）
         # 允许的关键词仅限成本相关，避免“一口价/最低报价/实际价格”等被误判
-        def is_cost_name(name: str) -> bool:
-            n = str(name).lower()
-            return any(k in n for k in ['成本', '进货', '采购', 'cost'])
-
-        # 先找带 _product 的成本列（确保来自产品表）
-        product_cost_cols = [c for c in df.columns if c.endswith('_product') and is_cost_name(c)]
-        # 再兜底：产品表原始列名（无后缀，但只在订单侧不存在同名时才会这样）
-        if not product_cost_cols and self.product_df is not None:
-            product_cost_cols = [c for c in self.product_df.columns if is_cost_name(c) and c in df.columns]
-
-        if product_cost_cols:
-            unit_cost_col = product_cost_cols[0]
+        unit_cost_col = present(df.columns, mapping.merged_name(mapping.product_cost, 'product'))
+        if unit_cost_col:
             df['单位成本'] = pd.to_numeric(df[unit_cost_col], errors='coerce').fillna(0)
         else:
             df['单位成本'] = 0.0
 
         # —— 数量（优先这些名字）
-        qty_candidates = [c for c in df.columns if any(k in str(c).lower() for k in
-                            ['数量','件数','qty','num','购买数量','下单数量','宝贝总数量'])]
-        if qty_candidates:
-            qty_col = qty_candidates[0]
+        qty_col = present(df.columns, mapping.merged_name(mapping.quantity))
+        if qty_col:
             df['数量'] = pd.to_numeric(df[qty_col], errors='coerce').fillna(1)
         else:
             df['数量'] = 1
 
         # —— 可选收入（不影响“成本正确”）
-        amount_cols = [c for c in df.columns if any(k in str(c).lower() for k in
-                        ['买家实付','实付','付款','应付','支付','金额','收款','成交价','支付金额'])]
-        if amount_cols:
-            amount_col = amount_cols[0]
+        amount_col = present(df.columns, mapping.merged_name(mapping.revenue))
+        if amount_col:
             df['销售收入'] = pd.to_numeric(df[amount_col], errors='coerce').fillna(0).round(2)
         else:
             df['销售收入'] = 0.0
@@ -350,8 +860,23 @@ class UploadProcessor:
         # 清理和验证数据
 
         df['数据处理时间'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        df.replace([np.inf, -np.inf], 0, inplace=True)
-        df.fillna(0, inplace=True)
+        # inf 只可能出现在浮点列（按 dtypes 判断，select_dtypes 会拷贝这些列）
+        float_cols = [col for col, dtype in df.dtypes.items() if pd.api.types.is_float_dtype(dtype)]
+        for col in float_cols:
+            values = df[col].to_numpy()
+            if np.isinf(values).any():
+                df[col] = np.where(np.isinf(values), 0, values)
+        # 分类编码只在处理内部使用，输出前还原为object列，再逐列填充缺失值（整表 fillna 会拷贝所有列）
+        self.decode_categories(df)
+        for col in [c for c in df.columns if df[c].hasnans]:
+            series = df[col]
+            if series.dtype == object:
+                # object 列的 fillna 会隐式向下转换类型（pandas 已弃用）：按掩码填充后显式推断类型
+                values = series.to_numpy(copy=True)
+                values[series.isna().to_numpy()] = 0
+                df[col] = pd.Series(values, index=series.index, name=col).infer_objects(copy=False)
+            else:
+                df[col] = series.fillna(0)
         return df
 
 
@@ -361,24 +886,42 @@ class UploadProcessor:
     def get_available_shops(self) -> List[str]:
         """获取所有可用的店铺列表"""
         if self.order_df is None:
+            if self.order_file_path:
+                return self._stream_available_shops()
             return []
 
-        shop_columns = []
-        for col in self.order_df.columns:
-            if any(keyword in str(col).lower() for keyword in ['店铺', 'shop']):
-                shop_columns.append(col)
-
-        if shop_columns:
-            return sorted(self.order_df[shop_columns[0]].unique().tolist())
+        shop_col = present(self.order_df.columns, self.get_column_mapping().shop)
+        if shop_col:
+            return sorted(self.order_df[shop_col].unique().tolist())
         return []
 
-    def detect_duplicates(self, df: pd.DataFrame, description: str = "") -> Dict[str, Any]:
-        """检测数据框中的重复情况并返回详细报告"""
+    def _stream_available_shops(self) -> List[str]:
+        """流式模式下逐块收集店铺名称"""
+        shop_col = self.get_column_mapping().shop
+        if shop_col is None:
+            return []
+        shops = set()
+        for chunk in self.iter_order_chunks(self.order_file_path):
+            shops.update(chunk[shop_col].unique().tolist())
+        return sorted(shops)
+
+    def detect_duplicates(self, df: pd.DataFrame, description: str = "",
+                          fingerprints: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        """
+        检测数据框中的重复情况并返回详细报告
+
+        Args:
+            df: 数据
+            description: 报告说明
+            fingerprints: 已算好的整行指纹（与 df 行对齐），不传时计算一次
+        """
         if df.empty:
             return {"total_rows": 0, "duplicate_rows": 0, "duplicate_rate": 0}
 
         total_rows = len(df)
-        unique_rows = len(df.drop_duplicates())
+        if fingerprints is None or len(fingerprints) != total_rows:
+            fingerprints = row_fingerprints(df)
+        unique_rows = unique_count(fingerprints)
         duplicate_rows = total_rows - unique_rows
         duplicate_rate = round(duplicate_rows / total_rows * 100, 2) if total_rows > 0 else 0
 
@@ -416,66 +959,182 @@ class UploadProcessor:
 
         return report
 
-    def safe_json_convert(self, obj):
-        """安全的JSON转换，处理NaN和特殊值"""
-        if isinstance(obj, (np.integer, np.floating)):
-            if np.isnan(obj) or np.isinf(obj):
-                return 0
-            return float(obj)
-        elif isinstance(obj, dict):
-            return {key: self.safe_json_convert(value) for key, value in obj.items()}
-        elif isinstance(obj, list):
-            return [self.safe_json_convert(item) for item in obj]
-        elif pd.isna(obj):
-            return None
-        return obj
-
     def get_summary_statistics(self, processed_df: pd.DataFrame) -> Dict[str, Any]:
         if processed_df.empty:
             return {}
 
-        shop_cols = [c for c in processed_df.columns if any(k in str(c).lower() for k in ['店铺', 'shop'])]
+        mapping = self.get_column_mapping()
+        shop_col = present(processed_df.columns, mapping.merged_name(mapping.shop))
         total_cost = float(pd.to_numeric(processed_df.get('总成本', 0), errors='coerce').fillna(0).sum())
         total_revenue = float(pd.to_numeric(processed_df.get('销售收入', 0), errors='coerce').fillna(0).sum())
         total_profit = round(total_revenue - total_cost, 2)
 
-        return self.safe_json_convert({
+        # 值均为Python标量，NaN/inf 由响应编码器输出为null
+        return {
             'total_records': int(len(processed_df)),
-            'total_shops': int(processed_df[shop_cols[0]].nunique()) if shop_cols else 0,
+            'total_shops': int(processed_df[shop_col].nunique()) if shop_col else 0,
             'total_cost': total_cost,
             'total_revenue': total_revenue,
             'total_profit': total_profit,
             'avg_margin': float(pd.to_numeric(processed_df.get('毛利率', 0), errors='coerce').fillna(0)[pd.to_numeric(processed_df.get('销售收入', 0), errors='coerce').fillna(0) > 0].mean()) if total_revenue > 0 else 0.0
-        })
+        }
 
 
     def analyze_by_shop(self, processed_df: pd.DataFrame) -> Dict[str, Any]:
         if processed_df.empty:
             return {}
 
-        shop_cols = [c for c in processed_df.columns if any(k in str(c).lower() for k in ['店铺', 'shop'])]
-        if not shop_cols:
+        mapping = self.get_column_mapping()
+        shop_col = present(processed_df.columns, mapping.merged_name(mapping.shop))
+        if not shop_col:
             return {}
-        shop_col = shop_cols[0]
 
+        totals = aggregate_by_shop(
+            processed_df, shop_col,
+            revenue_col='销售收入', cost_col='总成本', margin_col='毛利率',
+            order_id_col=present(processed_df.columns, mapping.merged_name(mapping.order_id))
+        )
+
+        # 按列把 NaN/inf 置为None，再逐店铺取值
+        values = sanitize_frame(totals[['lines', 'cost', 'revenue', 'profit', 'avg_margin']])
         out = {}
-        for shop in processed_df[shop_col].dropna().unique():
-            sub = processed_df[processed_df[shop_col] == shop]
-            total_cost = float(pd.to_numeric(sub.get('总成本', 0), errors='coerce').fillna(0).sum())
-            total_rev = float(pd.to_numeric(sub.get('销售收入', 0), errors='coerce').fillna(0).sum())
-            profit = round(total_rev - total_cost, 2)
-            margin = float(pd.to_numeric(sub.get('毛利率', 0), errors='coerce').fillna(0)[pd.to_numeric(sub.get('销售收入', 0), errors='coerce').fillna(0) > 0].mean()) if total_rev > 0 else 0.0
-            out[str(shop)] = self.safe_json_convert({
+        for shop, row in zip(totals.index, values.itertuples(index=False)):
+            out[str(shop)] = {
                 'shop_name': str(shop),
-                'total_orders': int(len(sub)),
-                'total_cost': total_cost,
-                'total_revenue': total_rev,
-                'total_profit': profit,
-                'avg_margin': margin
-            })
+                'total_orders': int(row.lines),
+                'total_cost': row.cost,
+                'total_revenue': row.revenue,
+                'total_profit': row.profit,
+                'avg_margin': row.avg_margin
+            }
         return out
 
 
+    def build_cube(self, processed_df: pd.DataFrame) -> Optional[AggregateCube]:
+        """
+        按 店铺 × 商品编码 × 付款日 物化聚合立方体，之后的汇总查询不再访问明细
+
+        Args:
+            processed_df: 处理后的数据
+
+        Returns:
+            Optional[AggregateCube]: 处理结果为空时为None
+        """
+        self._cube_source = id(processed_df)
+        if processed_df is None or processed_df.empty:
+            self.cube = None
+            return None
+        mapping = self.get_column_mapping()
+        columns = processed_df.columns
+        self.cube = AggregateCube.build(
+            processed_df,
+            shop_col=present(columns, mapping.merged_name(mapping.shop)),
+            product_col=present(columns, mapping.merged_name(mapping.sku)),
+            revenue_col='销售收入', cost_col='总成本', profit_col='利润', quantity_col='数量',
+            order_id_col=present(columns, mapping.merged_name(mapping.order_id)),
+            date_col=present(columns, mapping.merged_name(mapping.date))
+        )
+        return self.cube
+
+    def get_cube(self) -> Optional[AggregateCube]:
+        """
+        当前处理结果的聚合立方体
+
+        处理结果来自结果缓存或后台任务时立方体尚未构建，此时补建一次；
+        会话落盘恢复后没有明细，直接使用落盘前的立方体
+        """
+        if self.processed_data is not None and self._cube_source != id(self.processed_data):
+            return self.build_cube(self.processed_data)
+        return self.cube
+
+    def run_pipeline(self, order_df: pd.DataFrame, filter_options: Dict[str, Any] = None,
+                     recorder: Optional[StageRecorder] = None) -> Tuple[Optional[pd.DataFrame], int]:
+        """
+        对一批订单执行 清理 -> 匹配 -> 成本计算 -> 最终业务去重
+
+        Args:
+            order_df: 订单数据
+            filter_options: 过滤选项
+            recorder: 本次处理的阶段记录器，None时不记录
+
+        Returns:
+            Tuple[Optional[pd.DataFrame], int]: 处理后的数据（清理后为空时为None）和清理后的行数
+        """
+        # 重置去重统计
+        self.dedup_stats = {}
+
+        rows = None
+        if order_df is not None:
+            # 店铺谓词下推到扫描：只取所选店铺的行，之后各阶段只处理这些行
+            with stage(recorder, 'scan', len(order_df)) as record:
+                rows = self.query_plan(filter_options, list(order_df.columns)).scan_rows(order_df)
+                record['rows_out'] = len(order_df) if rows is None else len(rows)
+        with stage(recorder, 'clean', len(order_df) if rows is None else len(rows)) as record:
+            cleaned_orders = self.clean_order_data(filter_options, order_df=order_df, rows=rows)
+            record['rows_out'] = len(cleaned_orders)
+        if cleaned_orders.empty:
+            return None, 0
+
+        # 上一阶段的结果用完即释放，同一时刻只保留相邻两个阶段的数据
+        cleaned_lines = len(cleaned_orders)
+        with stage(recorder, 'match', cleaned_lines) as record:
+            matched_data = self.match_products_with_orders(cleaned_orders)
+            record['rows_out'] = len(matched_data)
+        del cleaned_orders
+        with stage(recorder, 'costs', len(matched_data)) as record:
+            processed_data = self.calculate_costs_and_profits(matched_data)
+            record['rows_out'] = len(processed_data)
+        del matched_data
+        with stage(recorder, 'dedup', len(processed_data)) as record:
+            processed_data = self.final_dedup(processed_data)
+            record['rows_out'] = len(processed_data)
+
+        return processed_data, cleaned_lines
+
+    def final_dedup(self, processed_data: pd.DataFrame) -> pd.DataFrame:
+        """
+        最终业务去重：按 订单号 + 商品编码 + 规格名称 的指纹保留第一行，并把前后的重复报告写入 dedup_stats
+
+        Args:
+            processed_data: 成本计算后的数据
+
+        Returns:
+            pd.DataFrame: 去重后的数据
+        """
+        # ✅ 关键修复4：最终数据智能去重，基于关键业务字段避免重复
+        if processed_data.empty:
+            return processed_data
+
+        before_final_dedup = len(processed_data)
+
+        # 检测处理前的重复情况：成本利润列由匹配结果逐行算出，沿用匹配阶段的整行指纹
+        row_fp = self.match_fingerprints
+        before_dedup_report = self.detect_duplicates(processed_data, "处理完成后、最终去重前", row_fp)
+        self.dedup_stats['before_final_dedup'] = before_dedup_report
+
+        # 找到关键字段用于去重（订单号+商品编码+规格等）
+        mapping = self.get_column_mapping()
+        key_columns = [c for c in mapping.final_dedup_keys() if c in processed_data.columns]
+
+        # 如果找到了关键字段，基于这些字段的指纹去重
+        if key_columns:
+            keep = first_occurrence(row_fingerprints(processed_data, key_columns))
+            if not keep.all():
+                # 按行号取行得到新表后直接换索引，reset_index 还会再拷贝一次
+                processed_data = processed_data.take(np.flatnonzero(keep))
+                processed_data.index = pd.RangeIndex(len(processed_data))
+                row_fp = row_fp[keep] if row_fp is not None and len(row_fp) == len(keep) else None
+            after_final_dedup = len(processed_data)
+            if before_final_dedup != after_final_dedup:
+                print(f"⚠️ 最终业务去重: {before_final_dedup} -> {after_final_dedup} 行 (基于 {key_columns} 去除了 {before_final_dedup - after_final_dedup} 个重复业务记录)")
+
+            # 检测最终去重后的情况
+            after_dedup_report = self.detect_duplicates(processed_data, "最终去重后", row_fp)
+            self.dedup_stats['after_final_dedup'] = after_dedup_report
+            self.dedup_stats['final_dedup_key_columns'] = key_columns
+
+        return processed_data
+
     def process_data(self, filter_options: Dict[str, Any] = None) -> Tuple[pd.DataFrame, Dict[str, Any]]:
         """
         执行完整的数据处理流程
@@ -488,90 +1147,553 @@ class UploadProcessor:
         Returns:
             Tuple[pd.DataFrame, Dict[str, Any]]: 处理后的数据和分析结果
         """
-        print("开始数据处理...")
+        if self.order_df is None and self.order_file_path:
+            return self.process_data_streaming(self.order_file_path, filter_options)
 
-        # 重置去重统计
-        self.dedup_stats = {}
+        print("开始数据处理...")
 
-        cleaned_orders = self.clean_order_data(filter_options)
-        if cleaned_orders.empty:
-            return pd.DataFrame(), {}
+        # 记录器随本次调用创建、逐层传递，同一会话的并发请求各用各的
+        recorder = StageRecorder('upload')
+        try:
+            with memory_window() as memory:
+                processed_data, cleaned_lines = self.run_pipeline(self.order_df, filter_options, recorder)
+                if processed_data is None:
+                    return pd.DataFrame(), {}
+
+                # 统计：行数 + 订单数
+                mapping = self.get_column_mapping()
+                order_id_col = present(processed_data.columns, mapping.merged_name(mapping.order_id))
+                cleaned_order_count = count_orders(*order_codes(processed_data[order_id_col])) if order_id_col else 0
+
+                summary, shop_analysis = self._analyze(processed_data, recorder)
+            analysis = {
+                'summary': summary,
+                'shop_analysis': shop_analysis,
+                'processing_info': {
+                    'original_lines': len(self.order_df) if self.order_df is not None else 0,
+                    'cleaned_lines': cleaned_lines,
+                    'cleaned_orders': cleaned_order_count,  # ✅ 真正的"单数"
+                    'matched_lines': len(processed_data),
+                    'processed_time': datetime.now().isoformat(),
+                    'encoding': {
+                        **self.encoding_report,
+                        # 本次处理期间的RSS峰值增量（不是进程历史峰值）
+                        'peak_mb': round(memory['peak_bytes'] / 1024 / 1024, 2)
+                    },
+                    **recorder.report()
+                },
+                'deduplication_stats': self.dedup_stats,  # ✅ 添加去重统计信息
+                'match_report': self.match_report
+            }
+        finally:
+            recorder.close()
+        self.processed_data = processed_data
+        print("数据处理完成!")
+        return processed_data, analysis
 
-        matched_data = self.match_products_with_orders(cleaned_orders)
-        processed_data = self.calculate_costs_and_profits(matched_data)
+    def _analyze(self, processed_data: pd.DataFrame,
+                 recorder: Optional[StageRecorder]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        汇总统计、店铺分析并构建聚合立方体，各自记为 recorder 的一个阶段
 
-        # ✅ 关键修复4：最终数据智能去重，基于关键业务字段避免重复
-        if not processed_data.empty:
-            before_final_dedup = len(processed_data)
+        Returns:
+            Tuple[Dict[str, Any], Dict[str, Any]]: 汇总统计, 店铺分析
+        """
+        rows = len(processed_data)
+        with stage(recorder, 'summary', rows):
+            summary = self.get_summary_statistics(processed_data)
+        with stage(recorder, 'shops', rows) as record:
+            shop_analysis = self.analyze_by_shop(processed_data)
+            record['rows_out'] = len(shop_analysis)
+        with stage(recorder, 'cube', rows) as record:
+            cube = self.build_cube(processed_data)
+            record['rows_out'] = cube.info()['cells'] if cube is not None else 0
+        return summary, shop_analysis
+
+
+    def iter_order_chunks(self, order_file_path: str, chunk_size: int = STREAM_CHUNK_SIZE,
+                          predicate: Optional[Tuple[str, set]] = None, counts: Optional[Dict[str, int]] = None):
+        """
+        以openpyxl只读模式逐行读取订单表，按固定行数产出DataFrame块
 
-            # 检测处理前的重复情况
-            before_dedup_report = self.detect_duplicates(processed_data, "处理完成后、最终去重前")
-            self.dedup_stats['before_final_dedup'] = before_dedup_report
+        表头按 pd.read_excel 的规则处理，整行为空的行被跳过
 
-            # 找到关键字段用于去重（订单号+商品编码+规格等）
-            key_columns = []
+        Args:
+            order_file_path: 订单文件路径
+            chunk_size: 每块行数
+            predicate: 下推到扫描的谓词 (列名, 取值集合)，不满足的行在构造DataFrame之前跳过
+            counts: 可选字典，rows 回传读到的非空行数（含被谓词跳过的行）
 
-            # 订单号
-            order_cols = [c for c in processed_data.columns if any(k in str(c).lower() for k in ['订单号','订单编号','order'])]
-            if order_cols:
-                key_columns.append(order_cols[0])
+        Yields:
+            pd.DataFrame: 订单数据块
+        """
+        wb = load_workbook(order_file_path, read_only=True, data_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+
+            columns = self._normalize_header(header)
+            width = len(columns)
+            position = None
+            if predicate is not None and predicate[0] in columns:
+                position, accepted = columns.index(predicate[0]), predicate[1]
+
+            buffer = []
+            for row in rows:
+                if all(v is None for v in row):
+                    continue
+                if counts is not None:
+                    counts['rows'] = counts.get('rows', 0) + 1
+                if position is not None and (row[position] if position < len(row) else None) not in accepted:
+                    continue
+                if len(row) != width:
+                    row = (tuple(row) + (None,) * width)[:width]
+                buffer.append(row)
+                if len(buffer) >= chunk_size:
+                    yield self._records_to_frame(buffer, columns)
+                    buffer = []
+            if buffer:
+                yield self._records_to_frame(buffer, columns)
+        finally:
+            wb.close()
+
+    @staticmethod
+    def _normalize_header(header: tuple) -> List[str]:
+        """与 pd.read_excel 一致：空表头记为 "Unnamed: i"，重名列加 ".1" 等后缀"""
+        columns = []
+        for i, name in enumerate(header):
+            name = f"Unnamed: {i}" if name is None else str(name)
+            base, n = name, 0
+            while name in columns:
+                n += 1
+                name = f"{base}.{n}"
+            columns.append(name)
+        return columns
+
+    @staticmethod
+    def _read_order_header(order_file_path: str) -> List[str]:
+        """只读取订单表表头"""
+        wb = load_workbook(order_file_path, read_only=True, data_only=True)
+        try:
+            header = next(wb.active.iter_rows(max_row=1, values_only=True), ())
+            return UploadProcessor._normalize_header(header)
+        finally:
+            wb.close()
+
+    @staticmethod
+    def _records_to_frame(records: List[tuple], columns: List[str]) -> pd.DataFrame:
+        """行记录转DataFrame，空单元格统一为NaN（与 pd.read_excel 一致）"""
+        df = pd.DataFrame.from_records(records, columns=columns)
+        return df.where(df.notna(), np.nan)
+
+    @staticmethod
+    def _row_fingerprints(df: pd.DataFrame, columns: Optional[List[str]] = None) -> np.ndarray:
+        """整行（或指定列）指纹；先转object，保证不同块中同一行的指纹不受推断dtype影响"""
+        return row_fingerprints(df, columns, as_object=True)
+
+    @staticmethod
+    def _drop_seen_rows(df: pd.DataFrame, fingerprints: np.ndarray, seen: set) -> pd.DataFrame:
+        """去掉本块内重复及之前块已出现过的行，并把新指纹登记到 seen"""
+        values = fingerprints
+        keep = first_occurrence(values) & ~np.fromiter((v in seen for v in values.tolist()), dtype=bool, count=len(values))
+        seen.update(values[keep].tolist())
+        # 按行号取出独立的新块，调用方随后整列改写金额不会触及原块
+        return df.take(np.flatnonzero(keep))
+
+    def iter_processed_chunks(self, order_file_path: str, filter_options: Dict[str, Any] = None,
+                              chunk_size: int = STREAM_CHUNK_SIZE, stats: Dict[str, Any] = None,
+                              recorder: Optional[StageRecorder] = None):
+        """
+        流式处理订单表：按块完成清理、匹配和成本计算
 
-            # 商品编码
-            sku_cols = [c for c in processed_data.columns if any(k in str(c).lower() for k in ['商品编码','商家编码','sku','货号'])]
-            if sku_cols:
-                key_columns.append(sku_cols[0])
+        订单表读两遍：第一遍只累计每个订单的买家实付合计，
+        第二遍再按块过滤，使“订单合计>0”规则跨块依然成立。
+        完全重复行和最终业务去重都用哈希集合跨块判断，集合大小与去重后的行数成正比。
 
-            # 规格名称（如果存在）
-            spec_cols = [c for c in processed_data.columns if any(k in str(c).lower() for k in ['规格','spec','型号'])]
-            if spec_cols:
-                key_columns.append(spec_cols[0])
+        Args:
+            order_file_path: 订单文件路径
+            filter_options: 过滤选项
+            chunk_size: 每块行数
+            stats: 可选字典，用于回传行数、块数等统计
+            recorder: 阶段记录器，None时不记录
 
-            # 如果找到了关键字段，基于这些字段去重
+        Yields:
+            pd.DataFrame: 处理完成的数据块
+        """
+        stats = stats if stats is not None else {}
+        stats.update({'original_lines': 0, 'duplicate_lines': 0, 'cleaned_lines': 0,
+                      'final_dedup_lines': 0, 'chunks': 0, 'chunk_size': chunk_size})
+        if self.product_df is None:
+            return
+
+        # 店铺谓词下推到读取：两遍都只为所选店铺的行构造DataFrame
+        selected = (filter_options or {}).get('selected_shops') or []
+        plan = self.query_plan(filter_options) if selected else None
+        predicate = (plan.shop_col, set(plan.scan_shops)) if plan is not None and plan.scan_shops else None
+
+        # 第一遍：去重 + 基础过滤后，累计订单级金额合计
+        mapping = None
+        order_totals = pd.Series(dtype=float)
+        seen_rows = set()
+        counts = {'rows': 0}
+        scanned_lines = 0
+        for chunk in timed_iter(recorder, 'read', self.iter_order_chunks(order_file_path, chunk_size, predicate, counts)):
+            with stage(recorder, 'scan', len(chunk)) as record:
+                if mapping is None:
+                    mapping = self.resolve_column_mapping(order_columns=chunk.columns)
+                    self._log_order_columns(mapping)
+                stats['chunks'] += 1
+                scanned_lines += len(chunk)
+
+                deduped = self._drop_seen_rows(chunk, self._row_fingerprints(chunk), seen_rows)
+                stats['duplicate_lines'] += len(chunk) - len(deduped)
+                record['rows_out'] = len(deduped)
+
+                amount_col, order_id_col = mapping.amount, mapping.order_id
+                if amount_col and order_id_col:
+                    base_df = deduped[self._base_filter_mask(deduped, mapping)]
+                    amounts = pd.to_numeric(base_df[amount_col], errors='coerce').fillna(0)
+                    partial = amounts.groupby(base_df[order_id_col]).sum()
+                    order_totals = order_totals.add(partial, fill_value=0)
+
+        stats['original_lines'] = counts['rows']
+        if mapping is None:
+            return
+        if stats['duplicate_lines']:
+            print(f"⚠️ 订单原始数据去重: {scanned_lines} -> {scanned_lines - stats['duplicate_lines']} 行 (去除了 {stats['duplicate_lines']} 个重复行)")
+        keep_order_ids = set(order_totals.index[order_totals > 0])
+        del order_totals
+
+        seen_rows = set()
+        seen_keys = set()
+        key_pair = None
+        for chunk in timed_iter(recorder, 'read', self.iter_order_chunks(order_file_path, chunk_size, predicate)):
+            with stage(recorder, 'clean', len(chunk)) as record:
+                df = self._drop_seen_rows(chunk, self._row_fingerprints(chunk), seen_rows)
+
+                amount_col, order_id_col = mapping.amount, mapping.order_id
+                if amount_col:
+                    df[amount_col] = pd.to_numeric(df[amount_col], errors='coerce').fillna(0)
+                df = df[self._base_filter_mask(df, mapping)]
+
+                if amount_col and order_id_col:
+                    df = df[df[order_id_col].isin(keep_order_ids)]
+                elif amount_col:
+                    df = df[df[amount_col] > 0]
+
+                if selected and predicate is None and mapping.shop:
+                    df = df[df[mapping.shop].isin(selected)]
+                record['rows_out'] = len(df)
+
+            if df.empty:
+                continue
+            stats['cleaned_lines'] += len(df)
+
+            # 第一块确定匹配列组合，后续块沿用，避免各块选出不同的列
+            with stage(recorder, 'match', len(df)) as record:
+                matched = self.match_products_with_orders(df, key_pair=key_pair)
+                record['rows_out'] = len(matched)
+            if key_pair is None and self.last_match_pair is not None:
+                key_pair = self.last_match_pair
+            with stage(recorder, 'costs', len(matched)) as record:
+                processed = self.calculate_costs_and_profits(matched)
+                record['rows_out'] = len(processed)
+
+            key_columns = [c for c in mapping.final_dedup_keys() if c in processed.columns]
             if key_columns:
-                processed_data = processed_data.drop_duplicates(subset=key_columns, keep='first').reset_index(drop=True)
-                after_final_dedup = len(processed_data)
-                if before_final_dedup != after_final_dedup:
-                    print(f"⚠️ 最终业务去重: {before_final_dedup} -> {after_final_dedup} 行 (基于 {key_columns} 去除了 {before_final_dedup - after_final_dedup} 个重复业务记录)")
+                with stage(recorder, 'dedup', len(processed)) as record:
+                    before = len(processed)
+                    processed = self._drop_seen_rows(processed, self._row_fingerprints(processed, key_columns), seen_keys)
+                    stats['final_dedup_lines'] += before - len(processed)
+                    stats['final_dedup_key_columns'] = key_columns
+                    record['rows_out'] = len(processed)
+
+            if not processed.empty:
+                yield processed.reset_index(drop=True)
+
+    def process_data_streaming(self, order_file_path: str, filter_options: Dict[str, Any] = None,
+                               chunk_size: int = STREAM_CHUNK_SIZE) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """
+        流式模式的完整数据处理流程：按块读取和处理订单表，原始订单表不整体载入内存
+
+        内存并不随块大小封顶：处理完的各块最后合并为一个DataFrame，跨块去重的指纹集合
+        也随行数增长，峰值内存仍与处理结果的行数成正比
+
+        Args:
+            order_file_path: 订单文件路径
+            filter_options: 过滤选项
+            chunk_size: 每块行数
+
+        Returns:
+            Tuple[pd.DataFrame, Dict[str, Any]]: 处理后的数据和分析结果
+        """
+        print(f"开始流式数据处理（每块 {chunk_size} 行）...")
 
-                # 检测最终去重后的情况
-                after_dedup_report = self.detect_duplicates(processed_data, "最终去重后")
-                self.dedup_stats['after_final_dedup'] = after_dedup_report
-                self.dedup_stats['final_dedup_key_columns'] = key_columns
+        self.dedup_stats = {}
+        stats = {}
+        recorder = StageRecorder('upload_streaming')
+        try:
+            chunks = list(self.iter_processed_chunks(order_file_path, filter_options, chunk_size, stats, recorder))
+            if not chunks:
+                return pd.DataFrame(), {}
+
+            with stage(recorder, 'concat', sum(len(c) for c in chunks)) as record:
+                processed_data = pd.concat(chunks, ignore_index=True)
+                del chunks
+                record['rows_out'] = len(processed_data)
+
+            self.dedup_stats = {
+                'stream_duplicate_lines': stats['duplicate_lines'],
+                'final_dedup_lines': stats['final_dedup_lines'],
+                'final_dedup_key_columns': stats.get('final_dedup_key_columns', [])
+            }
+
+            mapping = self.get_column_mapping()
+            order_id_col = present(processed_data.columns, mapping.merged_name(mapping.order_id))
+            cleaned_order_count = count_orders(*order_codes(processed_data[order_id_col])) if order_id_col else 0
+
+            summary, shop_analysis = self._analyze(processed_data, recorder)
+            analysis = {
+                'summary': summary,
+                'shop_analysis': shop_analysis,
+                'processing_info': {
+                    'original_lines': stats['original_lines'],
+                    'cleaned_lines': stats['cleaned_lines'],
+                    'cleaned_orders': cleaned_order_count,
+                    'matched_lines': len(processed_data),
+                    'streaming': True,
+                    'chunks': stats['chunks'],
+                    'chunk_size': chunk_size,
+                    'processed_time': datetime.now().isoformat(),
+                    **recorder.report()
+                },
+                'deduplication_stats': self.dedup_stats,
+                'match_report': self.match_report
+            }
+        finally:
+            recorder.close()
+        self.processed_data = processed_data
+        print("数据处理完成!")
+        return processed_data, analysis
+
+    def append_order_batch(self, order_file_path: str,
+                           filter_options: Dict[str, Any] = None) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """
+        增量模式：追加一批订单，只清理、计算新批次
 
-        # 统计：行数 + 订单数
-        order_id_cols = [c for c in processed_data.columns if any(k in str(c).lower() for k in ['订单号','订单编号','order'])]
-        order_id_col = order_id_cols[0] if order_id_cols else None
-        cleaned_order_count = int(processed_data[order_id_col].nunique()) if order_id_col else 0
+        首次调用时先把已加载的订单表作为第一批入账；之后每批中出现过的订单号
+        会替换账本里的旧行，汇总按增量更新
 
+        Args:
+            order_file_path: 新批次订单文件路径
+            filter_options: 过滤选项（只影响返回结果，账本始终保存全部店铺）
+
+        Returns:
+            Tuple[pd.DataFrame, Dict[str, Any]]: 累计处理后的数据和分析结果
+        """
+        print("开始增量处理...")
+        recorder = StageRecorder('incremental')
+        try:
+            return self._append_order_batch(order_file_path, filter_options, recorder)
+        finally:
+            recorder.close()
+
+    def _append_order_batch(self, order_file_path: str, filter_options: Dict[str, Any],
+                            recorder: StageRecorder) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """append_order_batch 的实现，阶段记录器由调用方创建和关闭"""
+        with stage(recorder, 'read') as record:
+            batch = read_excel_cached(order_file_path)
+            record['rows_out'] = len(batch)
+
+        if self.ledger is None:
+            base_columns = self.order_df.columns if self.order_df is not None else batch.columns
+            mapping = self.resolve_column_mapping(order_columns=base_columns)
+            self.ledger = DeltaLedger(
+                order_id_col=mapping.merged_name(mapping.order_id),
+                shop_col=mapping.merged_name(mapping.shop),
+                sku_col=mapping.merged_name(mapping.sku)
+            )
+            if self.order_df is not None:
+                self._apply_batch(self.order_df, os.path.basename(self.order_file_path or ""), recorder)
+            # 流式模式的订单文件不入账，之后的订单数据只由追加的批次构成
+            self.order_files = self.source_order_files() if self.order_df is not None else []
+
+        mapping = self.get_column_mapping()
+        self._check_batch_columns(batch, mapping)
+
+        with stage(recorder, 'encode', len(batch)):
+            self.encode_low_cardinality(batch, mapping)
+        batch_info = self._apply_batch(batch, os.path.basename(order_file_path), recorder)
+        self._merge_order_df(batch, order_file_path, mapping)
+
+        selected = (filter_options or {}).get('selected_shops') or None
+        with stage(recorder, 'summary') as record:
+            processed_data = self.ledger.rows(selected)
+            summary = self.ledger.summary(selected)
+            shop_analysis = self.ledger.shop_analysis(selected)
+            product_analysis = self.ledger.product_analysis()
+            record['rows_out'] = len(processed_data)
         analysis = {
-            'summary': self.get_summary_statistics(processed_data),
-            'shop_analysis': self.analyze_by_shop(processed_data),
+            'summary': summary,
+            'shop_analysis': shop_analysis,
+            'product_analysis': product_analysis,
             'processing_info': {
-                'original_lines': len(self.order_df) if self.order_df is not None else 0,
-                'cleaned_lines': len(cleaned_orders),
-                'cleaned_orders': cleaned_order_count,  # ✅ 真正的"单数"
+                'incremental': True,
+                'batch': batch_info,
+                'batches': len(self.ledger.batches),
                 'matched_lines': len(processed_data),
-                'processed_time': datetime.now().isoformat()
+                'processed_time': datetime.now().isoformat(),
+                **recorder.report()
             },
-            'deduplication_stats': self.dedup_stats  # ✅ 添加去重统计信息
+            'deduplication_stats': self.dedup_stats,
+            'match_report': self.match_report
         }
         self.processed_data = processed_data
-        print("数据处理完成!")
+        print(f"增量处理完成: 新增 {batch_info['added_lines']} 行，替换 {batch_info['replaced_orders']} 单")
         return processed_data, analysis
 
+    def merge_order_batch(self, order_file_path: str):
+        """
+        只把一批订单合并进订单表，不处理也不入账（在工作进程中按 job_spec 重建追加过批次的会话时使用）
+
+        Raises:
+            ValueError: 新批次缺少列
+        """
+        batch = read_excel_cached(order_file_path)
+        mapping = self.get_column_mapping()
+        self._check_batch_columns(batch, mapping)
+        self.encode_low_cardinality(batch, mapping)
+        self._merge_order_df(batch, order_file_path, mapping)
+
+    @staticmethod
+    def _check_batch_columns(batch: pd.DataFrame, mapping: ColumnMapping):
+        missing = [c for c in (mapping.order_id, mapping.shop) if c and c not in batch.columns]
+        if missing:
+            raise ValueError(f"新批次缺少列: {missing}")
+
+    def _merge_order_df(self, batch: pd.DataFrame, order_file_path: str, mapping: ColumnMapping):
+        """原始订单表同步：被替换的订单号以新批次为准，并记下批次文件"""
+        if self.order_df is not None and mapping.order_id:
+            base, batch = self._align_categories(self.order_df, batch)
+            id_col = mapping.order_id
+            if isinstance(base[id_col].dtype, pd.CategoricalDtype) and base[id_col].dtype == batch[id_col].dtype:
+                # 两边共用同一组类别，直接比较订单号编码（-1 为缺失订单号，不参与替换）
+                batch_codes = batch[id_col].cat.codes.to_numpy()
+                replaced = np.isin(base[id_col].cat.codes.to_numpy(), batch_codes[batch_codes >= 0])
+            else:
+                batch_ids = batch[id_col].dropna().astype(str).unique()
+                replaced = (base[id_col].notna() & base[id_col].astype(str).isin(batch_ids)).to_numpy()
+            kept = base.take(np.flatnonzero(~replaced))
+            self.order_df = pd.concat([kept, batch], ignore_index=True)
+            # 类别无法合并（类别的类型不同）的列在合并后退回object，按原规则重新编码
+            self.encode_low_cardinality(self.order_df, mapping)
+        else:
+            self.order_df = batch
+        self.order_file_path = order_file_path
+        self.order_files.append(order_file_path)
+
+    @staticmethod
+    def _align_categories(base: pd.DataFrame, batch: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        让两表共有的分类列使用同一组类别，concat 时保持分类类型（类别不同时 pandas 会退回object列）
+
+        原订单表的类别顺序不变、新类别追加在后，已有行的编码不变；只有一边为分类的列，另一边也转为分类
+
+        Args:
+            base: 原订单表
+            batch: 新批次
+
+        Returns:
+            Tuple[pd.DataFrame, pd.DataFrame]: 对齐后的两表（浅拷贝，不改动传入的数据）
+        """
+        base, batch = base.copy(deep=False), batch.copy(deep=False)
+        for col in base.columns.intersection(batch.columns):
+            left, right = base[col], batch[col]
+            if not isinstance(left.dtype, pd.CategoricalDtype) and not isinstance(right.dtype, pd.CategoricalDtype):
+                continue
+            left, right = left.astype('category'), right.astype('category')
+            try:
+                categories = union_categoricals([left.array, right.array]).categories
+            except TypeError:
+                continue
+            base[col] = left.cat.set_categories(categories)
+            batch[col] = right.cat.set_categories(categories)
+        return base, batch
+
+    def _apply_batch(self, batch: pd.DataFrame, source: str,
+                     recorder: Optional[StageRecorder] = None) -> Dict[str, Any]:
+        """处理一批订单（不做店铺筛选）并入账"""
+        mapping = self.get_column_mapping()
+        processed, _ = self.run_pipeline(batch, recorder=recorder)
+        batch_ids = batch[mapping.order_id].dropna().unique() if mapping.order_id else []
+        with stage(recorder, 'ledger', len(processed) if processed is not None else 0):
+            return self.ledger.apply(processed, batch_ids, source)
+
+    def export_processed_data(self, output_path: str = "processed_data.xlsx", fmt: str = 'xlsx') -> bool:
+        """
+        导出处理后的数据
 
-    def export_processed_data(self, output_path: str = "processed_data.xlsx") -> bool:
-        """导出处理后的数据"""
+        Args:
+            output_path: 导出文件路径
+            fmt: 导出格式（xlsx / csv.gz / parquet）
+
+        Returns:
+            bool: 是否成功，导出统计保存在 export_stats
+        """
         if self.processed_data is None or self.processed_data.empty:
             return False
 
         try:
-            with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
-                # 主数据表
-                self.processed_data.to_excel(writer, sheet_name='处理后数据', index=False)
-
+            self.export_stats = export_frames(output_path, {'处理后数据': self.processed_data}, fmt)
             print(f"数据已导出到: {output_path}")
             return True
         except Exception as e:
             print(f"导出失败: {e}")
-            return False
\ No newline at end of file
+            return False
+
+
+def run_process_job(job_id: str, spec: Dict[str, Any],
+                    filter_options: Dict[str, Any] = None) -> Tuple[pd.DataFrame, Dict[str, Any], Optional[Tuple]]:
+    """
+    进程池任务：重建处理器并执行数据处理
+
+    Returns:
+        Tuple[pd.DataFrame, Dict[str, Any], Optional[Tuple]]: 处理后的数据、分析结果，
+        以及重建出的数据集指纹（主进程据此判断结果是否仍对应会话的当前数据）
+    """
+    report_progress(job_id, "loading", 0.1)
+    processor = UploadProcessor.from_job_spec(spec)
+    report_progress(job_id, "processing", 0.3)
+    processed_df, analysis = processor.process_data(filter_options)
+    report_progress(job_id, "finishing", 0.9)
+    return processed_df, analysis, processor.dataset_fingerprint()
+
+
+def run_export_job(job_id: str, spec: Dict[str, Any], filter_options: Dict[str, Any],
+                   output_path: str, fmt: str = 'xlsx') -> Dict[str, Any]:
+    """
+    进程池任务：重建处理器、处理并导出
+
+    Returns:
+        Dict[str, Any]: 导出文件名、记录数、导出统计、处理信息（含阶段指标）
+
+    Raises:
+        ValueError: 没有可导出的数据或导出失败
+    """
+    report_progress(job_id, "loading", 0.1)
+    processor = UploadProcessor.from_job_spec(spec)
+    report_progress(job_id, "processing", 0.3)
+    processed_df, analysis = processor.process_data(filter_options)
+    if processed_df.empty:
+        raise ValueError("没有数据可以导出")
+    report_progress(job_id, "exporting", 0.7)
+    if not processor.export_processed_data(output_path, fmt):
+        raise ValueError("数据导出失败")
+    return {
+        'filename': os.path.basename(output_path),
+        'records_count': len(processed_df),
+        'export_stats': processor.export_stats,
+        'processing_info': analysis['processing_info']
+    }
@@ -0,0 +1,152 @@
+"""
+按内容寻址的上传文件存储
+上传流按块写盘并同时计算哈希，文件以内容哈希命名；内容相同的文件只保存一份，
+路径不变，Excel解析缓存和产品目录可以直接复用
+"""
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from datetime import datetime
+from typing import Dict, List, Any, BinaryIO
+
+from frame_cache import frame_cache
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MANIFEST_NAME = "manifest.json"
+
+
+class UploadStore:
+    """
+    上传文件存储
+
+    文件名为 <类型>_<哈希前16位><扩展名>；manifest.json 记录每个文件的原始文件名和上传次数。
+
+    Attributes:
+        root: 存储目录
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.Lock()
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.root, MANIFEST_NAME)
+
+    def _read_manifest(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_manifest(self, manifest: Dict[str, Dict[str, Any]]):
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.manifest_path)
+
+    def save(self, stream: BinaryIO, kind: str, original_name: str) -> Dict[str, Any]:
+        """
+        保存上传流
+
+        Args:
+            stream: 上传文件流
+            kind: 文件类型前缀（product / order）
+            original_name: 原始文件名
+
+        Returns:
+            Dict[str, Any]: path、filename、digest、size、reused（内容已存在时为True）、seconds（写盘耗时）
+        """
+        start = time.perf_counter()
+        os.makedirs(self.root, exist_ok=True)
+        ext = os.path.splitext(original_name)[1].lower() or ".xlsx"
+
+        # 边写边算哈希，写入同目录的临时文件，确认内容后再改名
+        h = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b""):
+                    h.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+            digest = h.hexdigest()
+            filename = f"{kind}_{digest[:16]}{ext}"
+            path = os.path.join(self.root, filename)
+
+            with self._lock:
+                reused = os.path.exists(path) and os.path.getsize(path) == size
+                if reused:
+                    os.remove(tmp_path)
+                else:
+                    os.replace(tmp_path, path)
+                frame_cache.remember_hash(path, digest)
+
+                manifest = self._read_manifest()
+                entry = manifest.setdefault(filename, {
+                    "digest": digest,
+                    "kind": kind,
+                    "size": size,
+                    "original_names": [],
+                    "first_upload": datetime.now().isoformat(),
+                    "uploads": 0
+                })
+                if original_name not in entry["original_names"]:
+                    entry["original_names"].append(original_name)
+                entry["uploads"] += 1
+                entry["last_upload"] = datetime.now().isoformat()
+                self._write_manifest(manifest)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        if reused:
+            print(f"上传文件内容已存在，复用: {filename} ({original_name})")
+        return {
+            "path": path,
+            "filename": filename,
+            "digest": digest,
+            "size": size,
+            "reused": reused,
+            "seconds": round(time.perf_counter() - start, 3)
+        }
+
+    def files(self) -> List[Dict[str, Any]]:
+        """已保存的Excel文件列表（附原始文件名和上传次数）"""
+        manifest = self._read_manifest()
+        files = []
+        if not os.path.exists(self.root):
+            return files
+        for name in os.listdir(self.root):
+            if not name.endswith(('.xlsx', '.xls')):
+                continue
+            path = os.path.join(self.root, name)
+            size = os.path.getsize(path)
+            entry = manifest.get(name, {})
+            files.append({
+                "name": name,
+                "original_names": entry.get("original_names", []),
+                "uploads": entry.get("uploads", 1),
+                "size": size,
+                "size_mb": round(size / 1024 / 1024, 2),
+                "upload_time": datetime.fromtimestamp(os.path.getctime(path)).isoformat()
+            })
+        return files
+
+    def clear(self):
+        """删除所有上传文件和清单"""
+        with self._lock:
+            if not os.path.exists(self.root):
+                return
+            for name in os.listdir(self.root):
+                path = os.path.join(self.root, name)
+                if os.path.isfile(path):
+                    os.remove(path)